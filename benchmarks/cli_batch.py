@@ -0,0 +1,68 @@
+#!/bin/env python
+# Backfill through cli.py: one process per file, loading whisper for every file, against
+# one batch run that loads it once and runs VAD of the next file while the current one is
+# transcribed, then the same batch started again with every output already written.
+# Whisper is a cpu bound stand in that takes --load-seconds to load, so it runs offline.
+#   python benchmarks/cli_batch.py --files 6 --minutes 3 --load-seconds 5
+import argparse, os, subprocess, sys, tempfile, time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+# runs cli.py in this process with the stand in whisper
+def run(load_seconds: str, argv: list) -> None:
+    sys.path.insert(0, ROOT)
+    import cli
+    import services.transcript
+    from fakes import FakeWhisper, seed_vad_model
+    from whisper_pool import WORK
+
+    def load(model_name, device, quantize=False):
+        time.sleep(float(load_seconds))
+        return FakeWhisper(WORK)
+    services.transcript.load_whisper = load
+    seed_vad_model()
+    sys.argv = ["cli.py"] + argv
+    cli.main()
+
+def cli(load_seconds: float, argv: list) -> float:
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, __file__, "--run", str(load_seconds)] + argv, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="cli batch mode benchmark")
+    parser.add_argument("--files", type=int, default=6)
+    parser.add_argument("--minutes", type=float, default=3)
+    parser.add_argument("--load-seconds", type=float, default=5, help="seconds the stand in whisper takes to load")
+    parser.add_argument("--run", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args.run[0], args.run[1:])
+        return
+    from corpus import make_wav
+    workdir = tempfile.mkdtemp(prefix="bench-cli-")
+    inputs = os.path.join(workdir, "audio")
+    os.makedirs(inputs)
+    # the same synthetic audio, silero finds little speech in some of the other seeds
+    files = [make_wav(os.path.join(inputs, f"episode{i:02d}.wav"), seconds=args.minutes * 60) for i in range(args.files)]
+    common = ["-t", "1", "--fr", "en", "--to", "en", "--device", "cpu"]
+
+    single = os.path.join(workdir, "single")
+    os.makedirs(single)
+    per_file = sum(cli(args.load_seconds, common + ["-i", file, "-o", os.path.join(single, os.path.basename(file) + ".srt")]) for file in files)
+    batch = cli(args.load_seconds, common + ["-b", inputs, "--output-dir", os.path.join(workdir, "batch")])
+    resumed = cli(args.load_seconds, common + ["-b", os.path.join(inputs, "*.wav"), "--output-dir", os.path.join(workdir, "batch")])
+    same = all(open(os.path.join(single, os.path.basename(file) + ".srt"), encoding="utf-8").read() ==
+               open(os.path.join(workdir, "batch", os.path.basename(file)[:-4] + ".en.srt"), encoding="utf-8").read() for file in files)
+    audio = args.files * args.minutes * 60
+    print(f"{args.files} files of {args.minutes:g} min, whisper load {args.load_seconds:g}s")
+    print(f"one run per file: {per_file:.1f}s, {audio / per_file:.1f}x realtime")
+    print(f"batch run:        {batch:.1f}s, {audio / batch:.1f}x realtime, identical srt: {same}")
+    print(f"batch restarted:  {resumed:.1f}s with every output done")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/bin/env python
+# Queue operations per second with concurrent writers and claimers on the task database.
+#   python benchmarks/db_queue.py --writers 8 --tasks 2000 --batch 1 20
+import argparse, os, sqlite3, sys, tempfile, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import Logger, DBManager
+
+class ConnectionPerCall:
+    # previous behaviour: a new rollback journal connection for every call
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+
+    def _run(self, query, params=(), many=False):
+        with self.lock:
+            connection = sqlite3.connect(self.db_file, timeout=30)
+            connection.row_factory = sqlite3.Row
+            cursor = connection.cursor()
+            (cursor.executemany if many else cursor.execute)(query, params)
+            rows = cursor.fetchall()
+            connection.commit()
+            connection.close()
+            return rows
+
+    def insert_tasks(self, data):
+        for row in data:
+            self._run("insert into tasks (operation, language, title, file, destinationPath) values (?, ?, ?, ?, ?)", row)
+
+    def claim_tasks(self, operation, limit):
+        tasks = self._run("select id from tasks where process = ? and operation = ? order by id limit ?", (0, operation, limit))
+        for task in tasks:
+            self._run("update tasks set process = ? where id = ?", (1, task['id']))
+        return tasks
+
+    def complete_tasks(self, ids):
+        for taskId in ids:
+            self._run("delete from tasks where id = ?", (taskId,))
+
+def bench(name, db, writers, tasks, batch):
+    per_writer = tasks // writers
+    claimed = []
+    done = threading.Event()
+
+    def write():
+        for i in range(0, per_writer, batch):
+            db.insert_tasks([("translate", "es", f"title {i}", "file.srt", "/dest")] * min(batch, per_writer - i))
+
+    def claim():
+        while not (done.is_set() and len(claimed) >= per_writer * writers):
+            tasks = db.claim_tasks("translate", batch)
+            if len(tasks) == 0:
+                time.sleep(0.001)
+                continue
+            db.complete_tasks([task['id'] for task in tasks])
+            claimed.extend(tasks)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=write) for _ in range(writers)]
+    claimers = [threading.Thread(target=claim) for _ in range(2)]
+    for thread in threads + claimers:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    for thread in claimers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total = per_writer * writers
+    # each task is inserted, claimed and completed
+    print(f"{name:>20} batch {batch:>3}: {total} tasks in {elapsed:.2f}s -> {total * 3 / elapsed:,.0f} queue ops/s, claimed {len(claimed)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="task queue benchmark")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 20])
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="bench-db-")
+    for batch in args.batch:
+        db_file = os.path.join(workdir, f"pool-{batch}.db")
+        bench("pooled wal", DBManager(logger=Logger(), db_file=db_file), args.writers, args.tasks, batch)
+    db_file = os.path.join(workdir, "per-call.db")
+    DBManager(logger=Logger(), db_file=db_file).close_all()
+    connection = sqlite3.connect(db_file)
+    connection.execute("pragma journal_mode=delete")
+    connection.close()
+    bench("connection per call", ConnectionPerCall(db_file), args.writers, args.tasks, 1)
+
+if __name__ == "__main__":
+    main()
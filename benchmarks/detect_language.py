@@ -0,0 +1,74 @@
+#!/bin/env python
+# Language detection latency against audio length: previous full decode with one
+# forward pass per window vs. reading only sampled windows in one batched pass.
+#   python benchmarks/detect_language.py --minutes 1 10 60
+import argparse, os, random, shutil, sys, tempfile, time
+from collections import defaultdict
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import torch
+import whisper
+from services import ModelRegistry, Utils
+from corpus import make_wav
+
+# randomly initialized whisper with "base" sized layers, latency is what matters here
+def tiny_whisper(device: str):
+    torch.manual_seed(0)
+    dims = whisper.model.ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=512, n_audio_head=8, n_audio_layer=6,
+                                         n_vocab=51865, n_text_ctx=448, n_text_state=512, n_text_head=8, n_text_layer=6)
+    return whisper.model.Whisper(dims).to(device).eval()
+
+# whole file decode, through ffmpeg like whisper.load_audio when it's installed
+def load_audio(path: str):
+    if shutil.which("ffmpeg"):
+        return whisper.load_audio(path)
+    import wave
+    import numpy as np
+    with wave.open(path, "rb") as f:
+        return np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+
+# previous implementation: decode the whole file, one spectrogram and forward pass per window
+def detect_previous(model, path: str, device: str, samples_number: int = 5, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    audio = load_audio(path)
+    if len(audio) <= whisper.audio.CHUNK_LENGTH * whisper.audio.SAMPLE_RATE:
+        samples_number = 1
+    probabilities_map = defaultdict(list)
+    for i in range(samples_number):
+        random_center = rng.randint(0, len(audio) - 1)
+        start = max(0, random_center - (whisper.audio.CHUNK_LENGTH // 2) * whisper.audio.SAMPLE_RATE)
+        end = min(len(audio) - 1, random_center + (whisper.audio.CHUNK_LENGTH // 2) * whisper.audio.SAMPLE_RATE)
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio[start:end])).to(device)
+        with torch.no_grad():
+            _, probs = model.detect_language(mel)
+        for lang_key in probs:
+            probabilities_map[lang_key].append(probs[lang_key])
+    return max(probabilities_map, key=lambda k: sum(probabilities_map[k]) / len(probabilities_map[k]))
+
+def main():
+    parser = argparse.ArgumentParser(description="language detection latency benchmark")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    torch.set_grad_enabled(False)
+    model = tiny_whisper(args.device)
+    ModelRegistry().acquire("whisper-base", args.device, "float32", lambda: model)
+    workdir = tempfile.mkdtemp(prefix="bench-detect-")
+    for minutes in args.minutes:
+        path = make_wav(os.path.join(workdir, f"{minutes:g}m.wav"), seconds=minutes * 60)
+        timings = {}
+        for name, run in (("previous", lambda: detect_previous(model, path, args.device, seed=0)),
+                          ("batched", lambda: Utils.detect_language(path, device=args.device, confidence=1.1, seed=0)),
+                          ("early stop", lambda: Utils.detect_language(path, device=args.device, confidence=0.0, seed=0))):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                run()
+            timings[name] = (time.perf_counter() - started) / args.repeat
+        print(f"{minutes:>6g} min: " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/bin/env python
+# Transcription input from a video or audio container, with ffmpeg generated fixtures:
+#   wav     the container converted to a 16 kHz wav before the upload, read from disk
+#   decoded the container uploaded and decoded whole for detection, then again for VAD
+#   stream  the container uploaded and decoded once by a streaming ffmpeg into a ring buffer
+# reporting bytes uploaded, bytes written to disk, wall seconds and peak python memory.
+# Models are the stand ins of benchmarks/fakes.py, so it runs offline. Needs ffmpeg.
+#   python benchmarks/ingest.py --minutes 10
+import argparse, os, shutil, subprocess, sys, tempfile, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import numpy as np
+from services import Logger, Metrics, Transcriptor, Utils
+from services.audio import ArrayAudio, open_audio
+from corpus import make_wav
+from fakes import seed_registry
+
+FIXTURES = {
+    "m4a": ["-c:a", "aac", "-b:a", "64k"],
+    # video with a 48 kHz stereo audio track, like most downloads
+    "mkv": ["-f", "lavfi", "-i", "testsrc=size=320x240:rate=10", "-shortest", "-map", "1:a", "-map", "0:v", "-c:v", "mpeg4", "-q:v", "10",
+            "-c:a", "aac", "-b:a", "96k", "-ac", "2", "-ar", "48000"],
+}
+
+def ffmpeg(*args) -> None:
+    subprocess.run(["ffmpeg", "-y", "-nostdin", "-v", "error"] + list(args), check=True)
+
+def make_fixture(source: str, kind: str, workdir: str) -> str:
+    path = os.path.join(workdir, f"fixture.{kind}")
+    options = FIXTURES[kind]
+    # the lavfi video input goes before the options mapping the streams
+    if options[0] == "-f":
+        ffmpeg(*options[:4], "-i", source, *options[4:], path)
+    else:
+        ffmpeg("-i", source, *options, path)
+    return path
+
+# previous server path for anything but a wav, like whisper.load_audio
+def decode_whole(path: str) -> ArrayAudio:
+    out = subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-vn", "-ac", "1", "-ar", "16000", "-f", "s16le", "-"], capture_output=True, check=True)
+    return ArrayAudio(np.frombuffer(out.stdout, dtype="<i2").astype(np.float32) / 32768.0)
+
+def transcribe(logger, path: str, output: str, audio_for) -> None:
+    audio = audio_for(path)
+    try:
+        Utils.detect_language(path, device="cpu", seed=0, audio=audio)
+        if isinstance(audio, ArrayAudio):
+            # the previous detection closed its decode, VAD decoded again
+            audio.close()
+            audio = audio_for(path)
+        with Transcriptor(logger, None, device="cpu") as transcriptor:
+            transcriptor.transcript_languages("en", path, {"en": (None, output)}, prepared=transcriptor.vad_run(path, audio=audio))
+    finally:
+        audio.close()
+
+def run(logger, mode: str, container: str, workdir: str) -> dict:
+    metrics = Metrics()
+    metrics.reset()
+    output = os.path.join(workdir, f"{mode}-{os.path.basename(container)}.srt")
+    tracemalloc.start()
+    started = time.perf_counter()
+    if mode == "wav":
+        # converted by the client, uploaded and stored by the server
+        path = os.path.join(workdir, "converted.wav")
+        ffmpeg("-i", container, "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", path)
+        uploaded = written = os.path.getsize(path)
+        written += uploaded
+        transcribe(logger, path, output, open_audio)
+    else:
+        uploaded = written = os.path.getsize(container)
+        transcribe(logger, container, output, decode_whole if mode == "decoded" else open_audio)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stages = metrics.snapshot()["stages"]
+    return {"uploaded": uploaded, "written": written, "seconds": elapsed, "peak": peak, "output": output,
+            "ingest": stages.get("ingest", {}).get("seconds", 0.0), "vad": stages.get("vad", {}).get("seconds", 0.0)}
+
+def main():
+    parser = argparse.ArgumentParser(description="container ingest benchmark")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--fixtures", nargs="+", choices=tuple(FIXTURES), default=list(FIXTURES))
+    args = parser.parse_args()
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        sys.exit("ffmpeg and ffprobe are needed to generate the fixtures and decode them")
+    workdir = tempfile.mkdtemp(prefix="bench-ingest-")
+    Metrics().configure(enabled=True)
+    seed_registry()
+    logger = Logger()
+    source = make_wav(os.path.join(workdir, "source.wav"), seconds=args.minutes * 60)
+    print(f"{args.minutes:g} min of audio")
+    print(f"{'input':<8}{'mode':<9}{'uploaded MB':>12}{'written MB':>12}{'seconds':>9}{'ingest s':>10}{'vad s':>8}{'peak MB':>9}  srt")
+    for kind in args.fixtures:
+        container = make_fixture(source, kind, workdir)
+        results = {mode: run(logger, mode, container, workdir) for mode in ("wav", "decoded", "stream")}
+        reference = open(results["wav"]["output"], encoding="utf-8").read()
+        for mode, result in results.items():
+            same = open(result["output"], encoding="utf-8").read() == reference
+            print(f"{kind:<8}{mode:<9}{result['uploaded'] / 2**20:>12.1f}{result['written'] / 2**20:>12.1f}{result['seconds']:>9.2f}"
+                  f"{result['ingest']:>10.2f}{result['vad']:>8.2f}{result['peak'] / 2**20:>9.1f}  {'same' if same else 'differs'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/bin/env python
+# Cost of the instrumentation: a stage timer per call disabled, enabled and inside a task
+# trace, then a batched srt translation in each mode.
+#   python benchmarks/metrics_overhead.py --cues 1500 --calls 200000
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+from services import Logger, Metrics, Translator
+from corpus import make_srt
+import tiny_marian
+
+MODES = (("disabled", False, None), ("enabled", True, None), ("traced", True, "trace"))
+
+def main():
+    parser = argparse.ArgumentParser(description="instrumentation overhead benchmark")
+    parser.add_argument("--cues", type=int, default=1500)
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="bench-metrics-")
+    metrics = Metrics()
+
+    for name, enabled, trace in MODES:
+        metrics.configure(enabled=enabled, trace_dir=os.path.join(workdir, trace) if trace else None)
+        with metrics.trace("calls"):
+            started = time.perf_counter()
+            for _ in range(args.calls):
+                with metrics.timer("bench"):
+                    pass
+            elapsed = time.perf_counter() - started
+        print(f"{name:>9}: {elapsed / args.calls * 1e9:.0f}ns per timed block")
+
+    model = tiny_marian.build(os.path.join(workdir, "tiny-marian"))
+    source = make_srt(os.path.join(workdir, "source.srt"), cues=args.cues)
+    with Translator(logger=Logger(), model_name=model, device="cpu") as translator:
+        # first run loads and warms the model
+        translator.translate_srt_file(srt_file=source, output_file=os.path.join(workdir, "warmup.srt"))
+        for name, enabled, trace in MODES:
+            metrics.configure(enabled=enabled, trace_dir=os.path.join(workdir, trace) if trace else None)
+            with metrics.trace(f"translate-{name}"):
+                started = time.perf_counter()
+                translator.translate_srt_file(srt_file=source, output_file=os.path.join(workdir, f"{name}.srt"))
+                elapsed = time.perf_counter() - started
+            print(f"{name:>9}: {args.cues} cues in {elapsed:.2f}s -> {args.cues / elapsed:.1f} cues/s")
+    metrics.configure(enabled=True)
+    stages = [line for line in metrics.expose().splitlines() if line.startswith("llm_stage_seconds_count")]
+    print("\n".join(stages))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/bin/env python
+# Notification delivery against a local stub of the notification service: the previous
+# fire and forget post against the background notifier, then retries while the service
+# is failing and delivery of events left queued by a stopped notifier.
+#   python benchmarks/notifier.py --events 500 --senders 8 --latency 0.02
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import requests
+from services import Logger, DBManager, Notifier
+from fakes import Stub, payload, send_all
+
+def main():
+    parser = argparse.ArgumentParser(description="notification delivery benchmark")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub takes per post")
+    parser.add_argument("--batch", type=int, default=20)
+    args = parser.parse_args()
+    logger = Logger()
+    stub = Stub(args.latency)
+    workdir = tempfile.mkdtemp()
+
+    def previous(body):
+        # behaviour before the notifier
+        try:
+            requests.post(stub.url, json=body, timeout=0.001)
+        except requests.exceptions.RequestException:
+            pass
+    slowest = send_all(previous, args.events, args.senders)
+    stub.wait_for(args.events, timeout=2)
+    print(f"fire and forget: {len(stub.events)}/{args.events} delivered, {stub.posts} posts, {len(stub.connections)} connections, slowest send {slowest:.1f}ms")
+
+    db = DBManager(logger=logger, db_file=os.path.join(workdir, "tasks.db"))
+    for batch in sorted({1, args.batch}):
+        stub.reset()
+        notifier = Notifier(logger, db, stub.url, batch_size=batch).start()
+        slowest = send_all(notifier.send, args.events, args.senders)
+        seconds = stub.wait_for(args.events, timeout=120)
+        notifier.stop()
+        print(f"notifier batch {batch}: {len(stub.events)}/{args.events} delivered in {seconds:.2f}s, {stub.posts} posts, "
+              f"{len(stub.connections)} connections, slowest send {slowest:.1f}ms")
+
+    # service down for a while: events are retried with backoff until it is back
+    stub.reset()
+    stub.failing = True
+    notifier = Notifier(logger, db, stub.url, batch_size=args.batch, backoff=0.2).start()
+    send_all(notifier.send, 50, args.senders)
+    time.sleep(1.5)
+    stub.failing = False
+    seconds = stub.wait_for(50, timeout=60)
+    print(f"service failing 1.5s: {len(stub.events)}/50 delivered {seconds:.2f}s after recovery, {notifier.stats()}")
+    notifier.stop()
+
+    # stopped before delivering: a new notifier, like after a restart, sends what was queued
+    stub.reset()
+    stub.failing = True
+    notifier = Notifier(logger, db, stub.url, batch_size=args.batch, backoff=60).start()
+    send_all(notifier.send, 50, args.senders)
+    time.sleep(0.5)
+    notifier.stop()
+    stub.failing = False
+    notifier = Notifier(logger, db, stub.url, batch_size=args.batch).start()
+    # queued events keep the backoff of their failed attempt
+    db.execute_query("update notifications set next_attempt_at = 0")
+    notifier.send(payload(-1))
+    seconds = stub.wait_for(51, timeout=60)
+    notifier.stop()
+    print(f"restart: {len(stub.events)}/51 delivered in {seconds:.2f}s, queued left {len(db.due_notifications(time.time() + 3600, 1000))}")
+    stub.server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/bin/env python
+# CPU benchmark: onnx runtime translation backend against transformers generate.
+# Fails with exit code 1 when the translations differ.
+#   python benchmarks/onnx_backend.py --cues 500 --beams 1 4
+#   python benchmarks/onnx_backend.py --model Helsinki-NLP/opus-mt-en-es --cues 1500
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import srt
+from services import Logger, Translator, configure_threads
+from corpus import make_srt
+import tiny_marian
+
+def main():
+    parser = argparse.ArgumentParser(description="onnx translation backend benchmark")
+    parser.add_argument("--model", help="opus-mt model name, defaults to tiny local models", default="")
+    parser.add_argument("--cues", type=int, default=500)
+    parser.add_argument("--beams", type=int, nargs="+", default=[1, 4], help="beam sizes of the tiny models")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+    print(f"torch threads: {configure_threads(intra_op=args.threads)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-onnx-")
+    source = make_srt(os.path.join(workdir, "source.srt"), cues=args.cues)
+    with open(source, encoding="utf-8") as f:
+        texts = [s.content for s in srt.parse(f.read())]
+    if args.model:
+        models = [args.model]
+    else:
+        models = [tiny_marian.build(os.path.join(workdir, f"tiny-marian-beam{beams}"), num_beams=beams) for beams in args.beams]
+
+    identical = True
+    for model in models:
+        results = {}
+        for backend in ("transformers", "onnx"):
+            options = {"cache_dir": os.path.join(workdir, "onnx")} if backend == "onnx" else {}
+            started = time.perf_counter()
+            with Translator(logger=Logger(), model_name=model, device="cpu", backend=backend, backend_options=options) as translator:
+                loaded = time.perf_counter()
+                results[backend] = translator.translate_batch(texts)
+                elapsed = time.perf_counter() - loaded
+            print(f"{os.path.basename(model)} {backend:>12}: load {loaded - started:.2f}s, {args.cues} cues in {elapsed:.2f}s -> {args.cues / elapsed:.1f} cues/s")
+        same = sum(a == b for a, b in zip(results["transformers"], results["onnx"]))
+        identical = identical and same == len(texts)
+        print(f"{os.path.basename(model)} identical translations: {same}/{len(texts)}")
+    sys.exit(0 if identical else 1)
+
+if __name__ == "__main__":
+    main()
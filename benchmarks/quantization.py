@@ -0,0 +1,65 @@
+#!/bin/env python
+# CPU benchmark: fp32 against int8 dynamic quantization on the same srt corpus.
+#   python benchmarks/quantization.py --cues 500
+#   python benchmarks/quantization.py --model Helsinki-NLP/opus-mt-en-es --cues 1500 --threads 4
+import argparse, os, sys, tempfile, time
+from collections import Counter
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import srt
+from services import Logger, Translator, configure_threads
+from corpus import make_srt
+import tiny_marian
+
+# character n-gram F-score (chrF, beta 2) of a hypothesis against a reference
+def chrf(hypothesis: str, reference: str, order: int = 6, beta: float = 2.0) -> float:
+    scores = []
+    for n in range(1, order + 1):
+        hyp = Counter(hypothesis[i:i + n] for i in range(len(hypothesis) - n + 1))
+        ref = Counter(reference[i:i + n] for i in range(len(reference) - n + 1))
+        if not hyp or not ref:
+            continue
+        match = sum((hyp & ref).values())
+        precision, recall = match / sum(hyp.values()), match / sum(ref.values())
+        if precision + recall == 0:
+            scores.append(0.0)
+            continue
+        scores.append((1 + beta ** 2) * precision * recall / (beta ** 2 * precision + recall))
+    return sum(scores) / len(scores) if scores else float(hypothesis == reference)
+
+def read_contents(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [s.content for s in srt.parse(f.read())]
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 dynamic quantization benchmark")
+    parser.add_argument("--model", help="opus-mt model name, defaults to a tiny local model", default="")
+    parser.add_argument("--cues", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+    print(f"torch threads: {configure_threads(intra_op=args.threads)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-quantization-")
+    model = args.model or tiny_marian.build(os.path.join(workdir, "tiny-marian"))
+    source = make_srt(os.path.join(workdir, "source.srt"), cues=args.cues)
+
+    results = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        output = os.path.join(workdir, f"{name}.srt")
+        with Translator(logger=Logger(), model_name=model, device="cpu", quantize=quantize) as translator:
+            started = time.perf_counter()
+            translator.translate_srt_file(srt_file=source, output_file=output)
+            elapsed = time.perf_counter() - started
+        results[name] = read_contents(output)
+        print(f"{name:>5}: {args.cues} cues in {elapsed:.2f}s -> {args.cues / elapsed:.1f} cues/s")
+
+    reference, quantized = results["fp32"], results["int8"]
+    exact = sum(a == b for a, b in zip(reference, quantized))
+    score = sum(chrf(b, a) for a, b in zip(reference, quantized)) / max(1, len(reference))
+    print(f"identical translations: {exact}/{len(reference)}")
+    print(f"chrF int8 against fp32: {score * 100:.1f}")
+
+if __name__ == "__main__":
+    main()
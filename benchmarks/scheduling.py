@@ -0,0 +1,91 @@
+#!/bin/env python
+# Queue latency of a replayed mixed trace, short srt translations among feature length
+# transcriptions, in a discrete event simulation of the workers: a single fifo queue for
+# every task, a fifo queue per task type, and per task type queues admitting tasks in the
+# scheduling policy's order. Reports p50/p95/max seconds from submission to start.
+#   python benchmarks/scheduling.py --tasks 2000 --workers 1 --load 0.8
+import argparse, heapq, os, random, sys
+from statistics import quantiles
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.policy import DEFAULT_UNIT_SECONDS, SchedulingPolicy
+
+# a translation has 50 to 1500 cues, a transcription is an episode (5 to 45 minutes of
+# audio) or a feature (80 to 150 minutes) as often
+def make_trace(tasks: int, workers: int, load: float, transcript_share: float, seed: int) -> list:
+    rng = random.Random(seed)
+    # arrival rate keeping the transcription workers busy load of the time
+    mean_transcript = (300 + 2700 + 4800 + 9000) / 4 * DEFAULT_UNIT_SECONDS["transcript"]
+    rate = load * workers / (transcript_share * mean_transcript)
+    now, trace = 0.0, []
+    for id in range(1, tasks + 1):
+        now += rng.expovariate(rate)
+        if rng.random() < transcript_share:
+            operation, size = "transcript", rng.uniform(300, 2700) if rng.random() < 0.5 else rng.uniform(4800, 9000)
+        else:
+            operation, size = "translate", float(rng.randint(50, 1500))
+        # the estimate is off by up to 30% either way
+        seconds = size * DEFAULT_UNIT_SECONDS[operation] * rng.uniform(0.7, 1.3)
+        trace.append({"id": id, "operation": operation, "size": size, "priority": 0, "created_at": now, "seconds": seconds})
+    return trace
+
+# returns the start time of every task
+def simulate(trace: list, pools: dict, pool_of, pick) -> dict:
+    tasks = {task["id"]: task for task in trace}
+    # completions sort before arrivals at the same instant, freeing the worker first
+    events = [(task["created_at"], 1, task["id"]) for task in trace]
+    heapq.heapify(events)
+    queues = {pool: [] for pool in pools}
+    free = dict(pools)
+    started = {}
+    while events:
+        now, kind, id = heapq.heappop(events)
+        pool = pool_of(tasks[id])
+        if kind == 1:
+            queues[pool].append(tasks[id])
+        else:
+            free[pool] += 1
+        while free[pool] > 0 and queues[pool]:
+            task = pick(queues[pool], now)
+            queues[pool].remove(task)
+            free[pool] -= 1
+            started[task["id"]] = now
+            heapq.heappush(events, (now + task["seconds"], 0, task["id"]))
+    return started
+
+def fifo(queue: list, now: float) -> dict:
+    return queue[0]
+
+def group(task: dict) -> str:
+    if task["operation"] == "translate":
+        return "translate"
+    return "transcript episode" if task["size"] < 3600 else "transcript feature"
+
+def report(name: str, trace: list, started: dict) -> None:
+    print(name)
+    for label in ("translate", "transcript episode", "transcript feature"):
+        waits = sorted(started[task["id"]] - task["created_at"] for task in trace if group(task) == label)
+        if len(waits) < 2:
+            continue
+        cuts = quantiles(waits, n=100, method="inclusive")
+        print(f"  {label:<20} {len(waits):>4} tasks  p50 {cuts[49]:>8.0f}s  p95 {cuts[94]:>8.0f}s  max {waits[-1]:>8.0f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="scheduling policy simulation")
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=1, help="workers per task type")
+    parser.add_argument("--load", type=float, default=0.8, help="share of time the transcription workers are busy")
+    parser.add_argument("--transcripts", type=float, default=0.15, help="share of transcriptions in the trace")
+    parser.add_argument("--aging", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    trace = make_trace(args.tasks, args.workers, args.load, args.transcripts, args.seed)
+    policy = SchedulingPolicy(aging=args.aging)
+
+    # every task type sharing the same workers, in arrival order
+    report("single fifo queue", trace, simulate(trace, {"all": args.workers}, lambda task: "all", fifo))
+    lanes = {"transcript": args.workers, "translate": args.workers}
+    report("fifo per task type", trace, simulate(trace, lanes, lambda task: task["operation"], fifo))
+    report(f"policy per task type (aging {args.aging})", trace, simulate(trace, lanes, lambda task: task["operation"], policy.pick))
+
+if __name__ == "__main__":
+    main()
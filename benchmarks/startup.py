@@ -0,0 +1,99 @@
+#!/bin/env python
+# Service startup: import time of the api module with lazy inference imports against
+# importing them up front, seconds until the server listens and until /ready, and time
+# to the first translated file with and without the model in the preload manifest.
+#   python benchmarks/startup.py --cues 200
+import argparse, json, os, socket, subprocess, sys, tempfile, time, urllib.error, urllib.request
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+# runs in a fresh process and a scratch directory, so nothing is imported or cached yet
+def run(mode: str, model: str, source: str) -> None:
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    if mode == "eager":
+        # what the api imported before inference modules were lazy
+        import services.translate, services.transcript, services.utils, services.runtime, services.workers
+    import main
+    imported = time.perf_counter() - started
+    result = {"import": imported}
+    if mode in ("cold", "preloaded"):
+        from services import Logger, Preloader, Translator
+        logger = Logger()
+        if mode == "preloaded":
+            # the part startup() runs in the background before the first task arrives
+            started = time.perf_counter()
+            Preloader(logger, [f"opus-mt:{model}"]).run("cpu")
+            result["preload"] = time.perf_counter() - started
+        started = time.perf_counter()
+        with Translator(logger, model, "cpu") as translator:
+            translator.translate_srt_file(srt_file=source, output_file=source + ".out.srt")
+        result["first_result"] = time.perf_counter() - started
+    print(json.dumps(result))
+
+def subprocess_run(mode: str, model: str, source: str) -> dict:
+    out = subprocess.run([sys.executable, __file__, "--run", mode, model, source], capture_output=True, text=True, cwd=tempfile.mkdtemp())
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# seconds until the server answers /ready at all, and until it answers ready
+def serve(model: str) -> tuple:
+    port = free_port()
+    env = dict(os.environ, LLM_HOST="127.0.0.1", LLM_PORT=str(port), LLM_DEVICE="cpu", LLM_PRELOAD=f"opus-mt:{model}", LLM_NOTIFICATION_SERVICE_URL="http://127.0.0.1:9/")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], env=env, cwd=tempfile.mkdtemp(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening, status = None, None
+    try:
+        while time.perf_counter() - started < 300:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+                    status = json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                status = json.loads(e.read())
+            except OSError:
+                time.sleep(0.02)
+                continue
+            if listening is None:
+                listening = time.perf_counter() - started
+            if status["ready"]:
+                return listening, time.perf_counter() - started, status
+            time.sleep(0.05)
+        return listening, None, status
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="service startup benchmark")
+    parser.add_argument("--cues", type=int, default=200)
+    parser.add_argument("--model", default=None, help="opus-mt model, defaults to a tiny local one")
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(*args.run)
+        return
+    import tiny_marian
+    from corpus import make_srt
+    workdir = tempfile.mkdtemp()
+    model = args.model or tiny_marian.build(os.path.join(workdir, "tiny-marian"))
+    source = make_srt(os.path.join(workdir, "source.srt"), cues=args.cues)
+
+    lazy = subprocess_run("lazy", model, source)
+    eager = subprocess_run("eager", model, source)
+    print(f"import main: {lazy['import']:.2f}s lazy, {eager['import']:.2f}s with inference modules imported up front")
+    listening, ready, status = serve(model)
+    print(f"server listening after {listening:.2f}s, ready after {ready:.2f}s" if ready is not None else f"server listening after {listening:.2f}s, not ready: {status}")
+    cold = subprocess_run("cold", model, source)
+    preloaded = subprocess_run("preloaded", model, source)
+    print(f"first result ({args.cues} cues): {cold['first_result']:.2f}s cold, {preloaded['first_result']:.2f}s preloaded (preload took {preloaded['preload']:.2f}s in the background)")
+
+if __name__ == "__main__":
+    main()
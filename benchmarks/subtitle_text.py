@@ -0,0 +1,110 @@
+#!/bin/env python
+# Subtitle text micro benchmarks on a large synthetic srt: the previous BeautifulSoup clean_text,
+# word by word split_lines and whole file read_file against services/subtitles.py, with the
+# share of cues where both give the same result. The BeautifulSoup comparison needs bs4, which the
+# server no longer depends on (pip install beautifulsoup4), it is skipped without it.
+#   python benchmarks/subtitle_text.py --cues 100000
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import srt
+from services import Utils
+from services.subtitles import clean_text, parse_srt, strip_markup, wrap_text
+from corpus import make_srt
+
+# previous implementations
+def clean_previous(text: str) -> str:
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(text, "html.parser").get_text()
+
+def split_previous(text: str, max_length: int = 80) -> list:
+    words = text.split()
+    lines = []
+    current_line = ""
+    for word in words:
+        if len(current_line) + len(word) + 1 <= max_length:
+            current_line += (word + " ")
+        else:
+            lines.append(current_line.strip())
+            current_line = word + " "
+    lines.append(current_line.strip())
+    return lines
+
+def read_previous(file_path: str) -> str:
+    lines = ''
+    with open(file_path, "r") as f:
+        content = f.read()
+    subs = list(srt.parse(content))
+    for i, sub in enumerate(subs):
+        if i >= 50:
+            break
+        lines += sub.content
+    return lines
+
+def parse_previous(file_path: str) -> list:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return list(srt.parse(f.read()))
+
+def parse_current(file_path: str) -> list:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return list(parse_srt(f))
+
+def timed(fn, items, repeat: int):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [fn(item) for item in items]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+def report(name: str, unit: str, count: int, previous: float, current: float, same: int) -> None:
+    print(f"{name:<12}{count / previous:>14,.0f}{count / current:>14,.0f} {unit:<8}{previous / current:>8.1f}x  same {same}/{count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="subtitle text micro benchmarks")
+    parser.add_argument("--cues", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="bench-subtitles-")
+    path = make_srt(os.path.join(workdir, "large.srt"), cues=args.cues)
+    with open(path, encoding="utf-8") as f:
+        texts = [subtitle.content for subtitle in srt.parse(f.read())]
+    # markup seen in real files on top of the corpus italics
+    texts += [f"{{\\an8}}<font color=\"#ffff00\">{text}</font>" for text in texts[:len(texts) // 20]]
+    texts += [f"<b>{text}</b> &amp; <i>more</i>" for text in texts[:len(texts) // 20]]
+    print(f"{args.cues} cues, {os.path.getsize(path) / 2**20:.1f}MB")
+    print(f"{'':<12}{'previous':>14}{'current':>14}")
+
+    current, results = timed(clean_text, texts, args.repeat)
+    try:
+        import bs4
+    except ImportError:
+        print(f"{'clean_text':<12}{'-':>14}{len(texts) / current:>14,.0f} texts/s   previous skipped, bs4 is not installed")
+    else:
+        previous, expected = timed(clean_previous, texts, 1)
+        # override tags like {\an8} are now removed too
+        same = sum(a == b or a.replace("{\\an8}", "") == b for a, b in zip(expected, results))
+        report("clean_text", "texts/s", len(texts), previous, current, same)
+        current, _ = timed(strip_markup, texts, args.repeat)
+        report("strip_markup", "texts/s", len(texts), previous, current, len(texts))
+
+    previous, expected = timed(lambda text: split_previous(text, 42), results, args.repeat)
+    current, wrapped = timed(lambda text: wrap_text(text, 42), results, args.repeat)
+    # the previous version started with an empty line when the first word was longer than a line
+    same = sum(a == b or a[1:] == b for a, b in zip(expected, wrapped))
+    report("split_lines", "texts/s", len(results), previous, current, same)
+
+    calls = 20
+    previous, expected = timed(read_previous, [path] * calls, 1)
+    current, results = timed(Utils.read_file, [path] * calls, args.repeat)
+    report("read_file", "calls/s", calls, previous, current, sum(a == b for a, b in zip(expected, results)))
+
+    previous, (expected,) = timed(parse_previous, [path], args.repeat)
+    current, (results,) = timed(parse_current, [path], args.repeat)
+    report("parse", "cues/s", len(expected), previous, current, sum(a == b for a, b in zip(expected, results)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/bin/env python
+# Offline end to end benchmark suite: every scenario runs in a fresh process with stand in
+# models seeded into the registry (benchmarks/fakes.py) on synthetic wav and srt corpora,
+# and reports throughput, latency, peak memory and the seconds spent per stage as recorded
+# by the service metrics. Results are written as json so runs can be compared.
+#   python benchmarks/suite.py --output results.json
+#   python benchmarks/suite.py --scenarios translate api --compare results.json
+import argparse, io, json, os, platform, resource, subprocess, sys, tempfile, threading, time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+SCENARIOS = ("vad", "detect", "translate", "transcribe", "api")
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+# runs in a fresh process, so peak memory only reflects the scenario
+def run(scenario: str, config: dict) -> dict:
+    from services import Logger, Metrics
+    from fakes import seed_registry
+    metrics = Metrics()
+    metrics.configure(enabled=True)
+    seed_registry(translators={"en-es": config["model"]}, vad=config["vad"], whisper_work=config["whisper_work"],
+                  detect_latency=config["detect_latency"])
+    logger = Logger()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics.reset()
+    started = time.perf_counter()
+    result = SCENARIO_RUNS[scenario](logger, config)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = round(peak / 1024, 1)
+    result["peak_over_baseline_mb"] = round((peak - baseline) / 1024, 1)
+    snapshot = metrics.snapshot()
+    result["stages"] = {stage: {"count": values["count"], "seconds": round(values["seconds"], 4)} for stage, values in sorted(snapshot["stages"].items())}
+    result["counters"] = {name: round(value, 3) for name, value in sorted(snapshot["counters"].items())}
+    return result
+
+def run_vad(logger, config: dict) -> dict:
+    from services.audio import WavReader
+    from services.vad import StreamingVAD
+    audio = WavReader(config["wav"])
+    started = time.perf_counter()
+    groups = sum(1 for _ in StreamingVAD(logger).groups(audio))
+    elapsed = time.perf_counter() - started
+    duration = audio.duration
+    audio.close()
+    return {"throughput": round(duration / elapsed, 1), "unit": "audio s/s", "groups": groups}
+
+def run_detect(logger, config: dict) -> dict:
+    from services import Utils
+    latencies = []
+    for seed in range(config["repeat"]):
+        started = time.perf_counter()
+        Utils.detect_language(config["wav"], device="cpu", seed=seed)
+        latencies.append(time.perf_counter() - started)
+    return {"throughput": round(len(latencies) / sum(latencies), 2), "unit": "files/s",
+            "latency_p50": round(percentile(latencies, 0.5), 4), "latency_p95": round(percentile(latencies, 0.95), 4)}
+
+def run_translate(logger, config: dict) -> dict:
+    from services import Translator
+    with Translator(logger, "Helsinki-NLP/opus-mt-en-es", "cpu") as translator:
+        started = time.perf_counter()
+        translator.translate_srt_file(config["srt"], os.path.join(config["scratch"], "translate.es.srt"))
+        elapsed = time.perf_counter() - started
+    return {"throughput": round(config["cues"] / elapsed, 1), "unit": "cues/s"}
+
+def run_transcribe(logger, config: dict) -> dict:
+    from services import Transcriptor, Translator
+    from services.audio import WavReader
+    reader = WavReader(config["wav"])
+    duration = reader.duration
+    reader.close()
+    with Translator(logger, "Helsinki-NLP/opus-mt-en-es", "cpu") as translator, Transcriptor(logger, translator, device="cpu") as transcriptor:
+        targets = {"es": (translator, os.path.join(config["scratch"], "transcribe.es.srt")),
+                   "en": (None, os.path.join(config["scratch"], "transcribe.en.srt"))}
+        started = time.perf_counter()
+        transcriptor.transcript_languages("en", config["wav"], targets)
+        elapsed = time.perf_counter() - started
+    return {"throughput": round(duration / elapsed, 1), "unit": "audio s/s"}
+
+# tasks submitted through the flask endpoints and run by the scheduler, latency from
+# submission until /tasks reports them done
+def run_api(logger, config: dict) -> dict:
+    import main
+    main.startup()
+    client = main.app.test_client()
+    submitted, requests = {}, []
+    first = time.perf_counter()
+    uploads = [("/send_translate", config["srt"], "translate")] * config["api_translations"] + [("/send_transcript", config["wav"], "transcript")] * config["api_transcripts"]
+    for i, (endpoint, path, operation) in enumerate(uploads):
+        with open(path, "rb") as f:
+            # a trailing line keeps the srt uploads from being served as cached results of each other
+            content = f.read() + (f"\n{i}".encode() if operation == "translate" else b"")
+        started = time.perf_counter()
+        response = client.post(endpoint, data={"lang": "es", "title": f"title {i}", "destinationPath": "/library",
+                                               "file": (io.BytesIO(content), f"upload{i}{os.path.splitext(path)[1]}")})
+        requests.append(time.perf_counter() - started)
+        submitted[response.json["task_id"]] = (operation, time.perf_counter())
+    latencies = {"translate": [], "transcript": []}
+    failed = 0
+    lock = threading.Lock()
+
+    def wait(task_id):
+        nonlocal failed
+        operation, since = submitted[task_id]
+        while True:
+            status = client.get(f"/tasks/{task_id}?wait=60").json
+            if status["status"] in ("done", "failed"):
+                break
+        with lock:
+            latencies[operation].append(time.perf_counter() - since)
+            failed += status["status"] == "failed"
+    threads = [threading.Thread(target=wait, args=(task_id,)) for task_id in submitted]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - first
+    main.scheduler.stop()
+    result = {"throughput": round(len(submitted) / elapsed, 2), "unit": "tasks/s", "failed": failed,
+              "request_p50": round(percentile(requests, 0.5), 4)}
+    for operation, values in latencies.items():
+        if values:
+            result[f"{operation}_latency_p50"] = round(percentile(values, 0.5), 3)
+            result[f"{operation}_latency_p95"] = round(percentile(values, 0.95), 3)
+    return result
+
+SCENARIO_RUNS = {"vad": run_vad, "detect": run_detect, "translate": run_translate, "transcribe": run_transcribe, "api": run_api}
+
+def child(scenario: str, config: dict) -> dict:
+    scratch = tempfile.mkdtemp(prefix=f"{scenario}-", dir=config["workdir"])
+    config = dict(config, scratch=scratch)
+    env = dict(os.environ, LLM_DEVICE="cpu", LLM_SCHEDULER_POLL_SECONDS="0.2", LLM_NOTIFICATION_SERVICE_URL="http://127.0.0.1:9/",
+               LLM_TRANSLATE_WORKERS="1", LLM_TRANSCRIPT_WORKERS="1", LLM_PRELOAD="")
+    # main.py keeps its media folder and task database under the working directory
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", scenario, json.dumps(config)], capture_output=True, text=True, cwd=scratch, env=env)
+    if out.returncode != 0:
+        return {"error": out.stderr[-2000:]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def metadata(args) -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        revision = None
+    import torch
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": revision, "python": platform.python_version(),
+            "torch": torch.__version__, "machine": platform.machine(), "cpus": os.cpu_count(), "args": vars(args)}
+
+def compare(previous: dict, current: dict) -> None:
+    print(f"\n{'scenario':<12}{'metric':<26}{'before':>12}{'after':>12}{'change':>9}")
+    for scenario, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(scenario)
+        if before is None or "error" in before or "error" in result:
+            continue
+        rows = [("throughput " + result["unit"], before["throughput"], result["throughput"]), ("seconds", before["seconds"], result["seconds"]),
+                ("peak_rss_mb", before["peak_rss_mb"], result["peak_rss_mb"])]
+        rows += [(f"stage {stage} s", before["stages"][stage]["seconds"], values["seconds"]) for stage, values in result["stages"].items() if stage in before["stages"]]
+        for metric, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            print(f"{scenario:<12}{metric:<26}{old:>12.3f}{new:>12.3f}{change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="offline end to end benchmark suite")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--minutes", type=float, default=5, help="length of the synthetic audio")
+    parser.add_argument("--cues", type=int, default=1000, help="cues of the synthetic srt")
+    parser.add_argument("--vad", choices=("energy", "silero"), default="energy", help="silero needs the silero-vad package")
+    parser.add_argument("--whisper-work", type=int, default=256, help="matrix size of the stand in whisper, sets its cpu cost per audio second")
+    parser.add_argument("--detect-latency", type=float, default=0.05, help="seconds the stand in detection takes per batch")
+    parser.add_argument("--repeat", type=int, default=5, help="language detections timed")
+    parser.add_argument("--api-translations", type=int, default=6)
+    parser.add_argument("--api-transcripts", type=int, default=2)
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--compare", help="json results of a previous run")
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run(args.run[0], json.loads(args.run[1]))))
+        return
+
+    import tiny_marian
+    from corpus import make_srt, make_wav
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    config = {"workdir": workdir, "model": tiny_marian.build(os.path.join(workdir, "tiny-marian")),
+              "srt": make_srt(os.path.join(workdir, "source.srt"), cues=args.cues), "cues": args.cues,
+              "wav": make_wav(os.path.join(workdir, "source.wav"), seconds=args.minutes * 60),
+              "vad": args.vad, "whisper_work": args.whisper_work, "detect_latency": args.detect_latency, "repeat": args.repeat,
+              "api_translations": args.api_translations, "api_transcripts": args.api_transcripts}
+    results = {"meta": metadata(args), "scenarios": {}}
+    for scenario in args.scenarios:
+        result = child(scenario, config)
+        results["scenarios"][scenario] = result
+        if "error" in result:
+            print(f"{scenario:<12} failed: {result['error']}")
+            continue
+        stages = ", ".join(f"{stage} {values['seconds']:.2f}s" for stage, values in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"])[:5])
+        print(f"{scenario:<12} {result['throughput']:>9} {result['unit']:<10} {result['seconds']:>7.2f}s  peak {result['peak_rss_mb']:.0f}MB  {stages}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
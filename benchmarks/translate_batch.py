@@ -0,0 +1,53 @@
+#!/bin/env python
+# CPU benchmark: batched srt translation against the per line path.
+#   python benchmarks/translate_batch.py --cues 500
+#   python benchmarks/translate_batch.py --model Helsinki-NLP/opus-mt-en-es --cues 1500
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import srt
+import torch
+from services import Logger, Translator
+from corpus import make_srt
+import tiny_marian
+
+def main():
+    parser = argparse.ArgumentParser(description="batched srt translation benchmark")
+    parser.add_argument("--model", help="opus-mt model name, defaults to a tiny local model", default="")
+    parser.add_argument("--cues", type=int, default=500)
+    parser.add_argument("--max-batch-tokens", type=int, default=4096)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    workdir = tempfile.mkdtemp(prefix="bench-translate-")
+    model = args.model or tiny_marian.build(os.path.join(workdir, "tiny-marian"))
+    source = make_srt(os.path.join(workdir, "source.srt"), cues=args.cues)
+    translator = Translator(logger=Logger(), model_name=model, device="cpu", max_batch_tokens=args.max_batch_tokens)
+
+    results = {}
+    for name, batched in (("per-line", False), ("batched", True)):
+        output = os.path.join(workdir, f"{name}.srt")
+        started = time.perf_counter()
+        translator.translate_srt_file(srt_file=source, output_file=output, batched=batched)
+        elapsed = time.perf_counter() - started
+        results[name] = output
+        print(f"{name:>9}: {args.cues} cues in {elapsed:.2f}s -> {args.cues / elapsed:.1f} cues/s")
+
+    with open(source, encoding="utf-8") as f:
+        expected = [(s.index, s.start, s.end) for s in srt.parse(f.read())]
+    with open(results["batched"], encoding="utf-8") as f:
+        got = [(s.index, s.start, s.end) for s in srt.parse(f.read())]
+    with open(results["per-line"], encoding="utf-8") as f:
+        reference = [s.content for s in srt.parse(f.read())]
+    with open(results["batched"], encoding="utf-8") as f:
+        batched = [s.content for s in srt.parse(f.read())]
+    print(f"timing preserved: {expected == got}")
+    print(f"identical translations: {sum(a == b for a, b in zip(reference, batched))}/{len(reference)}")
+    translator.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/bin/env python
+# Peak RSS of streaming VAD over memory mapped wavs against loading the whole file.
+#   python benchmarks/vad_memory.py --minutes 10 60 180
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+# runs in a fresh process so ru_maxrss only reflects one mode
+def run(mode: str, path: str) -> None:
+    from services import Logger
+    from fakes import seed_vad_model
+    from services.audio import WavReader, ArrayAudio
+    from services.vad import StreamingVAD
+    seed_vad_model()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    reader = WavReader(path)
+    if mode == "full":
+        # previous behaviour: the whole file decoded to a float tensor
+        audio = ArrayAudio(reader.read(0, reader.num_samples))
+    else:
+        audio = reader
+    started = time.perf_counter()
+    groups = 0
+    for group in StreamingVAD(Logger()).groups(audio):
+        groups += 1
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "groups": groups, "seconds": round(elapsed, 2),
+                      "peak_rss_mb": round(peak / 1024, 1), "peak_over_baseline_mb": round((peak - baseline) / 1024, 1)}))
+
+def main():
+    parser = argparse.ArgumentParser(description="streaming VAD memory benchmark")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60])
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(*args.run)
+        return
+    from corpus import make_wav
+    workdir = tempfile.mkdtemp(prefix="bench-vad-")
+    for minutes in args.minutes:
+        path = make_wav(os.path.join(workdir, f"{minutes:g}m.wav"), seconds=minutes * 60)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        for mode in ("full", "streaming"):
+            out = subprocess.run([sys.executable, __file__, "--run", mode, path], capture_output=True, text=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1]) if out.returncode == 0 else {"error": out.stderr[-500:]}
+            print(f"{minutes:>6g} min ({size_mb:.0f}MB wav) {mode:>9}: {result}")
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/bin/env python
+# Sharded transcription: chunks decoded by a pool of worker processes against the
+# in process model, with a cpu bound stand in for whisper so it runs offline.
+#   python benchmarks/whisper_pool.py --minutes 10 --workers 1 2 4
+#   python benchmarks/whisper_pool.py --minutes 10 --layout "cpu:0-7;cpu:8-15"
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# stand in models and fixtures shared with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+from services import Logger, Transcriptor, ModelRegistry
+from services.workers import WhisperPool, plan_workers
+from corpus import make_wav
+from fakes import FakeWhisper, seed_vad_model
+
+WORK = 256
+
+def fake_loader(model_name: str, device: str, quantize: bool = False):
+    return FakeWhisper(WORK)
+
+def main():
+    parser = argparse.ArgumentParser(description="whisper worker pool benchmark")
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--layout", default="", help="explicit worker layout, overrides --workers")
+    args = parser.parse_args()
+
+    logger = Logger()
+    seed_vad_model()
+    workdir = tempfile.mkdtemp(prefix="bench-pool-")
+    audio = make_wav(os.path.join(workdir, "audio.wav"), seconds=args.minutes * 60)
+    ModelRegistry().acquire("whisper-large", "cpu", "float32", lambda: FakeWhisper(WORK))
+
+    outputs = {}
+    with Transcriptor(logger=logger, translator=None, device="cpu") as transcriptor:
+        output = os.path.join(workdir, "serial.srt")
+        started = time.perf_counter()
+        transcriptor.transcript_languages("en", audio, {"en": (None, output)})
+        outputs["in process"] = (time.perf_counter() - started, output)
+
+    layouts = [plan_workers(0, "cpu", args.layout)] if args.layout else [plan_workers(n, "cpu") for n in args.workers]
+    for specs in layouts:
+        name = f"{len(specs)} workers"
+        with WhisperPool(logger, specs, loader=fake_loader) as pool:
+            pool.wait_ready()
+            with Transcriptor(logger=logger, translator=None, device="cpu", pool=pool) as transcriptor:
+                output = os.path.join(workdir, f"pool-{len(specs)}.srt")
+                started = time.perf_counter()
+                transcriptor.transcript_languages("en", audio, {"en": (None, output)})
+                outputs[name] = (time.perf_counter() - started, output)
+
+    with open(outputs["in process"][1], encoding="utf-8") as f:
+        reference = f.read()
+    for name, (elapsed, output) in outputs.items():
+        with open(output, encoding="utf-8") as f:
+            same = f.read() == reference
+        print(f"{name:>11}: {args.minutes:g} min in {elapsed:.2f}s, identical srt: {same}")
+
+if __name__ == "__main__":
+    main()
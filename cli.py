@@ -1,7 +1,7 @@
 #!/bin/env python
-import argparse, sys, os.path
-from services import Logger, Translator, Transcriptor, Utils
-import torch
+import argparse, glob, sys, os.path, time
+from concurrent.futures import ThreadPoolExecutor
+from services import Logger, Translator, Transcriptor, Utils, ModelRegistry, TranslationMemory, select_device, configure_threads, WhisperPool, plan_workers, job_size
 
 def print_ops(operation: str, device: str, lang_from: str, lang_to: str, input_file:str, output_file:str):
     print(f"Device: {device}")
@@ -11,6 +11,137 @@ def print_ops(operation: str, device: str, lang_from: str, lang_to: str, input_f
     print(f"Input file: {input_file}")
     print(f"Output file: {output_file}")
 
+# files of a directory, a glob pattern or a manifest with one path per line (# comments),
+# relative paths of a manifest are relative to it
+def batch_inputs(spec: str, extensions: tuple) -> list:
+    if os.path.isdir(spec):
+        files = [os.path.join(spec, name) for name in os.listdir(spec) if name.lower().endswith(extensions)]
+    elif os.path.isfile(spec):
+        base = os.path.dirname(spec)
+        with open(spec, "r", encoding="utf-8") as f:
+            lines = [line.split("#", 1)[0].strip() for line in f]
+        files = [os.path.join(base, line) for line in lines if line]
+    else:
+        files = glob.glob(spec, recursive=True)
+    return sorted(dict.fromkeys(file for file in files if os.path.isfile(file)))
+
+# <name>.<lang>.srt next to the input or in output_dir, like the api names its outputs
+def batch_output(input_file: str, output_dir: str, lang: str) -> str:
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_dir or os.path.dirname(input_file), f"{name}.{lang}.srt")
+
+# yields each item with a future of prepare(item), the next item is prepared on a background
+# thread while the caller works on the current one
+def prefetched(items: list, prepare):
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as executor:
+        future = executor.submit(prepare, items[0]) if len(items) > 0 else None
+        for i, item in enumerate(items):
+            current = future
+            future = executor.submit(prepare, items[i + 1]) if i + 1 < len(items) else None
+            yield item, current
+
+def print_summary(operation: str, done: int, skipped: int, failed: int, seconds: float, units: float, unit: str) -> None:
+    print(f"Batch {operation}: {done} done, {skipped} skipped, {failed} failed in {seconds:.1f}s")
+    if done > 0 and seconds > 0:
+        if unit == "audio":
+            print(f"Audio: {units / 3600:.2f}h, {units / seconds:.1f}x realtime, {seconds / done:.1f}s per file")
+        else:
+            print(f"Cues: {units:.0f}, {units / seconds:.1f} cues/s, {seconds / done:.1f}s per file")
+
+# many files in one run: whisper and each translation model are loaded once, the next audio is
+# decoded, language detected and VAD run while the current one is transcribed, and inputs whose
+# output exists already are skipped so an interrupted run can be started again
+def run_batch(args, logger, device: str, memory, backend_options: dict) -> None:
+    transcript = bool(args.transcript)
+    inputs = batch_inputs(args.batch, (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".mkv", ".mp4", ".webm", ".mov", ".avi") if transcript else (".srt",))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    pending = [file for file in inputs if not os.path.isfile(batch_output(file, args.output_dir, args.to))]
+    skipped = len(inputs) - len(pending)
+    print(f"Batch: {len(inputs)} files, {skipped} already done, device {device}")
+    if len(pending) == 0:
+        return
+    translators = {}
+
+    def translator_for(lang_from: str):
+        # the transcription is kept as is when it's already in the target language
+        if lang_from == args.to:
+            return None
+        if lang_from not in translators:
+            model = f"Helsinki-NLP/opus-mt-{lang_from}-{args.to}"
+            translators[lang_from] = Translator(logger=logger, model_name=model, device=device, is_cli=True, memory=memory, quantize=args.quantize, backend=args.backend, backend_options=backend_options)
+        return translators[lang_from]
+
+    done, failed, units = 0, 0, 0.0
+    started = time.perf_counter()
+    pool = None
+    try:
+        if transcript:
+            worker_specs = plan_workers(args.whisper_workers, device, args.whisper_layout)
+            if len(worker_specs) > 0:
+                pool = WhisperPool(logger, worker_specs, quantize=args.quantize_whisper and device == "cpu", memory_mb=args.whisper_worker_memory).start()
+            transcriptor = Transcriptor(logger=logger, translator=None, device=device, is_cli=True, quantize=args.quantize_whisper, pool=pool)
+
+            def prepare(input_file):
+                groups, audio = transcriptor.prepare(input_file)
+                try:
+                    return args.fr or Utils.detect_language(input_file, device=device, audio=audio), (groups, audio)
+                except BaseException:
+                    audio.close()
+                    raise
+
+            for i, (input_file, future) in enumerate(prefetched(pending, prepare)):
+                output_file = batch_output(input_file, args.output_dir, args.to)
+                file_started = time.perf_counter()
+                try:
+                    audio_lang, prepared = future.result()
+                    duration = prepared[1].duration
+                    print(f"[{i + 1}/{len(pending)}] {input_file} ({audio_lang} -> {args.to})")
+                    try:
+                        transcriptor.translator = translator_for(audio_lang)
+                    except Exception:
+                        prepared[1].close()
+                        raise
+                    if transcriptor.transcript(language=audio_lang, audio_file=input_file, output_file=output_file, prepared=prepared) is None:
+                        raise RuntimeError("no speech found")
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"transcription of {input_file} failed: {e}")
+                    continue
+                done += 1
+                units += duration
+                seconds = time.perf_counter() - file_started
+                print(f"{output_file} in {seconds:.1f}s, {duration / max(seconds, 1e-6):.1f}x realtime")
+            transcriptor.close()
+        else:
+            # files of the same language pair one after another
+            languages = {file: args.fr or Utils.detect_str_lang(file) for file in pending}
+            pending.sort(key=lambda file: languages[file])
+            for i, input_file in enumerate(pending):
+                output_file = batch_output(input_file, args.output_dir, args.to)
+                file_started = time.perf_counter()
+                try:
+                    if languages[input_file] == "":
+                        raise RuntimeError("source language not detected")
+                    print(f"[{i + 1}/{len(pending)}] {input_file} ({languages[input_file]} -> {args.to})")
+                    translator = translator_for(languages[input_file])
+                    if translator is None:
+                        raise RuntimeError(f"already in {args.to}")
+                    translator.translate_srt_file(srt_file=input_file, output_file=output_file)
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"translation of {input_file} failed: {e}")
+                    continue
+                done += 1
+                units += job_size("translate", input_file) or 0
+                print(f"{output_file} in {time.perf_counter() - file_started:.1f}s")
+    finally:
+        for translator in translators.values():
+            translator.close()
+        if pool is not None:
+            pool.stop()
+    print_summary("transcript" if transcript else "translate", done, skipped, failed, time.perf_counter() - started, units, "audio" if transcript else "cues")
+
 def main():
     logger = Logger()
     parser = argparse.ArgumentParser(prog="Transcriber", description='Transcribe audio files and generate subtitles')
@@ -18,31 +149,65 @@ def main():
     parser.add_argument('-tr', '--translate', help="translate", type=bool)
     parser.add_argument('--fr', help="translate from language")
     parser.add_argument('--to', help="translate to language")
-    parser.add_argument('-i', '--input-file', help="input audio file or srt file with -tr option", required=True)
-    parser.add_argument('-o', '--output-file', help="output srt file", default="subtitle.srt", required=True)
+    parser.add_argument('-i', '--input-file', help="input audio file or srt file with -tr option")
+    parser.add_argument('-o', '--output-file', help="output srt file", default="subtitle.srt")
+    parser.add_argument('-b', '--batch', help="directory, glob pattern or manifest file of inputs, written as <name>.<to>.srt")
+    parser.add_argument('--output-dir', help="directory of the batch outputs, next to each input by default")
+    parser.add_argument('--model-memory', help="memory budget in MB for loaded models, 0 means no limit", type=int, default=0)
+    parser.add_argument('--translation-memory', help="sqlite file used to cache translations between runs")
+    parser.add_argument('--device', help="auto, cuda or cpu", default="auto")
+    parser.add_argument('--quantize', help="int8 dynamic quantization of the translation model on cpu", action="store_true")
+    parser.add_argument('--quantize-whisper', help="int8 dynamic quantization of whisper on cpu", action="store_true")
+    parser.add_argument('--backend', help="translation backend, transformers or onnx", default="transformers")
+    parser.add_argument('--onnx-cache', help="directory for exported onnx models", default="./media/onnx")
+    parser.add_argument('--whisper-workers', help="whisper worker processes decoding chunks in parallel, 0 decodes in this process", type=int, default=0)
+    parser.add_argument('--whisper-layout', help='worker devices or cpu sets, e.g. "cuda:0;cuda:1" or "cpu:0-7;cpu:8-15"', default="")
+    parser.add_argument('--whisper-worker-memory', help="memory limit in MB per whisper worker, 0 means no limit", type=int, default=0)
+    parser.add_argument('--threads', help="torch intra-op threads, 0 uses every cpu", type=int, default=0)
     args = parser.parse_args()
+    ModelRegistry().configure(memory_budget_mb=args.model_memory)
+    memory = TranslationMemory(logger=logger, db_file=args.translation_memory) if args.translation_memory else None
     
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = select_device(args.device)
+    backend_options = {"cache_dir": args.onnx_cache} if args.backend == "onnx" else {}
+    configure_threads(intra_op=args.threads)
+
+    if args.batch:
+        if not args.to or not (args.transcript or args.translate):
+            print("batch mode needs -t or -tr and --to.")
+            sys.exit(1)
+        run_batch(args, logger, device, memory, backend_options)
+        return
 
-    if not os.path.isfile(args.input_file):
+    if not args.input_file or not os.path.isfile(args.input_file):
         print("file doesn't exist.")
         sys.exit(1)
     
     if args.transcript:
         print_ops(operation="transcript", device=device, lang_from=args.fr, lang_to=args.to, input_file=args.input_file, output_file=args.output_file)
-        audio_lang = Utils.detect_language(args.input_file)
-        # Setting Translation instance
-        model = f"Helsinki-NLP/opus-mt-{audio_lang}-{args.to}"
-        translator = Translator(logger=logger, model_name=model, device=device)
-        # Serting Transcriber instance
-        transcriptor = Transcriptor(logger=logger, translator=translator, device=device, is_cli=True)
-        transcriptor.transcript(language=audio_lang, audio_file=args.input_file, output_file=args.output_file)
+        audio_lang = args.fr or Utils.detect_language(args.input_file, device=device)
+        # Setting Translation instance, none when the audio is already in the target language
+        translator = None
+        if audio_lang != args.to:
+            model = f"Helsinki-NLP/opus-mt-{audio_lang}-{args.to}"
+            translator = Translator(logger=logger, model_name=model, device=device, memory=memory, quantize=args.quantize, backend=args.backend, backend_options=backend_options)
+        worker_specs = plan_workers(args.whisper_workers, device, args.whisper_layout)
+        pool = None
+        if len(worker_specs) > 0:
+            pool = WhisperPool(logger, worker_specs, quantize=args.quantize_whisper and device == "cpu", memory_mb=args.whisper_worker_memory).start()
+        try:
+            # Serting Transcriber instance
+            transcriptor = Transcriptor(logger=logger, translator=translator, device=device, is_cli=True, quantize=args.quantize_whisper, pool=pool)
+            transcriptor.transcript(language=audio_lang, audio_file=args.input_file, output_file=args.output_file)
+        finally:
+            if pool is not None:
+                pool.stop()
     elif args.translate:
         print_ops(operation="translate", device=device, lang_from=args.fr, lang_to=args.to, input_file=args.input_file, output_file=args.output_file)
         if args.fr and args.to and args.input_file and args.output_file:
             # Setting Translation model
             model = f"Helsinki-NLP/opus-mt-{args.fr}-{args.to}"
-            translator = Translator(logger=logger, model_name=model, device=device, is_cli=True)
+            translator = Translator(logger=logger, model_name=model, device=device, is_cli=True, memory=memory, quantize=args.quantize, backend=args.backend, backend_options=backend_options)
             translator.translate_srt_file(srt_file=args.input_file, output_file=args.output_file)
 
 
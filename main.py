@@ -1,15 +1,18 @@
-from flask import Flask, request, jsonify, send_from_directory
-import threading
-import requests
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from werkzeug.utils import safe_join
 import os
-from services import Logger, Translator, Transcriptor, Utils, DBManager
+import json
+import threading
+import time
+# inference modules (torch, whisper, transformers) are imported on first use, after the server is listening
+from services import Logger, DBManager, ModelRegistry, TranslationMemory, Scheduler, Notifier, ContentStore, TaskCheckpoint, TaskMonitor, TASK_STATES, SchedulingPolicy, job_size, Metrics, Preloader, parse_manifest, read_partial
 import gc
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'media'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['OUTPUT_FILE_SUFFIX'] = '.es.srt'
+app.config['OUTPUT_FILE_SUFFIX'] = '.{lang}.srt'
 
 logger = Logger()
 db = DBManager(logger=logger, db_file="./media/tasks.db")
@@ -18,15 +21,118 @@ db = DBManager(logger=logger, db_file="./media/tasks.db")
 HOST = os.getenv('LLM_HOST', "0.0.0.0")
 PORT = int(os.getenv('LLM_PORT', 4003))
 NOTIFICATION_URL = str(os.getenv("LLM_NOTIFICATION_SERVICE_URL", "http://192.168.105.105:4000/"))
+# notifications queued within the window are posted together, up to the batch size; 1 posts each one on its own
+NOTIFICATION_BATCH_SIZE = int(os.getenv("LLM_NOTIFICATION_BATCH_SIZE", 1))
+NOTIFICATION_BATCH_WINDOW = float(os.getenv("LLM_NOTIFICATION_BATCH_WINDOW", 0.2))
+NOTIFICATION_TIMEOUT = float(os.getenv("LLM_NOTIFICATION_TIMEOUT", 10))
+NOTIFICATION_MAX_AGE_HOURS = float(os.getenv("LLM_NOTIFICATION_MAX_AGE_HOURS", 24))
+MODEL_MEMORY_MB = int(os.getenv("LLM_MODEL_MEMORY_MB", 12288))
+TRANSLATION_MEMORY_SIZE = int(os.getenv("LLM_TRANSLATION_MEMORY_SIZE", 500000))
+TRANSCRIPT_WORKERS = int(os.getenv("LLM_TRANSCRIPT_WORKERS", 1))
+TRANSLATE_WORKERS = int(os.getenv("LLM_TRANSLATE_WORKERS", 1))
+SCHEDULER_POLL_SECONDS = float(os.getenv("LLM_SCHEDULER_POLL_SECONDS", 30))
+# admission order of each lane: sjf (shortest expected job first, with priority and aging) or fifo
+SCHEDULER_POLICY = os.getenv("LLM_SCHEDULER_POLICY", "sjf").lower()
+# expected seconds of work a second of waiting is worth, and a level of request priority
+SCHEDULER_AGING = float(os.getenv("LLM_SCHEDULER_AGING", 1.0))
+SCHEDULER_PRIORITY_SECONDS = float(os.getenv("LLM_SCHEDULER_PRIORITY_SECONDS", 3600))
+# transcriptions (whisper large) running at once, 0 leaves it to LLM_TRANSCRIPT_WORKERS
+MAX_LARGE_MODEL_JOBS = int(os.getenv("LLM_MAX_LARGE_MODEL_JOBS", 0))
+# part of the result cache key, change it when models are upgraded
+MODEL_VERSION = os.getenv("LLM_MODEL_VERSION", "whisper-large+opus-mt")
+# serving profile: device auto/cuda/cpu, int8 models and torch threads on cpu nodes
+DEVICE_PREFERENCE = os.getenv("LLM_DEVICE", "auto")
+# resolved by startup()
+DEVICE = None
+QUANTIZE = os.getenv("LLM_QUANTIZE", "false").lower() == "true"
+QUANTIZE_WHISPER = os.getenv("LLM_QUANTIZE_WHISPER", "false").lower() == "true"
+TORCH_THREADS = int(os.getenv("LLM_TORCH_THREADS", 0))
+TORCH_INTEROP_THREADS = int(os.getenv("LLM_TORCH_INTEROP_THREADS", 0))
+# translation engine: transformers or onnx (exported once to LLM_ONNX_CACHE)
+TRANSLATION_BACKEND = os.getenv("LLM_TRANSLATION_BACKEND", "transformers")
+ONNX_CACHE = os.getenv("LLM_ONNX_CACHE", "./media/onnx")
+BACKEND_OPTIONS = {"cache_dir": ONNX_CACHE} if TRANSLATION_BACKEND == "onnx" else {}
+# whisper worker processes decoding chunks in parallel, 0 decodes in the task thread;
+# the layout pins each worker, e.g. "cuda:0;cuda:1" or "cpu:0-7;cpu:8-15"
+WHISPER_WORKERS = int(os.getenv("LLM_WHISPER_WORKERS", 0))
+WHISPER_WORKER_LAYOUT = os.getenv("LLM_WHISPER_WORKER_LAYOUT", "")
+WHISPER_WORKER_MEMORY_MB = int(os.getenv("LLM_WHISPER_WORKER_MEMORY_MB", 0))
+# finished tasks are kept for status queries this long
+TASK_RETENTION_HOURS = float(os.getenv("LLM_TASK_RETENTION_HOURS", 168))
+# longest a status request waits for a task to finish
+TASK_WAIT_SECONDS = float(os.getenv("LLM_TASK_WAIT_SECONDS", 60))
+# runs of a failing task before it is given up, its checkpoints are kept between runs
+TASK_MAX_ATTEMPTS = int(os.getenv("LLM_TASK_MAX_ATTEMPTS", 3))
+# models loaded and warmed after startup: "whisper:large,whisper:base,opus-mt:en-es" or a file listing them
+PRELOAD = os.getenv("LLM_PRELOAD", "")
+# stage timers and counters served at /metrics; with a trace directory every task's stages are written to <dir>/task-<id>.json
+METRICS = os.getenv("LLM_METRICS", "true").lower() == "true"
+TRACE_DIR = os.getenv("LLM_TRACE_DIR", "")
+# uploads that aren't 16 kHz mono wavs (any video or audio container) are decoded by a streaming ffmpeg into a ring buffer
+# of this many seconds of audio, it should hold the longest speech chunk
+INGEST_BUFFER_SECONDS = float(os.getenv("LLM_INGEST_BUFFER_SECONDS", 1800))
+
+metrics = Metrics()
+metrics.configure(enabled=METRICS, trace_dir=TRACE_DIR)
+# shared models between tasks
+registry = ModelRegistry()
+registry.configure(memory_budget_mb=MODEL_MEMORY_MB)
+# translations shared between tasks
+memory = TranslationMemory(logger=logger, db_file="./media/translation_memory.db", max_entries=TRANSLATION_MEMORY_SIZE)
+# uploads are stored by content hash
+store = ContentStore(root=UPLOAD_FOLDER)
+# completion events are queued in the task database and posted by a background thread
+notifier = Notifier(logger=logger, db=db, url=NOTIFICATION_URL, batch_size=NOTIFICATION_BATCH_SIZE, batch_window=NOTIFICATION_BATCH_WINDOW,
+                    timeout=NOTIFICATION_TIMEOUT, max_age=NOTIFICATION_MAX_AGE_HOURS * 3600)
+# lanes admit short jobs first, None keeps submission order
+policy = None
+if SCHEDULER_POLICY == "sjf":
+    policy = SchedulingPolicy(db=db, aging=SCHEDULER_AGING, priority_seconds=SCHEDULER_PRIORITY_SECONDS, max_large=MAX_LARGE_MODEL_JOBS)
+# task status served by /tasks, waiters are woken on every progress update
+monitor = TaskMonitor(db=db, concurrency={'transcript': TRANSCRIPT_WORKERS, 'translate': TRANSLATE_WORKERS}, policy=policy)
+# models of the preload manifest, warmed in the background
+preloader = Preloader(logger=logger, entries=parse_manifest(PRELOAD))
+# set by startup() once tasks can run
+startup_state = {"started": False, "error": None, "seconds": None}
+
+# queue depth read from the task table on every scrape
+def queueDepth():
+    counts = {(operation, state): 0 for operation in ('transcript', 'translate') for state in ("pending", "running")}
+    for operation, process, total in db.count_active_tasks():
+        counts[(operation, TASK_STATES[process])] = total
+    return [("llm_queue_depth", {"operation": operation, "state": state}, total) for (operation, state), total in counts.items()]
+
+metrics.register(queueDepth)
 
 # Endpoint that process tasks
 @app.route("/processTask", methods=["GET"])
 def processTask():
-    thread = threading.Thread(target=processTasks,)
-    thread.start()
+    scheduler.wake()
     return jsonify({"message":"ok"}), 200
 
+# Ready once the device is set up, the scheduler is running and the preload manifest is warm
+@app.route("/ready", methods=["GET"])
+def ready():
+    models = preloader.status()
+    pool = None
+    if whisper_pool is not None:
+        pool = {"workers": whisper_pool.size, "ready": whisper_pool.wait_ready(0)}
+    is_ready = (startup_state["started"] and preloader.finished.is_set()
+                and all(model["state"] in ("warm", "whisper pool") for model in models.values())
+                and (pool is None or pool["ready"]))
+    body = {"ready": is_ready, "device": DEVICE, **startup_state, "models": models, "whisper_pool": pool,
+            "resident": [model["name"] for model in registry.stats()["models"]]}
+    return jsonify(body), 200 if is_ready else 503
+
+# Stage timings, throughput, queue depth and memory in the prometheus text format
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({"error": "metrics are disabled."}), 404
+    return Response(metrics.expose(), mimetype="text/plain; version=0.0.4")
+
 # Endpoint to download str file
+# with partial=1 a running task's output is served as far as it is written, with the task's progress in X-Task-* headers
 @app.route("/download", methods=["GET"])
 def download_file():
     file_path = request.args.get("filename")
@@ -34,12 +140,98 @@ def download_file():
     
     if not file_path:
         return jsonify({"error": "filaname required."}, 400)
+    if request.args.get("partial", "").lower() in ("1", "true"):
+        return downloadPartial(file_path)
     try:
         return send_from_directory(app.config['UPLOAD_FOLDER'], path=file_path, as_attachment=True)
     except Exception as e:
         logger.error(f"error downloading file: {e}")
         return jsonify({"error": f"error {e}"})
 
+def downloadPartial(file_path: str):
+    output_path = safe_join(app.config['UPLOAD_FOLDER'], file_path)
+    if output_path is None:
+        return jsonify({"error": "invalid filename."}), 400
+    # outputs are named <content hash>.<lang>.srt after the task's upload
+    task = db.find_task_by_content(os.path.basename(file_path).split(".")[0])
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        status, stage, progress = "done", "done", 1.0
+    else:
+        content = read_partial(output_path)
+        if content is None and task is None:
+            return jsonify({"error": "file not found."}), 404
+        described = monitor.describe(task) if task is not None else {"status": "pending", "stage": "queued", "progress": 0.0}
+        status, stage, progress = described["status"], described["stage"], described["progress"]
+    headers = {
+        "Content-Disposition": f"attachment; filename={os.path.basename(output_path)}",
+        "X-Task-Status": status,
+        "X-Task-Stage": stage,
+        "X-Task-Progress": f"{progress:.4f}",
+    }
+    return Response(content or "", mimetype="application/x-subrip", headers=headers)
+
+# Task status: queue position, stage, progress and ETA. With wait=<seconds> the
+# response is held until the task finished or the wait expired
+@app.route("/tasks/<int:task_id>", methods=["GET"])
+def task_status(task_id: int):
+    try:
+        wait = float(request.args.get("wait", 0) or 0)
+    except ValueError:
+        wait = float("nan")
+    if wait != wait:
+        return jsonify({"error": "wait must be a number of seconds."}), 400
+    wait = min(wait, TASK_WAIT_SECONDS)
+    status = monitor.wait_finished(task_id, wait) if wait > 0 else monitor.status(task_id)
+    if status is None:
+        return jsonify({"error": f"task {task_id} not found."}), 404
+    return jsonify(status), 200
+
+# server sent events with the task's status on every change, until it finished
+@app.route("/tasks/<int:task_id>/events", methods=["GET"])
+def task_events(task_id: int):
+    if monitor.status(task_id) is None:
+        return jsonify({"error": f"task {task_id} not found."}), 404
+    def events():
+        version, sent = monitor.version, None
+        while True:
+            status = monitor.status(task_id)
+            if status is None:
+                return
+            current = {key: value for key, value in status.items() if key != "eta_seconds"}
+            if current != sent:
+                sent = current
+                yield f"event: status\ndata: {json.dumps(status)}\n\n"
+            if status["status"] in ("done", "failed"):
+                return
+            previous, version = version, monitor.wait(version, TASK_WAIT_SECONDS)
+            if version == previous:
+                # keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# stage spans of a task in the chrome trace format, written when LLM_TRACE_DIR is set
+@app.route("/tasks/<int:task_id>/trace", methods=["GET"])
+def task_trace(task_id: int):
+    path = metrics.trace_path(f"task-{task_id}")
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": f"no trace for task {task_id}."}), 404
+    return send_from_directory(os.path.abspath(os.path.dirname(path)), os.path.basename(path), mimetype="application/json")
+
+# latest tasks, status=pending,running to filter them
+@app.route("/tasks", methods=["GET"])
+def list_tasks():
+    states = [state.strip() for state in request.args.get("status", "").split(",") if state.strip()]
+    codes = {name: code for code, name in TASK_STATES.items()}
+    if any(state not in codes for state in states):
+        return jsonify({"error": f"status must be one of {', '.join(codes)}."}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 100)), 1000))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    return jsonify({"tasks": monitor.list([codes[state] for state in states], limit)}), 200
+
 # Endpoint to translate from str to str
 @app.route("/send_translate", methods=["POST"])
 def translate():
@@ -70,10 +262,23 @@ def translate():
         return jsonify({"error": "missing srt source file."}), 400
 
     logger.info(f"processing translation file: {file.filename}, with title: {title} for lang: {lang}")
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
-    db.insert_task(('translate', lang, title, file_path, destinationPath))
-    return jsonify({"message": "file saved", "path": file_path, "task": "translation created"}), 200
+    priority = parsePriority(request.form.get("priority"))
+    staged = store.stage(file.stream, file.filename)
+    output_path = cachedResult(staged.content_hash, 'translate', lang)
+    if output_path:
+        store.discard(staged)
+        notify(title=title, output_path=output_path, destinationPath=destinationPath)
+        return jsonify({"message": "file saved", "path": staged.path, "task": "translation completed", "file": output_path}), 200
+    # published with the task using it, so a finishing task can't remove the file in between
+    with db.transaction():
+        file_path = store.publish(staged)
+        # the same content queued or running for this language is notified from that task
+        task_id = db.attach_to_task(staged.content_hash, 'translate', [lang], title, destinationPath)
+        if task_id is not None:
+            return jsonify({"message": "file saved", "path": file_path, "task": "translation attached", "task_id": task_id}), 200
+        task_id = db.insert_task(('translate', lang, title, file_path, destinationPath, staged.content_hash, priority, job_size('translate', file_path)))
+    monitor.changed()
+    return jsonify({"message": "file saved", "path": file_path, "task": "translation created", "task_id": task_id}), 200
 
 @app.route("/send_transcript", methods=["POST"])
 def transcribe():
@@ -103,28 +308,133 @@ def transcribe():
         logger.error("missing audio input file.")
         return jsonify({"error": "missing audio input file."}), 400
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
-    db.insert_task(('transcript', lang, title, file_path, destinationPath))
-    return jsonify({"message": "file saved", "path": file_path, "task": "transcription created"}), 200
-
-def processTasks() -> None:
-    tasks = db.getTasks(query="select id, operation, language, title, file, destinationPath, process from tasks where process = ?", params=(0,))
-    for task in tasks:
-        logger.info(f"processing task {task['id']} for {task['operation']}")
-        if task['operation'] == 'transcript':
-            db.update_task_status(taskId=task['id'])
-            transcribeTask(task['file'], task['language'], task['title'], task['destinationPath'])
-        elif task['operation'] == 'translate':
-            db.update_task_status(taskId=task['id'])
-            translateTask(task['file'], task['language'], task['title'], task['destinationPath'])
+    # one transcription can be translated to many languages: lang=es,fr,de
+    langs = parseLanguages(lang)
+    if len(langs) == 0:
+        logger.error("missing output language from request.")
+        return jsonify({"error": "missing output language from request."}), 400
+    priority = parsePriority(request.form.get("priority"))
+    staged = store.stage(file.stream, file.filename)
+    outputs = {output_lang: cachedResult(staged.content_hash, 'transcript', output_lang) for output_lang in langs}
+    if len(langs) > 0 and all(outputs.values()):
+        # the audio is not needed, a stored copy belongs to the tasks using it
+        store.discard(staged)
+        notify(title=title, output_path=outputs[langs[0]], destinationPath=destinationPath, outputs=outputs)
+        return jsonify({"message": "file saved", "path": staged.path, "task": "transcription completed", "file": outputs[langs[0]], "files": outputs}), 200
+    # published with the task using it, so a finishing task can't remove the file in between
+    with db.transaction():
+        file_path = store.publish(staged)
+        # the same content queued or running for these languages is notified from that task
+        task_id = db.attach_to_task(staged.content_hash, 'transcript', langs, title, destinationPath)
+        if task_id is not None:
+            return jsonify({"message": "file saved", "path": file_path, "task": "transcription attached", "task_id": task_id}), 200
+        task_id = db.insert_task(('transcript', ",".join(langs), title, file_path, destinationPath, staged.content_hash, priority, job_size('transcript', file_path)))
+    monitor.changed()
+    return jsonify({"message": "file saved", "path": file_path, "task": "transcription created", "task_id": task_id}), 200
+
+# optional priority form field, higher is admitted sooner
+def parsePriority(value) -> int:
+    try:
+        return max(-10, min(10, int(value or 0)))
+    except ValueError:
+        return 0
+
+def parseLanguages(lang) -> list:
+    return list(dict.fromkeys(l.strip() for l in (lang or "").split(",") if l.strip()))
+
+# output of a previous task with the same content, None when it has to be processed
+def cachedResult(content_hash: str, operation: str, lang: str):
+    output_path = db.find_result(content_hash, operation, lang, MODEL_VERSION)
+    if output_path is None:
+        return None
+    if not os.path.exists(output_path):
+        db.delete_result(content_hash, operation, lang, MODEL_VERSION)
+        return None
+    logger.info(f"{operation} result for {content_hash} to {lang} found in {output_path}")
+    return output_path
+
+def notify(title: str, output_path: str, destinationPath: str, outputs: dict = None) -> None:
+    payload = {"status":"task completed", "title": title, "file": output_path,  "destinationPath": destinationPath}
+    if outputs is not None:
+        # every output produced by a multi language task
+        payload["files"] = [{"lang": lang, "file": path} for lang, path in outputs.items()]
+    # Notify to service that task is completed, delivered in the background
+    notifier.send(payload)
+
+# uploads attached to a task are notified with its outputs in the languages they asked for
+def notifySubscribers(task, outputs: dict) -> None:
+    for subscriber in db.take_subscribers(task['id']):
+        langs = parseLanguages(subscriber['language'])
+        if task['operation'] == 'translate':
+            notify(title=subscriber['title'], output_path=outputs[langs[0]], destinationPath=subscriber['destinationPath'])
         else:
-            logger.error(f"operation {task['operation']} not supported.")
-        logger.info(f"end processing {task['operation']} task {task['id']}")
-        db.delete_task(taskId=task['id'])
+            notify(title=subscriber['title'], output_path=outputs[langs[0]], destinationPath=subscriber['destinationPath'], outputs={lang: outputs[lang] for lang in langs})
 
-def translateTask(file_path: str, output_lang: str, title: str, destinationPath: str) -> None:
+# progress hook of a task's worker, stored in the task row for /tasks
+def progressReporter(task):
+    def saveProgress(stage: str, progress: float, detail: str = None) -> None:
+        db.set_task_progress(task['id'], stage, progress, detail)
+        monitor.changed()
+    return saveProgress
+
+# remove a finished or given up task's source once no other task needs it; the running task counts itself. Uploads
+# publish the file with their task in one transaction, so they either see it removed or keep it
+def releaseSource(file_path: str) -> None:
+    with db.transaction():
+        if db.count_tasks_for_file(file_path) <= 1 and os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"removed source file {file_path}")
+
+# returns the task's outputs by language
+def runTranscriptTask(task) -> dict:
+    langs = parseLanguages(task['language'])
+    if len(langs) == 0:
+        raise ValueError(f"task {task['id']} has no output language.")
+    cached = {}
+    if task['content_hash']:
+        cached = {lang: cachedResult(task['content_hash'], 'transcript', lang) for lang in langs}
+        cached = {lang: path for lang, path in cached.items() if path}
+    missing = [lang for lang in langs if lang not in cached]
+    if len(missing) == 0:
+        outputs = cached
+    else:
+        def saveResult(lang: str, output_path: str) -> None:
+            if task['content_hash']:
+                db.save_result(task['content_hash'], 'transcript', lang, MODEL_VERSION, output_path)
+        # chunks finished before a restart are restored from the task's checkpoint
+        checkpoint = TaskCheckpoint(db, task['id'], vad_chunks=task['vad_chunks'], language=task['source_language'])
+        outputs = transcribeTask(task['file'], missing, task['title'], cached_outputs=cached, on_output=saveResult, checkpoint=checkpoint, on_progress=progressReporter(task))
+        if any(lang not in outputs for lang in langs):
+            # the source and checkpoints are kept while the scheduler runs the task again
+            raise RuntimeError(f"transcription of {task['file']} produced {list(outputs.keys())} of {langs}")
+    releaseSource(task['file'])
+    outputs = {lang: outputs[lang] for lang in langs}
+    # notified once every language is written, listing every output
+    notify(title=task['title'], output_path=outputs[langs[0]], destinationPath=task['destinationPath'], outputs=outputs)
+    notifySubscribers(task, outputs)
+    return outputs
+
+def runTranslateTask(task) -> dict:
+    output_path = cachedResult(task['content_hash'], 'translate', task['language']) if task['content_hash'] else None
+    if output_path:
+        notify(title=task['title'], output_path=output_path, destinationPath=task['destinationPath'])
+        notifySubscribers(task, {task['language']: output_path})
+        releaseSource(task['file'])
+        return {task['language']: output_path}
+    output_path = translateTask(task['file'], task['language'], task['title'], task['destinationPath'], on_progress=progressReporter(task))
+    if not output_path:
+        raise RuntimeError(f"translation of {task['file']} to {task['language']} produced no output")
+    if task['content_hash']:
+        db.save_result(task['content_hash'], 'translate', task['language'], MODEL_VERSION, output_path)
+    notifySubscribers(task, {task['language']: output_path})
+    releaseSource(task['file'])
+    return {task['language']: output_path}
+
+def translateTask(file_path: str, output_lang: str, title: str, destinationPath: str, on_progress=None):
+    from services import Translator, Utils
     # Detect source file language
+    if on_progress is not None:
+        on_progress("detect", 0.0)
     lang = Utils.detect_str_lang(file_path=file_path)
     logger.info(f"task initialized with {file_path} with lang: {lang} and output_lang: {output_lang}")
     # Validate if input lang and desired translation language are the same
@@ -132,52 +442,118 @@ def translateTask(file_path: str, output_lang: str, title: str, destinationPath:
         logger.error("source language and output language are the same.")
         return
     
-    output_path = os.path.splitext(file_path)[0] + app.config['OUTPUT_FILE_SUFFIX']
+    output_path = os.path.splitext(file_path)[0] + app.config['OUTPUT_FILE_SUFFIX'].format(lang=output_lang)
     # Setting Translation model
     model = f"Helsinki-NLP/opus-mt-{lang}-{output_lang}"
-    translator = Translator(logger=logger, model_name=model, device="cuda")
-    translator.translate_srt_file(srt_file=file_path, output_file=output_path)
-    try:
-        # Notify to service that translation is completed.
-        requests.post(NOTIFICATION_URL, json={"status":"task completed", "title": title, "file": output_path,  "destinationPath": destinationPath}, timeout=0.001)
-    except requests.exceptions.Timeout:
-        logger.info("notification sent, no waiting for response.")
+    with Translator(logger=logger, model_name=model, device=DEVICE, memory=memory, quantize=QUANTIZE, backend=TRANSLATION_BACKEND, backend_options=BACKEND_OPTIONS) as translator:
+        translator.translate_srt_file(srt_file=file_path, output_file=output_path, on_progress=on_progress)
+    notify(title=title, output_path=output_path, destinationPath=destinationPath)
     logger.info(f"translation task completed for {file_path} as title {title} from {lang} to {output_lang} saved in {output_path}.")
     # garbage collect
     gc.collect()
+    return output_path
 
-def transcribeTask(file_path: str, output_lang:str, title: str, destinationPath: str) -> None:
-    # detect source language
-    audio_lang = Utils.detect_language(file_path)
-    if audio_lang == "":
-        logger.error("while detecting source audio language.")
-        return
-    if audio_lang == output_lang:
-        logger.error("source language and output language are the same.")
-        return 
-    output_path = os.path.splitext(file_path)[0] + app.config['OUTPUT_FILE_SUFFIX']
-    
-    logger.info(f"language detected {audio_lang} for {file_path}")
-    if not audio_lang or not output_lang:
-        logger.error(f"no language detected {audio_lang} or {output_lang}")
-        return
-    # Setting Translation instance
-    model = f"Helsinki-NLP/opus-mt-{audio_lang}-{output_lang}"
-    translator = Translator(logger=logger, model_name=model, device="cuda")
-    # Serting Transcriber instance
-    transcriptor = Transcriptor(logger=logger, translator=translator, device="cuda")
-    transcriptor.transcript(language=audio_lang, audio_file=file_path, output_file=output_path)
+def transcribeTask(file_path: str, output_langs: list, title: str, cached_outputs: dict = None, on_output=None, checkpoint: TaskCheckpoint = None, on_progress=None):
+    from services import Translator, Transcriptor, Utils
+    from services.audio import open_audio
+    # the upload is opened once, language detection and VAD read the same decoded stream
+    audio = open_audio(file_path, buffer_seconds=INGEST_BUFFER_SECONDS)
+    translators = {}
+    targets = {}
     try:
-        # send notification back when task finishes
-        requests.post(NOTIFICATION_URL, json={"status": "task completed", "title": title, "file": output_path, "destinationPath": destinationPath}, timeout=0.001)
-    except requests.exceptions.Timeout:
-        logger.info("notification sent, no waiting for response.")
-    logger.info(f"transcription completed for {file_path} as title: {title} from {audio_lang} to {output_lang} saved in {output_path}.")
+        # detect source language
+        if on_progress is not None:
+            on_progress("detect", 0.0)
+        if checkpoint is not None and checkpoint.language:
+            audio_lang = checkpoint.language
+        else:
+            audio_lang = Utils.detect_language(file_path, device=DEVICE, audio=audio)
+        if audio_lang == "":
+            logger.error("while detecting source audio language.")
+            return {}
+        if checkpoint is not None:
+            checkpoint.save_language(audio_lang)
+        logger.info(f"language detected {audio_lang} for {file_path}")
+
+        # Setting Translation instances, the source language is written without translation
+        for output_lang in output_langs:
+            output_path = os.path.splitext(file_path)[0] + app.config['OUTPUT_FILE_SUFFIX'].format(lang=output_lang)
+            if output_lang == audio_lang:
+                targets[output_lang] = (None, output_path)
+                continue
+            model = f"Helsinki-NLP/opus-mt-{audio_lang}-{output_lang}"
+            try:
+                translators[output_lang] = Translator(logger=logger, model_name=model, device=DEVICE, memory=memory, quantize=QUANTIZE, backend=TRANSLATION_BACKEND, backend_options=BACKEND_OPTIONS)
+            except Exception as e:
+                logger.error(f"no translation model {model} for {output_lang}: {e}")
+                continue
+            targets[output_lang] = (translators[output_lang], output_path)
+        if len(targets) == 0:
+            logger.error(f"no output language available for {audio_lang} to {output_langs}")
+            return {}
+
+        def outputReady(lang: str, output_path: str) -> None:
+            logger.info(f"transcription to {lang} saved in {output_path}.")
+            if on_output is not None:
+                on_output(lang, output_path)
+
+        # Serting Transcriber instance, whisper runs once for every output language
+        with Transcriptor(logger=logger, translator=None, device=DEVICE, quantize=QUANTIZE_WHISPER, pool=whisper_pool, buffer_seconds=INGEST_BUFFER_SECONDS) as transcriptor:
+            outputs = transcriptor.transcript_languages(language=audio_lang, audio_file=file_path, targets=targets, on_output=outputReady, checkpoint=checkpoint,
+                                                        on_progress=on_progress, prepared=transcriptor.vad_run(file_path, audio=audio))
+    finally:
+        audio.close()
+        for translator in translators.values():
+            translator.close()
+    if len(outputs) == 0:
+        return {}
+
+    outputs = {**(cached_outputs or {}), **outputs}
+    logger.info(f"transcription completed for {file_path} as title: {title} from {audio_lang} to {list(outputs.keys())}.")
+    logger.info(f"model registry stats: {registry.stats()}")
     # garbage collector
     gc.collect()
+    return outputs
+
+# started with the server, worker processes re-import this module
+whisper_pool = None
+
+# claims pending tasks and runs them on a worker pool per operation
+scheduler = Scheduler(logger=logger, db=db,
+                      handlers={'transcript': runTranscriptTask, 'translate': runTranslateTask},
+                      concurrency={'transcript': TRANSCRIPT_WORKERS, 'translate': TRANSLATE_WORKERS},
+                      poll_interval=SCHEDULER_POLL_SECONDS, retention=TASK_RETENTION_HOURS * 3600, on_change=monitor.changed, policy=policy,
+                      max_attempts=TASK_MAX_ATTEMPTS, on_failed=lambda task: releaseSource(task['file']))
+
+# device, whisper workers and scheduler, then the preload manifest; runs while the server already accepts uploads
+def startup() -> None:
+    global DEVICE, whisper_pool
+    started = time.perf_counter()
+    try:
+        from services import select_device, configure_threads, WhisperPool, plan_workers
+        DEVICE = select_device(DEVICE_PREFERENCE)
+        threads = configure_threads(intra_op=TORCH_THREADS, inter_op=TORCH_INTEROP_THREADS, workers=TRANSCRIPT_WORKERS + TRANSLATE_WORKERS)
+        worker_specs = plan_workers(WHISPER_WORKERS, DEVICE, WHISPER_WORKER_LAYOUT)
+        if len(worker_specs) > 0:
+            whisper_pool = WhisperPool(logger, worker_specs, quantize=QUANTIZE_WHISPER and DEVICE == "cpu", memory_mb=WHISPER_WORKER_MEMORY_MB).start()
+    except Exception as e:
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+        logger.error(f"startup failed, tasks won't run: {e}")
+        preloader.finished.set()
+        return
+    logger.info(f"Device: {DEVICE}, int8 translation: {QUANTIZE}, int8 whisper: {QUANTIZE_WHISPER}, torch threads: {threads}, translation backend: {TRANSLATION_BACKEND}")
+    scheduler.start()
+    startup_state["started"] = True
+    startup_state["seconds"] = round(time.perf_counter() - started, 3)
+    preloader.run(DEVICE, quantize=QUANTIZE, quantize_whisper=QUANTIZE_WHISPER, backend=TRANSLATION_BACKEND, backend_options=BACKEND_OPTIONS,
+                  pooled_whisper=whisper_pool is not None)
+
 # init
 if __name__ == '__main__':
     from waitress import serve
+    notifier.start()
+    threading.Thread(target=startup, name="startup", daemon=True).start()
     logger.info(f"Server starting at: http://{HOST}:{PORT}")
     logger.info(f"Notification Service: {NOTIFICATION_URL}")
+    logger.info(f"Model memory budget: {MODEL_MEMORY_MB}MB")
     serve(app, host=HOST, port=PORT)
@@ -1,5 +1,51 @@
-from .logging import Logger
-from .translate import Translator
-from .transcript import Transcriptor
-from .utils import Utils
-from .db import DBManager
\ No newline at end of file
+import importlib
+
+# Names are imported from their module on first use (PEP 562), so the api can start
+# serving before torch, whisper and transformers are loaded by a task or the preloader.
+_EXPORTS = {
+    "Logger": ".logging",
+    "Translator": ".translate",
+    "Transcriptor": ".transcript",
+    "Utils": ".utils",
+    "DBManager": ".db",
+    "ModelRegistry": ".registry",
+    "TranslationMemory": ".memory",
+    "Scheduler": ".scheduler",
+    "ContentStore": ".storage",
+    "TaskCheckpoint": ".checkpoint",
+    "select_device": ".runtime",
+    "configure_threads": ".runtime",
+    "quantize_dynamic": ".runtime",
+    "load_whisper": ".runtime",
+    "TranslationBackend": ".backends",
+    "register_backend": ".backends",
+    "create_backend": ".backends",
+    "WhisperPool": ".workers",
+    "WorkerSpec": ".workers",
+    "plan_workers": ".workers",
+    "SrtWriter": ".srt_writer",
+    "read_partial": ".srt_writer",
+    "TaskMonitor": ".status",
+    "TASK_STATES": ".status",
+    "Notifier": ".notifier",
+    "Preloader": ".preload",
+    "parse_manifest": ".preload",
+    "SchedulingPolicy": ".policy",
+    "job_size": ".policy",
+    "Metrics": ".metrics",
+    "parse_srt": ".subtitles",
+    "strip_markup": ".subtitles",
+    "wrap_text": ".subtitles",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,304 @@
+import contextvars
+import mmap
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .metrics import Metrics
+
+SAMPLE_RATE = 16000
+
+class WavReader:
+    # Memory mapped 16 kHz mono pcm_s16le wav, samples are only read on demand
+    # and released once consumed so long files don't stay resident.
+
+    def __init__(self, path: str, sample_rate: int = SAMPLE_RATE) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self._file = open(path, "rb")
+        try:
+            self.data_offset, data_size = self._parse_header(sample_rate)
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        # streamed wavs (ffmpeg pipes) may carry a bogus data size
+        self.num_samples = min(data_size, len(self._mmap) - self.data_offset) // 2
+
+    def _parse_header(self, sample_rate: int):
+        riff = self._file.read(12)
+        if len(riff) < 12 or riff[0:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError(f"{self.path} is not a wav file.")
+        fmt = None
+        while True:
+            header = self._file.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{self.path} has no data chunk.")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", self._file.read(16))
+                self._file.seek(chunk_size - 16 + (chunk_size & 1), 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{self.path} data chunk found before fmt chunk.")
+                audio_format, channels, rate, _, _, bits = fmt
+                # 1 is PCM, 0xFFFE is WAVE_FORMAT_EXTENSIBLE
+                if audio_format not in (1, 0xFFFE) or channels != 1 or rate != sample_rate or bits != 16:
+                    raise ValueError(f"{self.path} should be {sample_rate}Hz mono pcm_s16le, got format {audio_format}, {channels} channels, {rate}Hz, {bits} bits.")
+                return self._file.tell(), chunk_size
+            else:
+                self._file.seek(chunk_size + (chunk_size & 1), 1)
+
+    @staticmethod
+    def is_supported(path: str, sample_rate: int = SAMPLE_RATE) -> bool:
+        try:
+            WavReader(path, sample_rate).close()
+            return True
+        except (OSError, ValueError, struct.error):
+            return False
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / self.sample_rate
+
+    # float32 copy of samples [start, end)
+    def read(self, start: int, end: int) -> np.ndarray:
+        start = max(0, min(start, self.num_samples))
+        end = max(start, min(end, self.num_samples))
+        samples = np.frombuffer(self._mmap, dtype="<i2", count=end - start, offset=self.data_offset + start * 2)
+        audio = samples.astype(np.float32) / 32768.0
+        del samples
+        return audio
+
+    # drop pages of samples [start, end) from memory, they are read again from disk if needed
+    def release(self, start: int, end: int) -> None:
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        first = (self.data_offset + max(0, start) * 2) // mmap.PAGESIZE * mmap.PAGESIZE
+        last = self.data_offset + min(end, self.num_samples) * 2
+        if last > first:
+            self._mmap.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+    # samples before end are not read again, the pages were already released
+    def consume(self, end: int) -> None:
+        pass
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+class ArrayAudio:
+    # Already decoded audio, used when the input is not a 16 kHz mono pcm wav
+
+    def __init__(self, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.num_samples = len(audio)
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / self.sample_rate
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        return self.audio[max(0, start):max(0, end)]
+
+    def release(self, start: int, end: int) -> None:
+        pass
+
+    def consume(self, end: int) -> None:
+        pass
+
+    def close(self) -> None:
+        self.audio = None
+
+class StreamAudio:
+    # Any container ffmpeg reads (video or audio), decoded once by an ffmpeg process piping
+    # 16 kHz mono pcm_s16le into a ring buffer of capacity samples. Reads block until the
+    # decoder got that far. The decoder runs ahead until the buffer holds capacity samples
+    # past the consumed mark, further only as far as a blocked read needs: samples not consumed
+    # yet that it overwrites are spilled to a temporary file first, so they can still be read.
+
+    BLOCK = 64 * 1024 # bytes read from the pipe at a time
+
+    def __init__(self, path: str, sample_rate: int = SAMPLE_RATE, capacity_seconds: float = 1800.0, ffmpeg: str = "ffmpeg", duration: Optional[float] = None) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self.capacity = max(1, int(capacity_seconds * sample_rate))
+        # the container's duration until the decoder reaches the end, a full buffer when ffprobe can't tell
+        if duration is None:
+            duration = probe_duration(path, ffmpeg=ffmpeg)
+        self._expected = int(duration * sample_rate) if duration is not None else self.capacity
+        self._buffer = np.empty(self.capacity, dtype=np.int16)
+        self._written = 0
+        self._consumed = 0
+        # furthest sample a blocked read waits for, the decoder overwrites up to it
+        self._wanted = 0
+        # samples overwritten in the ring before this one are gone, later ones are in the spill file
+        self._dropped = 0
+        self._spill = None
+        self.spilled = 0
+        self._finished = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen([ffmpeg, "-nostdin", "-v", "error", "-i", path, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"],
+                                             stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=self._stderr)
+        except OSError:
+            self._stderr.close()
+            raise
+        # runs in a copy of the caller's context, which carries the task's trace
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._decode,), name="ingest", daemon=True)
+        self._thread.start()
+
+    @property
+    def num_samples(self) -> int:
+        with self._cond:
+            if self._finished:
+                return self._written
+            return max(self._expected, self._written)
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / self.sample_rate
+
+    def _decode(self) -> None:
+        started = time.perf_counter()
+        try:
+            while True:
+                data = self._process.stdout.read(self.BLOCK)
+                if not data:
+                    break
+                # a trailing odd byte can only come with the end of the stream
+                if not self._write(np.frombuffer(data, dtype="<i2", count=len(data) // 2)):
+                    return
+            if self._process.wait() != 0:
+                self._stderr.seek(0)
+                message = self._stderr.read()[-1000:].decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"ffmpeg failed decoding {self.path}: {message}")
+            Metrics().observe("ingest", time.perf_counter() - started, started)
+        except BaseException as e:
+            with self._cond:
+                self._error = e
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+
+    # copies samples into the ring, False once the audio was closed
+    def _write(self, samples: np.ndarray) -> bool:
+        offset = 0
+        with self._cond:
+            while offset < len(samples):
+                while not self._closed and self._written - self._consumed >= self.capacity and self._written >= self._wanted:
+                    self._cond.wait()
+                if self._closed:
+                    return False
+                start = self._written % self.capacity
+                room = max(self.capacity - (self._written - self._consumed), self._wanted - self._written)
+                count = min(len(samples) - offset, self.capacity - start, room)
+                self._evict(start, count)
+                self._buffer[start:start + count] = samples[offset:offset + count]
+                self._written += count
+                offset += count
+                self._cond.notify_all()
+        return True
+
+    # the count samples at ring position start are about to be overwritten, the ones not consumed
+    # yet are written to the spill file at their position in the stream; called with the lock held
+    def _evict(self, start: int, count: int) -> None:
+        first = self._written - self.capacity
+        if first + count <= 0:
+            return
+        low = max(self._consumed, first)
+        high = first + count
+        self._dropped = max(self._dropped, min(self._consumed, high))
+        if high <= low:
+            return
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix="ingest-")
+        os.pwrite(self._spill.fileno(), self._buffer[start + low - first:start + count].tobytes(), low * 2)
+        self.spilled += high - low
+
+    # float32 copy of samples [start, end), shorter at the end of the stream
+    def read(self, start: int, end: int) -> np.ndarray:
+        start = max(0, start)
+        end = max(start, end)
+        with self._cond:
+            if self._written < end and not self._finished:
+                self._wanted = max(self._wanted, end)
+                self._cond.notify_all()
+                while self._written < end and not self._finished and not self._closed:
+                    self._cond.wait()
+            if self._closed:
+                raise ValueError(f"{self.path} is closed.")
+            if self._error is not None:
+                raise self._error
+            end = min(end, self._written)
+            start = min(start, end)
+            if start < self._dropped:
+                raise ValueError(f"samples {start}-{end} of {self.path} were consumed and are no longer in the ingest buffer.")
+            pieces = []
+            ring_start = max(start, self._written - self.capacity)
+            if start < ring_start:
+                spilled = os.pread(self._spill.fileno(), (min(end, ring_start) - start) * 2, start * 2)
+                pieces.append(np.frombuffer(spilled, dtype=np.int16))
+                start = min(end, ring_start)
+            first = start % self.capacity
+            if first + end - start <= self.capacity:
+                pieces.append(self._buffer[first:first + end - start])
+            else:
+                pieces.extend((self._buffer[first:], self._buffer[:first + end - start - self.capacity]))
+            samples = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+            return samples.astype(np.float32) / 32768.0
+
+    # the ring's samples are reused, consume() frees them
+    def release(self, start: int, end: int) -> None:
+        pass
+
+    # samples before end are not read again, the decoder may overwrite them
+    def consume(self, end: int) -> None:
+        with self._cond:
+            if end > self._consumed:
+                self._consumed = end
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._process.poll() is None:
+            self._process.kill()
+        self._thread.join()
+        self._process.wait()
+        self._process.stdout.close()
+        self._stderr.close()
+        if self._spill is not None:
+            self._spill.close()
+        self._buffer = None
+
+# duration in seconds of any container ffmpeg reads, None when ffprobe can't tell
+def probe_duration(path: str, ffmpeg: str = "ffmpeg") -> Optional[float]:
+    ffprobe = ffmpeg[:-len("ffmpeg")] + "ffprobe" if ffmpeg.endswith("ffmpeg") else "ffprobe"
+    try:
+        out = subprocess.run([ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+                             capture_output=True, text=True, timeout=30)
+        return float(out.stdout.strip()) if out.returncode == 0 else None
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+# open a wav without decoding it, other containers are decoded while they are read by a streaming ffmpeg
+def open_audio(path: str, sample_rate: int = SAMPLE_RATE, buffer_seconds: float = 1800.0):
+    try:
+        return WavReader(path, sample_rate)
+    except (ValueError, struct.error):
+        return StreamAudio(path, sample_rate, capacity_seconds=buffer_seconds)
@@ -0,0 +1,86 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List
+import torch
+from transformers import MarianMTModel, MarianTokenizer
+
+from .runtime import quantize_dynamic
+
+class TranslationBackend(ABC):
+    # A loaded translation engine behind Translator: the tokenizer is shared by every
+    # backend, generate takes padded input ids and returns the generated token ids.
+
+    name = ""
+
+    def __init__(self, model_name: str, device: str, quantize: bool = False) -> None:
+        self.model_name = model_name
+        self.device = device
+        self.quantize = quantize
+        self.tokenizer = None
+
+    # key used to cache the engine in the model registry
+    @property
+    def dtype(self) -> str:
+        return "qint8" if self.quantize else "float32"
+
+    # resident size reported to the model registry
+    @property
+    def nbytes(self) -> int:
+        return 0
+
+    @abstractmethod
+    def load(self) -> "TranslationBackend":
+        pass
+
+    @abstractmethod
+    def generate(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> List[List[int]]:
+        pass
+
+
+BACKENDS: Dict[str, Callable[..., TranslationBackend]] = {}
+
+def register_backend(name: str, factory: Callable[..., TranslationBackend]) -> None:
+    BACKENDS[name] = factory
+
+# options are backend specific, like the onnx export cache_dir
+def create_backend(name: str, model_name: str, device: str, quantize: bool = False, **options) -> TranslationBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown translation backend {name}, available: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name](model_name=model_name, device=device, quantize=quantize, **options)
+
+
+class TransformersBackend(TranslationBackend):
+    # MarianMTModel.generate in torch
+
+    name = "transformers"
+
+    def __init__(self, model_name: str, device: str, quantize: bool = False) -> None:
+        super().__init__(model_name, device, quantize)
+        self.model = None
+
+    @property
+    def nbytes(self) -> int:
+        size = sum(p.numel() * p.element_size() for p in self.model.parameters())
+        return size + sum(b.numel() * b.element_size() for b in self.model.buffers())
+
+    def load(self) -> "TransformersBackend":
+        self.tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+        model = MarianMTModel.from_pretrained(self.model_name)
+        model.to(self.device)
+        model.eval()
+        if self.quantize:
+            model = quantize_dynamic(model)
+        self.model = model
+        return self
+
+    def generate(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> List[List[int]]:
+        with torch.no_grad():
+            return self.model.generate(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device)).tolist()
+
+
+# onnxruntime is optional, the module is only imported when the backend is used
+def _onnx_backend(**kwargs) -> TranslationBackend:
+    from .onnx_backend import OnnxBackend
+    return OnnxBackend(**kwargs)
+
+register_backend(TransformersBackend.name, TransformersBackend)
+register_backend("onnx", _onnx_backend)
@@ -0,0 +1,63 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+class TaskCheckpoint:
+    # Progress of a transcription task kept in the task database: VAD groups as they
+    # are found and the segments and translations of every chunk once composed, so a
+    # restarted task only runs whisper and the translators on unfinished chunks.
+
+    def __init__(self, db, task_id: int, vad_chunks: Optional[int] = None, language: Optional[str] = None) -> None:
+        self.db = db
+        self.task_id = task_id
+        self.vad_chunks = vad_chunks
+        # language detection samples random windows, a resumed task keeps the first result
+        self.language = language
+        self.stored: Dict[int, list] = {}
+        self.chunks: Dict[int, Tuple[list, dict]] = {}
+        for row in db.find_checkpoints(task_id):
+            self.stored[row['chunk']] = json.loads(row['vad_group'])
+            if row['segments'] is not None:
+                self.chunks[row['chunk']] = (json.loads(row['segments']), json.loads(row['texts']))
+
+    def save_language(self, language: str) -> None:
+        if self.language != language:
+            self.db.set_source_language(self.task_id, language)
+            self.language = language
+
+    # every VAD group when VAD finished in a previous run
+    def groups(self) -> Optional[List[list]]:
+        if self.vad_chunks is None or any(i not in self.stored for i in range(self.vad_chunks)):
+            return None
+        return [self.stored[i] for i in range(self.vad_chunks)]
+
+    # VAD is deterministic, a different group means the audio changed and the chunk is redone
+    def save_group(self, chunk: int, group: list) -> None:
+        if self.stored.get(chunk) == group:
+            return
+        self.db.save_checkpoint_group(self.task_id, chunk, json.dumps(group))
+        self.stored[chunk] = group
+        self.chunks.pop(chunk, None)
+
+    def vad_complete(self, chunks: int) -> None:
+        if self.vad_chunks != chunks:
+            self.db.set_vad_chunks(self.task_id, chunks)
+            self.vad_chunks = chunks
+
+    # segments and texts of a finished chunk, None when it has to be processed for these languages
+    def restore(self, chunk: int, group: list, langs) -> Optional[Tuple[list, dict]]:
+        if chunk not in self.chunks or self.stored.get(chunk) != group:
+            return None
+        segments, texts = self.chunks[chunk]
+        if any(lang not in texts for lang in langs):
+            return None
+        return segments, {lang: texts[lang] for lang in langs}
+
+    def save_chunk(self, chunk: int, segments: list, texts: dict) -> None:
+        self.db.save_checkpoint_chunk(self.task_id, chunk, json.dumps(segments), json.dumps(texts))
+        self.chunks[chunk] = (segments, texts)
+
+    def clear(self) -> None:
+        self.db.delete_checkpoints(self.task_id)
+        self.stored = {}
+        self.chunks = {}
+        self.vad_chunks = None
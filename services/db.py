@@ -1,61 +1,465 @@
+import json
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from sqlite3 import Error
+from typing import Callable, List, Optional, Sequence
+
+TASK_COLUMNS = ("id, operation, language, title, file, destinationPath, process, content_hash, vad_chunks, source_language, stage, progress, "
+                "detail, created_at, started_at, finished_at, error, outputs, priority, size, attempts")
+
+# tasks.process: queued, claimed by a worker, then kept once finished until purged
+PENDING, RUNNING, DONE, FAILED = 0, 1, 2, 3
+
+# schema migrations, applied in order and tracked with pragma user_version
+MIGRATIONS = [
+    [
+        """create table if not exists tasks (
+            id integer primary key autoincrement,
+            operation text not null,
+            language text,
+            title text,
+            file text,
+            destinationPath text,
+            process integer not null default 0
+        )""",
+    ],
+    [
+        "create index if not exists tasks_process on tasks (process, operation, id)",
+    ],
+    [
+        "alter table tasks add column content_hash text",
+        """create table if not exists results (
+            content_hash text not null,
+            operation text not null,
+            language text not null,
+            model_version text not null,
+            output text not null,
+            created_at timestamp not null default current_timestamp,
+            primary key (content_hash, operation, language, model_version)
+        )""",
+    ],
+    [
+        # detected audio language and number of VAD groups once VAD finished, resumed tasks reuse them
+        "alter table tasks add column vad_chunks integer",
+        "alter table tasks add column source_language text",
+        """create table if not exists checkpoints (
+            task_id integer not null,
+            chunk integer not null,
+            vad_group text not null,
+            segments text,
+            texts text,
+            primary key (task_id, chunk)
+        )""",
+    ],
+    [
+        # stage of a running task and the fraction of it done, served with partial downloads
+        "alter table tasks add column stage text",
+        "alter table tasks add column progress real",
+    ],
+    [
+        # finished tasks stay in the table for status queries, timings feed the ETA
+        "alter table tasks add column detail text",
+        "alter table tasks add column created_at real",
+        "alter table tasks add column started_at real",
+        "alter table tasks add column finished_at real",
+        "alter table tasks add column error text",
+        "alter table tasks add column outputs text",
+        "create index if not exists tasks_content_hash on tasks (content_hash)",
+    ],
+    [
+        # completion events waiting to be delivered to the notification service
+        """create table if not exists notifications (
+            id integer primary key autoincrement,
+            payload text not null,
+            attempts integer not null default 0,
+            next_attempt_at real not null,
+            created_at real not null
+        )""",
+        "create index if not exists notifications_next_attempt on notifications (next_attempt_at)",
+    ],
+    [
+        # requested priority and job size (seconds of audio, srt cues) for the scheduling policy
+        "alter table tasks add column priority integer not null default 0",
+        "alter table tasks add column size real",
+    ],
+    [
+        # uploads of the same content attached to a queued or running task, notified with its outputs;
+        # published_at is set once they were taken, later uploads get a task of their own
+        """create table if not exists task_subscribers (
+            id integer primary key autoincrement,
+            task_id integer not null,
+            language text,
+            title text,
+            destinationPath text,
+            created_at real not null
+        )""",
+        "create index if not exists task_subscribers_task on task_subscribers (task_id)",
+        "alter table tasks add column published_at real",
+    ],
+    [
+        # failed runs of a task that was queued again, the last one's error is kept
+        "alter table tasks add column attempts integer not null default 0",
+    ],
+]
 
 class DBManager:
+    # One sqlite connection per thread in WAL mode, so readers don't block the
+    # writer and waitress threads and workers never share a cursor.
+
     def __init__(self, logger, db_file: str) -> None:
         self.logger = logger;
         self.db_file = db_file
-        self.connection = None
-        self.cursor = None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.migrate()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+        return connection
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("pragma journal_mode=wal")
+        connection.execute("pragma synchronous=normal")
+        connection.execute("pragma busy_timeout=30000")
+        connection.execute("pragma temp_store=memory")
+        connection.execute("pragma cache_size=-8000")
+        self._local.connection = connection
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    # close this thread's connection
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            self._local.connection = None
+            with self._connections_lock:
+                self._connections.remove(connection)
+            connection.close()
+
+    def close_all(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
 
-    def connect(self) -> None:
+    def migrate(self) -> None:
+        connection = self.connection
+        version = connection.execute("pragma user_version").fetchone()[0]
+        for i in range(version, len(MIGRATIONS)):
+            try:
+                connection.execute("begin immediate")
+                for statement in MIGRATIONS[i]:
+                    connection.execute(statement)
+                connection.execute(f"pragma user_version = {i + 1}")
+                connection.execute("commit")
+                self.logger.info(f"database migrated to version {i + 1}")
+            except Error as e:
+                if connection.in_transaction:
+                    connection.execute("rollback")
+                self.logger.error(f"error while migrating database to version {i + 1}: {e}")
+                raise
+
+    # statements of the block in one write transaction, taken before the first read;
+    # a transaction opened inside another one is part of it
+    @contextmanager
+    def transaction(self):
+        connection = self.connection
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("begin immediate")
+        try:
+            yield connection
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("rollback")
+            raise
+        connection.execute("commit")
+
+    def execute_query(self, query, params=()) -> int:
         try:
-            self.connection = sqlite3.connect(self.db_file)
-            self.connection.row_factory = sqlite3.Row
-            self.cursor = self.connection.cursor()
+            return self.connection.execute(query, params).rowcount
         except Error as e:
-            self.logger.error(f"error while connecting to dabase {e}")
-    
-    def close(self) -> None:
-        if self.connection:
-            self.connection.close()
-    
-    def execute_query(self, query, params=()) -> None:
+            self.logger.error(f"error while perform query {query}: {e}")
+            return 0
+
+    def execute_many(self, query, params: Sequence) -> int:
+        connection = self.connection
         try:
-            self.cursor.execute(query, params)
-            self.connection.commit()
+            connection.execute("begin immediate")
+            rowcount = connection.executemany(query, params).rowcount
+            connection.execute("commit")
+            return rowcount
         except Error as e:
+            if connection.in_transaction:
+                connection.execute("rollback")
             self.logger.error(f"error while perform query {query}: {e}")
-    
+            return 0
+
     def fetch_all(self, query, params=()):
         try:
-            self.cursor.execute(query, params)
-            rows = self.cursor.fetchall()
-            return rows
+            return self.connection.execute(query, params).fetchall()
         except Error as e:
             self.logger.error(f"error while fetching rows {query}, {e}")
             return []
-    
+
     def getTasks(self, query, params = ()):
-        self.connect()
-        tasks = self.fetch_all(query=query, params=params)
-        self.close()
-        return tasks
-    
-    def insert_task(self, data) -> None:
-        self.connect()
-        query = f"insert into tasks (operation, language, title, file, destinationPath) values (?, ?, ?, ?, ?)"
-        self.execute_query(query=query, params=data)
-        self.close()
-    
+        return self.fetch_all(query=query, params=params)
+
+    # returns the new task's id
+    def insert_task(self, data) -> Optional[int]:
+        try:
+            return self.connection.execute(self.INSERT_TASK, self._task_row(data, time.time())).lastrowid
+        except Error as e:
+            self.logger.error(f"error while perform query {self.INSERT_TASK}: {e}")
+            return None
+
+    # data is (operation, language, title, file, destinationPath[, content_hash[, priority[, size]]])
+    def insert_tasks(self, data: List[Sequence]) -> None:
+        now = time.time()
+        self.execute_many(query=self.INSERT_TASK, params=[self._task_row(row, now) for row in data])
+
+    INSERT_TASK = "insert into tasks (operation, language, title, file, destinationPath, content_hash, priority, size, created_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+    @staticmethod
+    def _task_row(row: Sequence, created_at: float) -> tuple:
+        # defaults of the optional content_hash, priority and size
+        row = tuple(row) + (None, 0, None)[max(0, len(row) - 5):]
+        return row + (created_at,)
+
     def update_task_status(self, taskId) -> None:
-        self.connect()
-        query = f"update tasks set process = ? where id = ?"
-        self.execute_query(query=query, params=(1, taskId))
-        self.close()
+        query = "update tasks set process = ? where id = ?"
+        self.execute_query(query=query, params=(RUNNING, taskId))
 
     def delete_task(self, taskId) -> None:
-        self.connect()
-        query = f"delete from tasks where id = ?"
-        self.execute_query(query=query, params=(taskId,))
-        self.close()
\ No newline at end of file
+        self.complete_tasks([taskId])
+
+    # a finished task is kept with its outputs or error, its checkpoints are dropped
+    def finish_task(self, taskId: int, error: Optional[str] = None, outputs: Optional[dict] = None) -> None:
+        self.execute_query(query="delete from checkpoints where task_id = ?", params=(taskId,))
+        query = "update tasks set process = ?, finished_at = ?, error = ?, outputs = ?, stage = ?, detail = null where id = ?"
+        status = DONE if error is None else FAILED
+        self.execute_query(query=query, params=(status, time.time(), error, json.dumps(outputs) if outputs else None, "done" if error is None else "failed", taskId))
+
+    # a failed task is queued again keeping its checkpoints, so the next run resumes where it stopped
+    def retry_task(self, taskId: int, error: str) -> None:
+        query = "update tasks set process = ?, attempts = attempts + 1, error = ?, stage = ?, detail = null where id = ?"
+        self.execute_query(query=query, params=(PENDING, error, "queued", taskId))
+
+    # finished tasks older than the retention are removed
+    def purge_tasks(self, finished_before: float) -> int:
+        self.execute_query(query="delete from task_subscribers where task_id in (select id from tasks where process in (?, ?) and finished_at < ?)", params=(DONE, FAILED, finished_before))
+        query = "delete from tasks where process in (?, ?) and finished_at < ?"
+        return self.execute_query(query=query, params=(DONE, FAILED, finished_before))
+
+    # finished tasks are removed from the queue with their checkpoints
+    def complete_tasks(self, taskIds: List[int]) -> None:
+        self.execute_many(query="delete from checkpoints where task_id = ?", params=[(taskId,) for taskId in taskIds])
+        query = "delete from tasks where id = ?"
+        self.execute_many(query=query, params=[(taskId,) for taskId in taskIds])
+
+    # atomically take the oldest pending task of an operation, marking it as in process;
+    # pick chooses among the pending tasks instead, like a scheduling policy.
+    # A task waits while another one of the same operation runs on its content, both would write the same outputs
+    def claim_task(self, operation: str, pick: Optional[Callable] = None):
+        if pick is not None:
+            return self._claim_picked(operation, pick)
+        tasks = self.claim_tasks(operation, limit=1)
+        return tasks[0] if len(tasks) > 0 else None
+
+    # candidates are the oldest pending tasks, so aged ones are always among them
+    def _claim_picked(self, operation: str, pick: Callable, candidates: int = 1000):
+        connection = self.connection
+        try:
+            connection.execute("begin immediate")
+            tasks = connection.execute(f"select {TASK_COLUMNS} from tasks where process = ? and operation = ? and {self.NOT_RUNNING_CONTENT} order by id limit ?", (PENDING, operation, RUNNING, candidates)).fetchall()
+            task = pick(tasks) if len(tasks) > 0 else None
+            if task is not None:
+                connection.execute("update tasks set process = ?, started_at = ? where id = ?", (RUNNING, time.time(), task['id']))
+            connection.execute("commit")
+            return task
+        except Error as e:
+            self.logger.error(f"error while claiming {operation} task: {e}")
+            if connection.in_transaction:
+                connection.execute("rollback")
+            return None
+
+    NOT_RUNNING_CONTENT = ("(content_hash is null or not exists (select 1 from tasks running where running.process = ? "
+                           "and running.operation = tasks.operation and running.content_hash = tasks.content_hash))")
+
+    def claim_tasks(self, operation: str, limit: int):
+        connection = self.connection
+        try:
+            # begin immediate takes the write lock before reading, so two claims can't return the same row
+            connection.execute("begin immediate")
+            tasks = connection.execute(f"select {TASK_COLUMNS} from tasks where process = ? and operation = ? and {self.NOT_RUNNING_CONTENT} order by id limit ?", (PENDING, operation, RUNNING, limit)).fetchall()
+            if len(tasks) > 0:
+                now = time.time()
+                connection.executemany("update tasks set process = ?, started_at = ? where id = ?", [(RUNNING, now, task['id']) for task in tasks])
+            connection.execute("commit")
+            return tasks
+        except Error as e:
+            self.logger.error(f"error while claiming {operation} task: {e}")
+            if connection.in_transaction:
+                connection.execute("rollback")
+            return []
+
+    # attach an upload to the oldest queued or running task of the same content and operation producing every
+    # language asked for, returns its id or None when there is none and a task has to be inserted
+    def attach_to_task(self, content_hash: str, operation: str, languages: Sequence[str], title: str, destinationPath: str) -> Optional[int]:
+        try:
+            # the task can't publish its outputs between the lookup and the insert
+            with self.transaction() as connection:
+                query = "select id, language from tasks where content_hash = ? and operation = ? and process in (?, ?) and published_at is null order by id"
+                task_id = None
+                for row in connection.execute(query, (content_hash, operation, PENDING, RUNNING)).fetchall():
+                    if set(languages) <= set(l.strip() for l in (row['language'] or "").split(",")):
+                        task_id = row['id']
+                        break
+                if task_id is not None:
+                    connection.execute("insert into task_subscribers (task_id, language, title, destinationPath, created_at) values (?, ?, ?, ?, ?)",
+                                       (task_id, ",".join(languages), title, destinationPath, time.time()))
+                return task_id
+        except Error as e:
+            self.logger.error(f"error while attaching to a {operation} task of {content_hash}: {e}")
+            return None
+
+    # uploads attached to a task, taken once its outputs are ready; nothing attaches to it afterwards
+    def take_subscribers(self, task_id: int):
+        connection = self.connection
+        try:
+            connection.execute("begin immediate")
+            rows = connection.execute("select language, title, destinationPath from task_subscribers where task_id = ? order by id", (task_id,)).fetchall()
+            connection.execute("delete from task_subscribers where task_id = ?", (task_id,))
+            connection.execute("update tasks set published_at = ? where id = ?", (time.time(), task_id))
+            connection.execute("commit")
+            return rows
+        except Error as e:
+            self.logger.error(f"error while taking the subscribers of task {task_id}: {e}")
+            if connection.in_transaction:
+                connection.execute("rollback")
+            return []
+
+    # tasks left in process by a worker that died are queued again
+    def reset_claimed_tasks(self) -> int:
+        query = "update tasks set process = ? where process = ?"
+        return self.execute_query(query=query, params=(PENDING, RUNNING))
+
+    # output of a previous task for the same content, operation, language and models
+    def find_result(self, content_hash: str, operation: str, language: str, model_version: str):
+        query = "select output from results where content_hash = ? and operation = ? and language = ? and model_version = ?"
+        rows = self.fetch_all(query=query, params=(content_hash, operation, language, model_version))
+        return rows[0]['output'] if len(rows) > 0 else None
+
+    def save_result(self, content_hash: str, operation: str, language: str, model_version: str, output: str) -> None:
+        query = "insert or replace into results (content_hash, operation, language, model_version, output) values (?, ?, ?, ?, ?)"
+        self.execute_query(query=query, params=(content_hash, operation, language, model_version, output))
+
+    def delete_result(self, content_hash: str, operation: str, language: str, model_version: str) -> None:
+        query = "delete from results where content_hash = ? and operation = ? and language = ? and model_version = ?"
+        self.execute_query(query=query, params=(content_hash, operation, language, model_version))
+
+    def find_checkpoints(self, task_id: int):
+        query = "select chunk, vad_group, segments, texts from checkpoints where task_id = ? order by chunk"
+        return self.fetch_all(query=query, params=(task_id,))
+
+    # a VAD group found for a chunk, replacing whatever was stored for it before
+    def save_checkpoint_group(self, task_id: int, chunk: int, vad_group: str) -> None:
+        query = "insert or replace into checkpoints (task_id, chunk, vad_group) values (?, ?, ?)"
+        self.execute_query(query=query, params=(task_id, chunk, vad_group))
+
+    def save_checkpoint_chunk(self, task_id: int, chunk: int, segments: str, texts: str) -> None:
+        query = "update checkpoints set segments = ?, texts = ? where task_id = ? and chunk = ?"
+        self.execute_query(query=query, params=(segments, texts, task_id, chunk))
+
+    def set_vad_chunks(self, task_id: int, chunks: int) -> None:
+        query = "update tasks set vad_chunks = ? where id = ?"
+        self.execute_query(query=query, params=(chunks, task_id))
+
+    def set_source_language(self, task_id: int, language: str) -> None:
+        query = "update tasks set source_language = ? where id = ?"
+        self.execute_query(query=query, params=(language, task_id))
+
+    # detail is the position inside the stage, like the chunk being composed
+    def set_task_progress(self, task_id: int, stage: str, progress: float, detail: Optional[str] = None) -> None:
+        query = "update tasks set stage = ?, progress = ?, detail = ? where id = ?"
+        self.execute_query(query=query, params=(stage, progress, detail, task_id))
+
+    # oldest queued or running task of an uploaded content, the latest finished one otherwise
+    def find_task_by_content(self, content_hash: str):
+        query = f"select {TASK_COLUMNS} from tasks where content_hash = ? order by process in (?, ?), case when process in (?, ?) then id else -id end limit 1"
+        rows = self.fetch_all(query=query, params=(content_hash, DONE, FAILED, PENDING, RUNNING))
+        return rows[0] if len(rows) > 0 else None
+
+    def find_task(self, task_id: int):
+        rows = self.fetch_all(query=f"select {TASK_COLUMNS} from tasks where id = ?", params=(task_id,))
+        return rows[0] if len(rows) > 0 else None
+
+    # newest first, optionally only tasks in the given states
+    def find_tasks(self, states: Sequence[int] = (), limit: int = 100):
+        where = f"where process in ({', '.join('?' * len(states))})" if len(states) > 0 else ""
+        return self.fetch_all(query=f"select {TASK_COLUMNS} from tasks {where} order by id desc limit ?", params=(*states, limit))
+
+    def find_pending(self, operation: str):
+        return self.fetch_all(query=f"select {TASK_COLUMNS} from tasks where process = ? and operation = ? order by id", params=(PENDING, operation))
+
+    # (seconds, size) of the latest successful tasks of an operation
+    def recent_throughput(self, operation: str, limit: int = 20) -> List[tuple]:
+        query = "select finished_at - started_at as seconds, size from tasks where process = ? and operation = ? and started_at is not null and size > 0 order by finished_at desc limit ?"
+        return [(row['seconds'], row['size']) for row in self.fetch_all(query=query, params=(DONE, operation, limit))]
+
+    # (operation, process, count) of the queued and running tasks
+    def count_active_tasks(self) -> List[tuple]:
+        rows = self.fetch_all(query="select operation, process, count(*) as total from tasks where process in (?, ?) group by operation, process", params=(PENDING, RUNNING))
+        return [(row['operation'], row['process'], row['total']) for row in rows]
+
+    # queued tasks of an operation claimed before the given one
+    def count_pending_before(self, operation: str, task_id: int) -> int:
+        rows = self.fetch_all(query="select count(*) as total from tasks where process = ? and operation = ? and id < ?", params=(PENDING, operation, task_id))
+        return rows[0]['total']
+
+    # seconds spent by the latest successful tasks of an operation
+    def recent_durations(self, operation: str, limit: int = 20) -> List[float]:
+        query = "select finished_at - started_at as seconds from tasks where process = ? and operation = ? and started_at is not null order by finished_at desc limit ?"
+        return [row['seconds'] for row in self.fetch_all(query=query, params=(DONE, operation, limit))]
+
+    def delete_checkpoints(self, task_id: int) -> None:
+        self.execute_query(query="delete from checkpoints where task_id = ?", params=(task_id,))
+        self.set_vad_chunks(task_id, None)
+
+    def enqueue_notification(self, payload: str) -> None:
+        now = time.time()
+        query = "insert into notifications (payload, next_attempt_at, created_at) values (?, ?, ?)"
+        self.execute_query(query=query, params=(payload, now, now))
+
+    # oldest notifications due for delivery
+    def due_notifications(self, now: float, limit: int):
+        query = "select id, payload, attempts, created_at from notifications where next_attempt_at <= ? order by id limit ?"
+        return self.fetch_all(query=query, params=(now, limit))
+
+    # when the next notification is due, None if there are none
+    def next_notification_at(self):
+        rows = self.fetch_all(query="select min(next_attempt_at) as next from notifications")
+        return rows[0]['next']
+
+    def retry_notifications(self, ids: List[int], next_attempt_at: float) -> None:
+        query = "update notifications set attempts = attempts + 1, next_attempt_at = ? where id = ?"
+        self.execute_many(query=query, params=[(next_attempt_at, id) for id in ids])
+
+    def delete_notifications(self, ids: List[int]) -> None:
+        self.execute_many(query="delete from notifications where id = ?", params=[(id,) for id in ids])
+
+    # pending or running tasks still using a file
+    def count_tasks_for_file(self, file: str) -> int:
+        rows = self.fetch_all(query="select count(*) as total from tasks where file = ? and process in (?, ?)", params=(file, PENDING, RUNNING))
+        return rows[0]['total']
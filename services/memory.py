@@ -0,0 +1,109 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from sqlite3 import Error
+from typing import Dict, List
+
+class TranslationMemory:
+    # Persistent cache of (opus-mt model name, normalized source text) -> translation,
+    # shared between tasks. Least recently used entries are evicted over max_entries.
+
+    def __init__(self, logger, db_file: str, max_entries: int = 500000) -> None:
+        self.logger = logger
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.connection.execute("pragma journal_mode=wal")
+        self.connection.execute("pragma synchronous=normal")
+        self.connection.execute("create table if not exists translation_memory (key text primary key, translation text not null, last_used real not null)")
+        self.connection.execute("create index if not exists translation_memory_last_used on translation_memory (last_used)")
+        self.connection.commit()
+        self.entries = self.connection.execute("select count(*) from translation_memory").fetchone()[0]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return unicodedata.normalize("NFC", " ".join(text.split()))
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    # lookup normalized texts, returns only the ones found
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[str, str]:
+        if len(texts) == 0:
+            return {}
+        keys = {self.key(model_name, text): text for text in texts}
+        found = {}
+        with self._lock:
+            try:
+                key_list = list(keys.keys())
+                # keep under sqlite's host parameter limit
+                for i in range(0, len(key_list), 500):
+                    batch = key_list[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self.connection.execute(f"select key, translation from translation_memory where key in ({placeholders})", batch).fetchall()
+                    for key, translation in rows:
+                        found[keys[key]] = translation
+                if len(found) > 0:
+                    now = time.time()
+                    self.connection.executemany("update translation_memory set last_used = ? where key = ?",
+                                                [(now, self.key(model_name, text)) for text in found])
+                    self.connection.commit()
+            except Error as e:
+                self.logger.error(f"error while reading translation memory: {e}")
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model_name: str, translations: Dict[str, str]) -> None:
+        if len(translations) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self.connection.executemany("insert or replace into translation_memory (key, translation, last_used) values (?, ?, ?)",
+                                            [(self.key(model_name, text), translation, now) for text, translation in translations.items()])
+                self.entries += len(translations)
+                if self.entries > self.max_entries:
+                    self._evict()
+                self.connection.commit()
+            except Error as e:
+                self.logger.error(f"error while writing translation memory: {e}")
+
+    def get(self, model_name: str, text: str):
+        return self.get_many(model_name, [text]).get(text)
+
+    def put(self, model_name: str, text: str, translation: str) -> None:
+        self.put_many(model_name, {text: translation})
+
+    # must be called with self._lock held
+    def _evict(self) -> None:
+        self.entries = self.connection.execute("select count(*) from translation_memory").fetchone()[0]
+        # evict down to 90% so we don't evict on every insert
+        excess = self.entries - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self.connection.execute("delete from translation_memory where key in (select key from translation_memory order by last_used limit ?)", (excess,))
+        self.entries -= excess
+        self.evictions += excess
+        self.logger.info(f"translation memory evicted {excess} entries.")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups > 0 else 0.0,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
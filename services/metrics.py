@@ -0,0 +1,257 @@
+import bisect
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .logging import Logger
+
+# upper bounds in seconds of the stage duration buckets, from a translation batch to a feature transcription
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+
+HELP = {
+    "llm_stage_seconds": ("histogram", "Seconds spent in each stage: model_load, ingest, detect_language, vad, decode, translate, generate, compose, notification, queue_wait, task."),
+    "llm_tasks_total": ("counter", "Finished tasks by operation and status."),
+    "llm_audio_seconds_total": ("counter", "Seconds of audio transcribed."),
+    "llm_transcript_seconds_total": ("counter", "Wall seconds spent transcribing, audio seconds per wall second is the realtime factor."),
+    "llm_translated_lines_total": ("counter", "Lines translated, including lines found in the translation memory."),
+    "llm_generated_tokens_total": ("counter", "Tokens generated by the translation model."),
+    "llm_translation_tokens_per_second": ("gauge", "Generated tokens per second of the latest translation batch."),
+    "llm_notifications_total": ("counter", "Notification deliveries by result."),
+    "llm_queue_depth": ("gauge", "Tasks by operation and state."),
+    "llm_model_resident_bytes": ("gauge", "Estimated size of the models loaded in the registry."),
+    "llm_process_peak_rss_bytes": ("gauge", "Peak resident memory of the process."),
+    "llm_cuda_peak_allocated_bytes": ("gauge", "Peak memory allocated by torch on each cuda device."),
+}
+
+# trace of the task the current thread works for, copied into pipeline threads
+_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+_NOOP = _Noop()
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "labels", "started")
+
+    def __init__(self, metrics, stage: str, labels: dict) -> None:
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, self.started, **self.labels)
+
+class Trace:
+    # Spans of one task, dumped in the chrome trace event format (chrome://tracing, ui.perfetto.dev).
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, started: float, seconds: float, labels: dict) -> None:
+        span = {"name": stage, "ph": "X", "pid": 0, "tid": threading.current_thread().name,
+                "ts": round((started - self.started) * 1e6), "dur": round(seconds * 1e6), "args": labels}
+        with self._lock:
+            self.spans.append(span)
+
+    def dump(self, path: str) -> None:
+        with self._lock:
+            events = list(self.spans)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "otherData": {"task": self.name}}, f)
+        os.replace(tmp, path)
+
+class Metrics:
+    # Process wide timers, counters and gauges exposed at /metrics in the prometheus text
+    # format. Disabled, timers are a shared no-op and updates return right away. With a
+    # trace directory, the stages timed while a task runs are also written to a trace file.
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(Metrics, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.enabled = False
+        self.trace_dir: Optional[str] = None
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        # labels with the stage -> [count per bucket..., count above the last, sum, count]
+        self._histograms: Dict[LabelKey, List[float]] = {}
+        # called on every scrape, return (name, labels, value) of gauges computed on demand
+        self._collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+    def configure(self, enabled: bool = True, trace_dir: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.trace_dir = trace_dir or None
+        if self.trace_dir is not None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+
+    def register(self, collector: Callable[[], Iterable[Tuple[str, dict, float]]]) -> None:
+        self._collectors.append(collector)
+
+    # with Metrics().timer("decode"): ... records the block's duration under stage="decode"
+    def timer(self, stage: str, **labels):
+        if not self.enabled:
+            return _NOOP
+        return _Timer(self, stage, labels)
+
+    # started is the perf_counter the stage began at, used to place it in the task's trace
+    def observe(self, stage: str, seconds: float, started: Optional[float] = None, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (("stage", stage),) + (tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ())
+        # slot len(BUCKETS) holds the ones above the last bound, only counted in +Inf
+        slot = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0.0] * (len(BUCKETS) + 3)
+            values[slot] += 1
+            values[-2] += seconds
+            values[-1] += 1
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(stage, started if started is not None else time.perf_counter() - seconds, seconds, labels)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    # stages timed inside the block, from any thread started in it, are dumped to <trace_dir>/<name>.json
+    @contextmanager
+    def trace(self, name: str):
+        if not self.enabled or self.trace_dir is None:
+            yield None
+            return
+        trace = Trace(name)
+        token = _trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _trace.reset(token)
+            try:
+                trace.dump(self.trace_path(name))
+            except OSError as e:
+                Logger().error(f"error writing trace {name}: {e}")
+
+    def trace_path(self, name: str) -> Optional[str]:
+        if self.trace_dir is None:
+            return None
+        return os.path.join(self.trace_dir, f"{os.path.basename(name)}.json")
+
+    # count and seconds per stage and the counters, summed over their other labels
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages: Dict[str, dict] = {}
+            for labels, values in self._histograms.items():
+                stage = stages.setdefault(labels[0][1], {"count": 0, "seconds": 0.0})
+                stage["count"] += int(values[-1])
+                stage["seconds"] += values[-2]
+            counters: Dict[str, float] = {}
+            for (name, _), value in self._counters.items():
+                counters[name] = counters.get(name, 0.0) + value
+        return {"stages": stages, "counters": counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    # text exposition format
+    def expose(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        for collector in self._collectors + [self._process_gauges]:
+            try:
+                for name, labels, value in collector():
+                    gauges[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+            except Exception as e:
+                Logger().error(f"error collecting metrics: {e}")
+
+        families: Dict[str, List[str]] = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), value in gauges.items():
+            families.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for labels, values in sorted(histograms.items()):
+            lines = families.setdefault("llm_stage_seconds", [])
+            cumulative = 0.0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f"llm_stage_seconds_bucket{_labels(labels + (('le', _number(bound)),))} {_number(cumulative)}")
+            lines.append(f"llm_stage_seconds_bucket{_labels(labels + (('le', '+Inf'),))} {_number(values[-1])}")
+            lines.append(f"llm_stage_seconds_sum{_labels(labels)} {_number(values[-2])}")
+            lines.append(f"llm_stage_seconds_count{_labels(labels)} {_number(values[-1])}")
+
+        out = []
+        for name in sorted(families):
+            kind, description = HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {description}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(sorted(families[name]) if kind != "histogram" else families[name])
+        return "\n".join(out) + "\n"
+
+    # memory of the process, cuda only when torch was imported by a task already
+    @staticmethod
+    def _process_gauges() -> Iterable[Tuple[str, dict, float]]:
+        from .registry import ModelRegistry
+        yield "llm_model_resident_bytes", {}, ModelRegistry().resident_bytes()
+        # ru_maxrss is in KB on linux, bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        yield "llm_process_peak_rss_bytes", {}, peak if sys.platform == "darwin" else peak * 1024
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+            for device in range(torch.cuda.device_count()):
+                yield "llm_cuda_peak_allocated_bytes", {"device": f"cuda:{device}"}, torch.cuda.max_memory_allocated(device)
+
+def _labels(labels: LabelKey) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
@@ -0,0 +1,123 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import Metrics
+
+class Notifier:
+    # Delivers task events to the notification service from a background thread.
+    # Events are stored in the task database before anything is sent, so a worker
+    # never waits on the network and events survive restarts. Events queued close
+    # together go out in one post, failed posts are retried with exponential backoff.
+
+    def __init__(self, logger, db, url: str, batch_size: int = 1, batch_window: float = 0.2, timeout: float = 10.0,
+                 backoff: float = 1.0, max_backoff: float = 300.0, max_age: float = 24 * 3600, pool_size: int = 2) -> None:
+        self.logger = logger
+        self.db = db
+        self.url = url
+        # a single event is posted as is, several as {"events": [...]}; batching is opt-in, 1 never batches
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # undelivered events older than this are dropped
+        self.max_age = max_age
+        # keep-alive connections to the service, reused by every post
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> "Notifier":
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+        return self
+
+    # queue an event, returns as soon as it is stored
+    def send(self, payload: dict) -> None:
+        self.db.enqueue_notification(json.dumps(payload))
+        self._wake.set()
+
+    # events not delivered yet stay queued for the next start
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.session.close()
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retried": self.retried, "dropped": self.dropped}
+
+    def _run(self) -> None:
+        backlog = False
+        while not self._stopped.is_set():
+            self._wake.clear()
+            next_at = self.db.next_notification_at()
+            if next_at is None:
+                self._wake.wait()
+                continue
+            if next_at > time.time():
+                self._wake.wait(timeout=next_at - time.time())
+                continue
+            # let a burst of events queue up behind the first one, unless a backlog fills the batches already
+            if self.batch_window > 0 and not backlog:
+                self._stopped.wait(self.batch_window)
+            try:
+                backlog = self._deliver() >= self.batch_size
+            except Exception as e:
+                backlog = False
+                self.logger.error(f"error delivering notifications: {e}")
+                self._stopped.wait(self.backoff)
+
+    # posts the due events, returns how many were taken
+    def _deliver(self) -> int:
+        now = time.time()
+        events = self.db.due_notifications(now, self.batch_size)
+        if len(events) == 0:
+            return 0
+        payloads = [json.loads(event['payload']) for event in events]
+        ids = [event['id'] for event in events]
+        permanent = False
+        metrics = Metrics()
+        try:
+            with metrics.timer("notification"):
+                response = self.session.post(self.url, json=payloads[0] if len(payloads) == 1 else {"events": payloads}, timeout=self.timeout)
+            error = None if response.status_code < 400 else f"status {response.status_code}"
+            # the service rejected the events, sending them again won't help
+            permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if error is None:
+            self.db.delete_notifications(ids)
+            self.sent += len(ids)
+            metrics.inc("llm_notifications_total", len(ids), result="sent")
+            self.logger.info(f"{len(ids)} notifications sent.")
+            return len(ids)
+        expired = [event['id'] for event in events if permanent or now - event['created_at'] > self.max_age]
+        if len(expired) > 0:
+            self.db.delete_notifications(expired)
+            self.dropped += len(expired)
+            metrics.inc("llm_notifications_total", len(expired), result="dropped")
+            self.logger.error(f"dropped {len(expired)} notifications: {error}")
+        retry = [id for id in ids if id not in expired]
+        if len(retry) > 0:
+            attempts = max(event['attempts'] for event in events)
+            # jitter keeps replicas from retrying in step
+            delay = min(self.max_backoff, self.backoff * 2 ** attempts) * random.uniform(0.5, 1.0)
+            self.db.retry_notifications(retry, now + delay)
+            self.retried += len(retry)
+            metrics.inc("llm_notifications_total", len(retry), result="retried")
+            self.logger.error(f"error sending {len(retry)} notifications, retrying in {delay:.1f}s: {error}")
+        return len(ids)
@@ -0,0 +1,335 @@
+import hashlib
+import os
+import shutil
+import uuid
+from typing import List
+import numpy as np
+import torch
+from transformers import GenerationConfig, MarianMTModel, MarianTokenizer
+
+from .backends import TranslationBackend
+
+# [batch, length, dim] -> [batch, heads, length, head_dim]
+def _split_heads(x: torch.Tensor, heads: int) -> torch.Tensor:
+    return x.reshape(x.size(0), x.size(1), heads, -1).transpose(1, 2)
+
+def _attend(attention, query: torch.Tensor, key: torch.Tensor, value: torch.Tensor, bias=None) -> torch.Tensor:
+    weights = torch.matmul(query, key.transpose(2, 3)) * attention.scaling
+    if bias is not None:
+        weights = weights + bias
+    output = torch.matmul(torch.softmax(weights, dim=-1), value)
+    output = output.transpose(1, 2)
+    return attention.out_proj(output.reshape(output.size(0), output.size(1), -1))
+
+def _feed_forward(layer, hidden: torch.Tensor) -> torch.Tensor:
+    return layer.final_layer_norm(hidden + layer.fc2(layer.activation_fn(layer.fc1(hidden))))
+
+def _padding_bias(attention_mask: torch.Tensor) -> torch.Tensor:
+    return (1.0 - attention_mask[:, None, None, :].to(torch.float32)) * torch.finfo(torch.float32).min
+
+class MarianEncoderGraph(torch.nn.Module):
+    # encoder pass returning the cross attention keys and values of every decoder layer,
+    # they don't change while decoding so they are computed once per batch
+
+    def __init__(self, model: MarianMTModel) -> None:
+        super().__init__()
+        self.encoder = model.get_encoder()
+        self.cross_attentions = torch.nn.ModuleList(layer.encoder_attn for layer in model.get_decoder().layers)
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        encoder = self.encoder
+        positions = torch.arange(input_ids.size(1), device=input_ids.device)
+        hidden = encoder.embed_tokens(input_ids) * encoder.embed_scale + encoder.embed_positions.weight.index_select(0, positions)
+        bias = _padding_bias(attention_mask)
+        for layer in encoder.layers:
+            attention = layer.self_attn
+            heads = attention.num_heads
+            output = _attend(attention, _split_heads(attention.q_proj(hidden), heads),
+                             _split_heads(attention.k_proj(hidden), heads), _split_heads(attention.v_proj(hidden), heads), bias)
+            hidden = _feed_forward(layer, layer.self_attn_layer_norm(hidden + output))
+        outputs = []
+        for attention in self.cross_attentions:
+            outputs.append(_split_heads(attention.k_proj(hidden), attention.num_heads))
+            outputs.append(_split_heads(attention.v_proj(hidden), attention.num_heads))
+        return tuple(outputs)
+
+class MarianDecoderGraph(torch.nn.Module):
+    # one decoding step for a single new token, self attention keys and values of the
+    # previous steps come in as past_* and go out with the new token appended as present_*
+
+    def __init__(self, model: MarianMTModel) -> None:
+        super().__init__()
+        self.decoder = model.get_decoder()
+        self.lm_head = model.lm_head
+        self.register_buffer("final_logits_bias", model.final_logits_bias)
+
+    def forward(self, input_ids: torch.Tensor, position: torch.Tensor, attention_mask: torch.Tensor, *cache):
+        decoder = self.decoder
+        layers = len(decoder.layers)
+        past, cross = cache[:2 * layers], cache[2 * layers:]
+        hidden = decoder.embed_tokens(input_ids) * decoder.embed_scale + decoder.embed_positions.weight.index_select(0, position)
+        bias = _padding_bias(attention_mask)
+        presents = []
+        for i, layer in enumerate(decoder.layers):
+            attention = layer.self_attn
+            heads = attention.num_heads
+            key = torch.cat([past[2 * i], _split_heads(attention.k_proj(hidden), heads)], dim=2)
+            value = torch.cat([past[2 * i + 1], _split_heads(attention.v_proj(hidden), heads)], dim=2)
+            presents += [key, value]
+            hidden = layer.self_attn_layer_norm(hidden + _attend(attention, _split_heads(attention.q_proj(hidden), heads), key, value))
+            attention = layer.encoder_attn
+            output = _attend(attention, _split_heads(attention.q_proj(hidden), heads), cross[2 * i], cross[2 * i + 1], bias)
+            hidden = _feed_forward(layer, layer.encoder_attn_layer_norm(hidden + output))
+        logits = self.lm_head(hidden)[:, -1] + self.final_logits_bias
+        return (logits, *presents)
+
+
+class OnnxBackend(TranslationBackend):
+    # opus-mt exported once to an encoder and a single step decoder graph, cached on disk,
+    # decoded with greedy or beam search in onnxruntime reusing the self attention cache.
+    # Decoding follows the model generation config the same way MarianMTModel.generate does.
+
+    name = "onnx"
+    OPSET = 17
+
+    def __init__(self, model_name: str, device: str, quantize: bool = False, cache_dir: str = "./media/onnx") -> None:
+        super().__init__(model_name, device, quantize)
+        self.cache_dir = cache_dir
+        self.encoder = None
+        self.decoder = None
+        self.config = None
+
+    @property
+    def dtype(self) -> str:
+        return f"onnx-{super().dtype}"
+
+    @property
+    def export_dir(self) -> str:
+        source = os.path.abspath(self.model_name) if os.path.isdir(self.model_name) else self.model_name
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.cache_dir, f"{os.path.basename(source.rstrip('/'))}-{digest}")
+
+    def _graph(self, name: str) -> str:
+        suffix = ".int8.onnx" if self.quantize else ".onnx"
+        return os.path.join(self.export_dir, name + suffix)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(self._graph(name)) for name in ("encoder", "decoder"))
+
+    def load(self) -> "OnnxBackend":
+        import onnxruntime as ort
+
+        if not os.path.exists(os.path.join(self.export_dir, "decoder.onnx")):
+            self.export()
+        if self.quantize and not os.path.exists(self._graph("decoder")):
+            self._quantize()
+        self.tokenizer = MarianTokenizer.from_pretrained(self.export_dir)
+        self.config = self._generation_config()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        providers = ["CPUExecutionProvider"]
+        if self.device.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.encoder = ort.InferenceSession(self._graph("encoder"), options, providers=providers)
+        self.decoder = ort.InferenceSession(self._graph("decoder"), options, providers=providers)
+        return self
+
+    # decoding settings with the defaults generate uses for the ones the model doesn't set
+    def _generation_config(self) -> GenerationConfig:
+        config = GenerationConfig.from_pretrained(self.export_dir)
+        defaults = {"num_beams": 1, "max_length": 20, "min_length": 0, "length_penalty": 1.0, "early_stopping": False}
+        for name, value in defaults.items():
+            if getattr(config, name, None) is None:
+                setattr(config, name, value)
+        if config.max_new_tokens is not None:
+            config.max_length = config.max_new_tokens + 1
+        return config
+
+    # export both graphs to a temporary directory moved in place when complete
+    def export(self) -> None:
+        model = MarianMTModel.from_pretrained(self.model_name)
+        model.eval()
+        tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+        layers = model.config.decoder_layers
+        heads = model.config.decoder_attention_heads
+        head_dim = model.config.d_model // heads
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_dir = os.path.join(self.cache_dir, f".export-{uuid.uuid4().hex}")
+        os.makedirs(temp_dir)
+        try:
+            input_ids = torch.tensor([[5, 6, 7, model.config.eos_token_id]] * 2)
+            attention_mask = torch.ones_like(input_ids)
+            cache_names = [f"cross_{kind}_{i}" for i in range(layers) for kind in ("key", "value")]
+            with torch.no_grad():
+                cross = MarianEncoderGraph(model)(input_ids, attention_mask)
+                torch.onnx.export(MarianEncoderGraph(model), (input_ids, attention_mask), os.path.join(temp_dir, "encoder.onnx"),
+                                  input_names=["input_ids", "attention_mask"], output_names=cache_names,
+                                  dynamic_axes={"input_ids": {0: "batch", 1: "source"}, "attention_mask": {0: "batch", 1: "source"},
+                                                **{name: {0: "batch", 2: "source"} for name in cache_names}},
+                                  opset_version=self.OPSET, dynamo=False)
+
+                past_names = [f"past_{kind}_{i}" for i in range(layers) for kind in ("key", "value")]
+                present_names = [f"present_{kind}_{i}" for i in range(layers) for kind in ("key", "value")]
+                past = [torch.zeros(2, heads, 3, head_dim) for _ in past_names]
+                torch.onnx.export(MarianDecoderGraph(model), (input_ids[:, :1], torch.tensor([3]), attention_mask, *past, *cross),
+                                  os.path.join(temp_dir, "decoder.onnx"),
+                                  input_names=["input_ids", "position", "attention_mask", *past_names, *cache_names],
+                                  output_names=["logits", *present_names],
+                                  dynamic_axes={"input_ids": {0: "batch"}, "attention_mask": {0: "batch", 1: "source"},
+                                                **{name: {0: "batch", 2: "past"} for name in past_names},
+                                                **{name: {0: "batch", 2: "source"} for name in cache_names},
+                                                **{name: {0: "batch", 2: "target"} for name in present_names},
+                                                "logits": {0: "batch"}},
+                                  opset_version=self.OPSET, dynamo=False)
+            tokenizer.save_pretrained(temp_dir)
+            model.generation_config.save_pretrained(temp_dir)
+            os.replace(temp_dir, self.export_dir)
+        except OSError:
+            # exported by another process in the meantime
+            if not os.path.exists(os.path.join(self.export_dir, "decoder.onnx")):
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _quantize(self) -> None:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        for name in ("encoder", "decoder"):
+            temp_path = os.path.join(self.export_dir, f".{name}-{uuid.uuid4().hex}.onnx")
+            quantize_dynamic(os.path.join(self.export_dir, name + ".onnx"), temp_path, weight_type=QuantType.QInt8)
+            os.replace(temp_path, self._graph(name))
+
+    def generate(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> List[List[int]]:
+        input_ids = input_ids.cpu().numpy().astype(np.int64)
+        attention_mask = attention_mask.cpu().numpy().astype(np.int64)
+        cross = self.encoder.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})
+        if self.config.num_beams > 1:
+            sequences = self._beam_search(attention_mask, cross)
+        else:
+            sequences = self._greedy(attention_mask, cross)
+        eos = self.config.eos_token_id
+        return [row[:row.index(eos) + 1] if eos in row else row for row in sequences.tolist()]
+
+    def _step(self, tokens: np.ndarray, position: int, attention_mask: np.ndarray, past: List[np.ndarray], cross: List[np.ndarray]):
+        feed = {"input_ids": tokens[:, None], "position": np.array([position], dtype=np.int64), "attention_mask": attention_mask}
+        for i in range(len(past) // 2):
+            feed[f"past_key_{i}"], feed[f"past_value_{i}"] = past[2 * i], past[2 * i + 1]
+            feed[f"cross_key_{i}"], feed[f"cross_value_{i}"] = cross[2 * i], cross[2 * i + 1]
+        logits, *presents = self.decoder.run(None, feed)
+        return logits.astype(np.float32), presents
+
+    def _empty_cache(self, batch: int, cross: List[np.ndarray]) -> List[np.ndarray]:
+        return [np.zeros((batch, c.shape[1], 0, c.shape[3]), dtype=c.dtype) for c in cross]
+
+    # the logits processors generate applies for opus-mt: bad words, min length and forced eos
+    def _process(self, scores: np.ndarray, length: int) -> np.ndarray:
+        config = self.config
+        for ids in config.bad_words_ids or []:
+            if len(ids) == 1:
+                scores[:, ids[0]] = -np.inf
+        if config.min_length and length < config.min_length:
+            scores[:, config.eos_token_id] = -np.inf
+        if config.forced_eos_token_id is not None and length == config.max_length - 1:
+            scores[:, :] = -np.inf
+            scores[:, config.forced_eos_token_id] = 0
+        return scores
+
+    @staticmethod
+    def _log_softmax(logits: np.ndarray) -> np.ndarray:
+        shifted = logits - logits.max(axis=-1, keepdims=True)
+        return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        return np.argsort(-scores, axis=-1, kind="stable")[:, :k]
+
+    def _greedy(self, attention_mask: np.ndarray, cross: List[np.ndarray]) -> np.ndarray:
+        config = self.config
+        batch = attention_mask.shape[0]
+        sequences = np.full((batch, 1), config.decoder_start_token_id, dtype=np.int64)
+        unfinished = np.ones(batch, dtype=bool)
+        past = self._empty_cache(batch, cross)
+        while sequences.shape[1] < config.max_length:
+            logits, past = self._step(sequences[:, -1], sequences.shape[1] - 1, attention_mask, past, cross)
+            tokens = self._process(logits, sequences.shape[1]).argmax(axis=-1)
+            tokens = np.where(unfinished, tokens, config.pad_token_id)
+            sequences = np.concatenate([sequences, tokens[:, None]], axis=1)
+            unfinished &= tokens != config.eos_token_id
+            if not unfinished.any():
+                break
+        return sequences
+
+    # vectorized beam search with the same scoring and stopping rules as transformers
+    def _beam_search(self, attention_mask: np.ndarray, cross: List[np.ndarray]) -> np.ndarray:
+        config = self.config
+        beams = config.num_beams
+        batch = attention_mask.shape[0]
+        keep = 2 * beams
+        max_length = config.max_length
+        length_penalty = config.length_penalty
+        early_stopping = config.early_stopping
+        rows = np.arange(batch)[:, None]
+
+        attention_mask = np.repeat(attention_mask, beams, axis=0)
+        cross = [np.repeat(c, beams, axis=0) for c in cross]
+        past = self._empty_cache(batch * beams, cross)
+
+        fill = config.pad_token_id if config.pad_token_id is not None else config.eos_token_id
+        running = np.full((batch, beams, max_length), fill, dtype=np.int64)
+        running[:, :, 0] = config.decoder_start_token_id
+        sequences = running.copy()
+        running_scores = np.zeros((batch, beams), dtype=np.float32)
+        running_scores[:, 1:] = -1e9
+        scores = np.full((batch, beams), -1e9, dtype=np.float32)
+        finished = np.zeros((batch, beams), dtype=bool)
+        improvable = np.ones((batch, 1), dtype=bool)
+        top_beams = np.arange(keep) < beams
+
+        length = 1
+        while True:
+            logits, presents = self._step(running[:, :, length - 1].reshape(-1), length - 1, attention_mask, past, cross)
+            log_probs = self._process(self._log_softmax(logits), length)
+            vocab = log_probs.shape[-1]
+            log_probs = (log_probs.reshape(batch, beams, vocab) + running_scores[:, :, None]).reshape(batch, -1)
+
+            # top continuations over every beam
+            top = self._top_k(log_probs, keep)
+            top_scores = np.take_along_axis(log_probs, top, axis=1)
+            source_beams = top // vocab
+            top_sequences = running[rows, source_beams]
+            top_sequences[:, :, length] = top % vocab
+            done = (top_sequences[:, :, length] == config.eos_token_id) | (length + 1 >= max_length)
+
+            # best unfinished continuations keep running
+            running_candidates = top_scores + done * np.float32(-1e9)
+            chosen = self._top_k(running_candidates, beams)
+            running = np.take_along_axis(top_sequences, chosen[:, :, None], axis=1)
+            running_scores = np.take_along_axis(running_candidates, chosen, axis=1)
+            cache_index = (np.take_along_axis(source_beams, chosen, axis=1) + rows * beams).reshape(-1)
+
+            # finished continuations among the top beams replace worse finished hypotheses
+            finished_scores = top_scores / (length ** length_penalty)
+            if early_stopping is True:
+                finished_scores += finished.all(axis=1, keepdims=True) * np.float32(-1e9)
+            finished_scores += ~improvable * np.float32(-1e9)
+            finished_scores += ~(done & top_beams) * np.float32(-1e9)
+            merged_scores = np.concatenate([scores, finished_scores], axis=1)
+            best = self._top_k(merged_scores, beams)
+            sequences = np.take_along_axis(np.concatenate([sequences, top_sequences], axis=1), best[:, :, None], axis=1)
+            scores = np.take_along_axis(merged_scores, best, axis=1)
+            finished = np.take_along_axis(np.concatenate([finished, done & top_beams], axis=1), best, axis=1)
+
+            past = [p[cache_index] for p in presents]
+            length += 1
+            if early_stopping == "never" and length_penalty > 0.0:
+                best_length = max_length - 1
+            else:
+                best_length = length - 1
+            worst_finished = np.where(finished, scores.min(axis=1, keepdims=True), -1e9)
+            improvable &= (running_scores[:, :1] / (best_length ** length_penalty) > worst_finished).any(axis=-1, keepdims=True)
+            if not improvable.any() or (finished.all() and early_stopping is True) or done.all():
+                break
+        return sequences[:, 0]
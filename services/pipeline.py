@@ -0,0 +1,137 @@
+import contextvars
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Tuple
+
+from .metrics import Metrics
+
+class _Failure:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+_DONE = object()
+
+class Pipeline:
+    # Runs a source and a list of stages in their own threads connected by bounded
+    # queues, so a slow stage applies backpressure to the ones before it. Items come
+    # out in source order. With threaded=False the same stages run one after another.
+    # Each item's time in the source and every stage is recorded as a metrics stage.
+
+    def __init__(self, source: Iterable, stages: List[Tuple[str, Callable]], source_name: str = "source", queue_size: int = 2, threaded: bool = True) -> None:
+        self.source = source
+        self.source_name = source_name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.threaded = threaded
+        self.timings = {source_name: 0.0}
+        self.timings.update({name: 0.0 for name, _ in stages})
+        self._stop = threading.Event()
+        self.metrics = Metrics()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        try:
+            if self.threaded:
+                yield from self._run_threaded()
+            else:
+                yield from self._run_serial()
+        finally:
+            self.timings["wall"] = time.perf_counter() - started
+
+    def _next(self, iterator):
+        started = time.perf_counter()
+        try:
+            return next(iterator)
+        finally:
+            seconds = time.perf_counter() - started
+            self.timings[self.source_name] += seconds
+            self.metrics.observe(self.source_name, seconds, started)
+
+    def _apply(self, name: str, fn: Callable, item):
+        started = time.perf_counter()
+        try:
+            return fn(item)
+        finally:
+            seconds = time.perf_counter() - started
+            self.timings[name] += seconds
+            self.metrics.observe(name, seconds, started)
+
+    def _run_serial(self):
+        iterator = iter(self.source)
+        while True:
+            try:
+                item = self._next(iterator)
+            except StopIteration:
+                return
+            for name, fn in self.stages:
+                item = self._apply(name, fn, item)
+            yield item
+
+    # put that gives up when the consumer went away
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _produce(self, output: queue.Queue) -> None:
+        try:
+            iterator = iter(self.source)
+            while not self._stop.is_set():
+                try:
+                    item = self._next(iterator)
+                except StopIteration:
+                    break
+                if not self._put(output, item):
+                    return
+        except BaseException as e:
+            self._put(output, _Failure(e))
+            return
+        self._put(output, _DONE)
+
+    def _work(self, name: str, fn: Callable, input: queue.Queue, output: queue.Queue) -> None:
+        while True:
+            item = self._get(input)
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(output, item)
+                return
+            try:
+                item = self._apply(name, fn, item)
+            except BaseException as e:
+                self._put(output, _Failure(e))
+                return
+            if not self._put(output, item):
+                return
+
+    def _run_threaded(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        # threads run in a copy of the caller's context, which carries the task's trace
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._produce, queues[0]), name=f"pipeline-{self.source_name}", daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            threads.append(threading.Thread(target=contextvars.copy_context().run, args=(self._work, name, fn, queues[i], queues[i + 1]), name=f"pipeline-{name}", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,76 @@
+import time
+from statistics import median
+from typing import Dict, List, Optional
+
+# expected processing seconds per unit of job size until the task history has some:
+# per second of audio for transcriptions, per cue for translations
+DEFAULT_UNIT_SECONDS = {"transcript": 0.25, "translate": 0.02}
+# size assumed for a job whose size is unknown: an hour of audio, a feature's subtitles
+DEFAULT_SIZE = {"transcript": 3600.0, "translate": 1000.0}
+
+# seconds of audio of a wav read from its header, cues of an srt; None when it can't be told
+def job_size(operation: str, path: str) -> Optional[float]:
+    try:
+        if operation == "transcript":
+            from .audio import WavReader, probe_duration
+            if not WavReader.is_supported(path):
+                # other containers are only decoded when the task runs, their header tells the length
+                return probe_duration(path)
+            reader = WavReader(path)
+            try:
+                return reader.duration
+            finally:
+                reader.close()
+        if operation == "translate":
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return float(sum(1 for line in f if "-->" in line))
+    except (OSError, ValueError):
+        pass
+    return None
+
+class SchedulingPolicy:
+    # Order in which the pending tasks of a lane are admitted: shortest expected job
+    # first, where a priority level counts as priority_seconds less of expected work and
+    # every second waited as aging seconds less, so long jobs are never starved. Large
+    # operations hold whisper large, at most max_large of them run at once.
+
+    def __init__(self, db=None, aging: float = 1.0, priority_seconds: float = 3600.0, max_large: int = 0,
+                 large_operations=("transcript",), unit_seconds: Optional[Dict[str, float]] = None) -> None:
+        self.db = db
+        self.aging = aging
+        self.priority_seconds = priority_seconds
+        # 0 leaves it to the lane's concurrency
+        self.max_large = max_large
+        self.large_operations = set(large_operations)
+        self.unit_seconds = dict(DEFAULT_UNIT_SECONDS, **(unit_seconds or {}))
+
+    def is_large(self, operation: str) -> bool:
+        return operation in self.large_operations
+
+    # processing seconds per unit measured on the latest finished tasks
+    def refresh(self, operation: str) -> None:
+        if self.db is None:
+            return
+        rates = [seconds / size for seconds, size in self.db.recent_throughput(operation) if size]
+        if len(rates) > 0:
+            self.unit_seconds[operation] = median(rates)
+
+    def expected_seconds(self, task) -> float:
+        unit = self.unit_seconds.get(task['operation'], 1.0)
+        size = task['size'] if task['size'] is not None else DEFAULT_SIZE.get(task['operation'], 1.0)
+        return size * unit
+
+    def score(self, task, now: float) -> float:
+        waited = now - (task['created_at'] or now)
+        return self.expected_seconds(task) - (task['priority'] or 0) * self.priority_seconds - self.aging * waited
+
+    # pending tasks in admission order
+    def order(self, tasks, now: Optional[float] = None) -> List:
+        now = time.time() if now is None else now
+        return sorted(tasks, key=lambda task: (self.score(task, now), task['id']))
+
+    def pick(self, tasks, now: Optional[float] = None):
+        if len(tasks) == 0:
+            return None
+        now = time.time() if now is None else now
+        return min(tasks, key=lambda task: (self.score(task, now), task['id']))
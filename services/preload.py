@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .registry import ModelRegistry
+
+# "whisper:large, whisper:base, opus-mt:en-es" or the path of a file with one entry per line
+def parse_manifest(value: str) -> List[str]:
+    value = (value or "").strip()
+    if value and os.path.isfile(value):
+        with open(value, "r", encoding="utf-8") as f:
+            lines = [line.split("#", 1)[0] for line in f]
+    else:
+        lines = [value]
+    entries = [entry.strip() for line in lines for entry in line.split(",")]
+    return list(dict.fromkeys(entry for entry in entries if entry))
+
+class Preloader:
+    # Loads the models listed in the preload manifest into the shared model registry and
+    # runs one inference on each, in the background after startup, so the first task of
+    # each kind finds its models resident and the device kernels initialized.
+    #   whisper:large   transcription model
+    #   whisper:base    language detection model
+    #   opus-mt:en-es   Helsinki-NLP/opus-mt-en-es, or opus-mt:<model name or local path>
+
+    def __init__(self, logger, entries: List[str]) -> None:
+        self.logger = logger
+        self.entries = entries
+        self.states: Dict[str, str] = {entry: "pending" for entry in entries}
+        self.seconds: Dict[str, float] = {}
+        self.keys: Dict[str, Tuple[str, str, str]] = {}
+        self.finished = threading.Event()
+
+    # with pooled_whisper the transcription model lives in the whisper pool's processes
+    def run(self, device: str, quantize: bool = False, quantize_whisper: bool = False, backend: str = "transformers",
+            backend_options: Optional[dict] = None, pooled_whisper: bool = False) -> None:
+        try:
+            for entry in self.entries:
+                if pooled_whisper and entry == "whisper:large":
+                    self.states[entry] = "whisper pool"
+                    continue
+                self.states[entry] = "loading"
+                started = time.perf_counter()
+                try:
+                    self.keys[entry] = self._warm(entry, device, quantize, quantize_whisper, backend, backend_options or {})
+                except Exception as e:
+                    self.states[entry] = f"failed: {e}"
+                    self.logger.error(f"preloading {entry} failed: {e}")
+                    continue
+                self.seconds[entry] = round(time.perf_counter() - started, 3)
+                self.states[entry] = "warm"
+                self.logger.info(f"preloaded {entry} in {self.seconds[entry]:.2f}s")
+        finally:
+            self.finished.set()
+
+    # state of every entry, a warm model evicted from the registry since is reported as evicted
+    def status(self) -> Dict[str, dict]:
+        resident = {(model["name"], model["device"], model["dtype"]) for model in ModelRegistry().stats()["models"]}
+        models = {}
+        for entry in self.entries:
+            state = self.states[entry]
+            if state == "warm" and self.keys.get(entry) not in resident:
+                state = "evicted"
+            models[entry] = {"state": state, "seconds": self.seconds.get(entry)}
+        return models
+
+    # load and run the model once, returns its registry key
+    def _warm(self, entry: str, device: str, quantize: bool, quantize_whisper: bool, backend: str, backend_options: dict) -> Tuple[str, str, str]:
+        kind, _, name = entry.partition(":")
+        if kind == "whisper" and name == "base":
+            import torch
+            import whisper
+            from .utils import Utils
+            with Utils.detection_model(device) as model:
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.zeros(whisper.audio.SAMPLE_RATE)), n_mels=model.dims.n_mels, device=device)
+                with torch.no_grad():
+                    model.detect_language(mel.unsqueeze(0))
+            return Utils.detection_model_key(device)
+        if kind == "whisper" and name == "large":
+            import numpy as np
+            from .transcript import Transcriptor
+            with Transcriptor(self.logger, None, device=device, quantize=quantize_whisper) as transcriptor:
+                transcriptor.model.transcribe(np.zeros(16000, dtype=np.float32), task="transcribe", language="en", fp16=device != "cpu")
+                return (f"whisper-{transcriptor.model_name}", device, transcriptor.dtype)
+        if kind == "opus-mt" and name:
+            from .translate import Translator
+            model_name = name if "/" in name or os.path.isdir(name) else f"Helsinki-NLP/opus-mt-{name}"
+            with Translator(self.logger, model_name, device, quantize=quantize, backend=backend, backend_options=backend_options) as translator:
+                translator.translate_batch(["Hello."])
+                return (translator.model_name, device, translator.dtype)
+        raise ValueError(f"unknown preload entry {entry}, expected whisper:large, whisper:base or opus-mt:<src>-<dst>")
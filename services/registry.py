@@ -0,0 +1,164 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Tuple
+
+from .logging import Logger
+from .metrics import Metrics
+
+class _Entry:
+    def __init__(self, value: Any, size: int, load_time: float) -> None:
+        self.value = value
+        self.size = size
+        self.load_time = load_time
+        self.refs = 0
+        self.hits = 0
+
+class ModelRegistry:
+    # Process wide cache of loaded models keyed by (model name, device, dtype).
+    # Models in use (refs > 0) are never evicted, idle ones are evicted LRU first
+    # once the resident size goes over the memory budget.
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, memory_budget_mb: int = 0):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ModelRegistry, cls).__new__(cls)
+                cls._instance._initialize(memory_budget_mb)
+        return cls._instance
+
+    def _initialize(self, memory_budget_mb: int) -> None:
+        self.logger = Logger()
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def configure(self, memory_budget_mb: int) -> None:
+        with self._lock:
+            self.memory_budget = memory_budget_mb * 1024 * 1024
+            self._evict(keep=None)
+
+    def acquire(self, name: str, device: str, dtype: str, loader: Callable[[], Any]) -> Any:
+        key = (name, device, dtype)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.hits += 1
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return entry.value
+                event = self._loading.get(key)
+                if event is None:
+                    # this thread loads the model, others wait for it
+                    event = threading.Event()
+                    self._loading[key] = event
+                    self.misses += 1
+                    break
+            event.wait()
+
+        try:
+            self.logger.info(f"loading model {name} on {device} ({dtype})")
+            started = time.perf_counter()
+            value = loader()
+            load_time = time.perf_counter() - started
+            Metrics().observe("model_load", load_time, started, model=name)
+        except Exception:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+            raise
+
+        size = self._estimate_size(value)
+        with self._lock:
+            entry = _Entry(value=value, size=size, load_time=load_time)
+            entry.refs = 1
+            self._entries[key] = entry
+            self.load_seconds += load_time
+            del self._loading[key]
+            self._evict(keep=key)
+        event.set()
+        self.logger.info(f"model {name} loaded in {load_time:.2f}s ({size / 1024 / 1024:.0f}MB)")
+        return value
+
+    def release(self, name: str, device: str, dtype: str) -> None:
+        with self._lock:
+            entry = self._entries.get((name, device, dtype))
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            self._evict(keep=None)
+
+    @contextmanager
+    def use(self, name: str, device: str, dtype: str, loader: Callable[[], Any]):
+        value = self.acquire(name, device, dtype, loader)
+        try:
+            yield value
+        finally:
+            self.release(name, device, dtype)
+
+    def resident_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget_bytes": self.memory_budget,
+                "models": [
+                    {"name": key[0], "device": key[1], "dtype": key[2], "bytes": entry.size,
+                     "refs": entry.refs, "hits": entry.hits, "load_seconds": round(entry.load_time, 3)}
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+    # must be called with self._lock held
+    def _evict(self, keep) -> None:
+        if self.memory_budget <= 0:
+            return
+        evicted = False
+        for key in list(self._entries.keys()):
+            if self.resident_bytes() <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.refs > 0:
+                continue
+            del self._entries[key]
+            self.evictions += 1
+            evicted = True
+            self.logger.info(f"evicted model {key[0]} on {key[1]} ({key[2]})")
+        if evicted:
+            self._empty_device_cache()
+        if self.resident_bytes() > self.memory_budget:
+            self.logger.warning("model registry is over its memory budget, all resident models are in use.")
+
+    @staticmethod
+    def _empty_device_cache() -> None:
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        if isinstance(value, (tuple, list)):
+            return sum(ModelRegistry._estimate_size(v) for v in value)
+        if hasattr(value, "nbytes"):
+            return int(value.nbytes)
+        if hasattr(value, "parameters") and hasattr(value, "buffers"):
+            size = sum(p.numel() * p.element_size() for p in value.parameters())
+            size += sum(b.numel() * b.element_size() for b in value.buffers())
+            return size
+        return 0
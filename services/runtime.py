@@ -0,0 +1,40 @@
+import os
+import torch
+
+# device from configuration: auto picks cuda when available
+def select_device(preference: str = "auto") -> str:
+    preference = (preference or "auto").lower()
+    if preference == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if preference.startswith("cuda") and not torch.cuda.is_available():
+        raise ValueError(f"device {preference} requested but cuda is not available.")
+    return preference
+
+# torch thread pools, 0 splits the cpus between the workers running at the same time
+def configure_threads(intra_op: int = 0, inter_op: int = 0, workers: int = 1) -> int:
+    if intra_op <= 0:
+        intra_op = max(1, (os.cpu_count() or 1) // max(1, workers))
+    torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # can only be set once, before any inter-op parallel work started
+            pass
+    return intra_op
+
+# int8 dynamic quantization of linear layers, cpu only
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    for module in model.modules():
+        # subclasses (whisper's Linear casts weights in forward) are quantized as plain linear layers
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+# whisper checkpoint on a device, optionally int8 quantized
+def load_whisper(model_name: str, device: str, quantize: bool = False):
+    import whisper
+    model = whisper.load_model(model_name, device=device)
+    if quantize:
+        model = quantize_dynamic(model)
+    return model
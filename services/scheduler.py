@@ -0,0 +1,123 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from .metrics import Metrics
+
+class Scheduler:
+    # Long running loop that claims pending tasks and runs them on a worker pool
+    # per operation, never running more than concurrency[operation] at once.
+    # Handlers return the task's outputs, finished tasks are kept for retention seconds.
+    # With a policy, each lane admits its pending tasks in the policy's order.
+    # A failed task is queued again until it ran max_attempts times, then on_failed gets it.
+
+    def __init__(self, logger, db, handlers: Dict[str, Callable], concurrency: Dict[str, int], poll_interval: float = 30.0, retention: float = 7 * 24 * 3600, on_change: Optional[Callable[[], None]] = None, policy=None,
+                 max_attempts: int = 1, on_failed: Optional[Callable] = None) -> None:
+        self.logger = logger
+        self.db = db
+        self.handlers = handlers
+        self.concurrency = {operation: max(1, concurrency.get(operation, 1)) for operation in handlers}
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # notified when a task is claimed or finished
+        self.on_change = on_change
+        self.policy = policy
+        self.max_attempts = max(1, max_attempts)
+        # called with a task that failed its last attempt, before it is finished
+        self.on_failed = on_failed
+        self.running = {operation: 0 for operation in handlers}
+        self.executors = {operation: ThreadPoolExecutor(max_workers=self.concurrency[operation], thread_name_prefix=f"worker-{operation}") for operation in handlers}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        recovered = self.db.reset_claimed_tasks()
+        if recovered > 0:
+            self.logger.info(f"scheduler recovered {recovered} interrupted tasks.")
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        self.logger.info(f"scheduler started with concurrency {self.concurrency}")
+
+    # check for pending tasks now instead of waiting for the next poll
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.clear()
+            self.db.purge_tasks(time.time() - self.retention)
+            for operation in self.handlers:
+                self._dispatch(operation)
+            self._wake.wait(timeout=self.poll_interval)
+
+    def _dispatch(self, operation: str) -> None:
+        while True:
+            with self._lock:
+                if self.running[operation] >= self.concurrency[operation]:
+                    return
+                if self.policy is None:
+                    task = self.db.claim_task(operation)
+                else:
+                    if self.policy.is_large(operation) and 0 < self.policy.max_large <= self._running_large():
+                        return
+                    self.policy.refresh(operation)
+                    task = self.db.claim_task(operation, pick=self.policy.pick)
+                if task is None:
+                    return
+                self.running[operation] += 1
+            self._changed()
+            self.executors[operation].submit(self._execute, operation, task)
+
+    def _execute(self, operation: str, task) -> None:
+        self.logger.info(f"processing task {task['id']} for {operation}")
+        metrics = Metrics()
+        if task['created_at'] is not None:
+            metrics.observe("queue_wait", max(0.0, time.time() - task['created_at']), operation=operation)
+        error, outputs = None, None
+        try:
+            with metrics.trace(f"task-{task['id']}"), metrics.timer("task", operation=operation):
+                outputs = self.handlers[operation](task)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self.logger.error(f"task {task['id']} for {operation} failed: {e}")
+        finally:
+            self.logger.info(f"end processing {operation} task {task['id']}")
+            if error is not None and task['attempts'] + 1 < self.max_attempts:
+                self.logger.info(f"task {task['id']} for {operation} queued again, attempt {task['attempts'] + 2} of {self.max_attempts}")
+                metrics.inc("llm_tasks_total", operation=operation, status="retried")
+                self.db.retry_task(task['id'], error)
+            else:
+                metrics.inc("llm_tasks_total", operation=operation, status="failed" if error is not None else "done")
+                if error is not None and self.on_failed is not None:
+                    self._failed(task)
+                self.db.finish_task(task['id'], error=error, outputs=outputs)
+            self._changed()
+            with self._lock:
+                self.running[operation] -= 1
+            # a worker is free, look for more work
+            self.wake()
+
+    def _failed(self, task) -> None:
+        try:
+            self.on_failed(task)
+        except Exception as e:
+            self.logger.error(f"cleanup of failed task {task['id']} failed: {e}")
+
+    # must be called with self._lock held
+    def _running_large(self) -> int:
+        return sum(count for operation, count in self.running.items() if self.policy.is_large(operation))
+
+    def _changed(self) -> None:
+        if self.on_change is not None:
+            self.on_change()
@@ -0,0 +1,87 @@
+import datetime
+import os
+from typing import Optional
+
+import srt
+
+PART_SUFFIX = ".part"
+
+class SrtWriter:
+    # Appends cues to <output>.part while a job runs and renames it to the output on
+    # close, so the output path only ever holds a complete file. The last cue is held
+    # back until the next one arrives, a next cue starting earlier shortens it. Cues come
+    # in start order, as whisper produces them, so no sorting is needed.
+
+    def __init__(self, output_file: str, reindex: bool = True, fix_overlaps: bool = True) -> None:
+        self.output_file = output_file
+        self.part_file = output_file + PART_SUFFIX
+        # empty cues and cues with invalid timings are skipped, as srt.compose does; reindex numbers the
+        # written cues from 1, otherwise a cue keeps its index unless it is missing or not after the previous one
+        self.reindex = reindex
+        self.fix_overlaps = fix_overlaps
+        self.cues = 0
+        self._last_index = 0
+        self._pending: Optional[srt.Subtitle] = None
+        self._file = open(self.part_file, "w", encoding="utf-8")
+
+    def add(self, start: datetime.timedelta, end: datetime.timedelta, content: str, index: Optional[int] = None) -> None:
+        subtitle = srt.Subtitle(index=index, start=start, end=end, content=content)
+        if not self.fix_overlaps:
+            self._write(subtitle)
+            return
+        if self._pending is not None:
+            # Prevent overlapping subs
+            if self._pending.end > start:
+                self._pending.end = start
+            self._write(self._pending)
+        self._pending = subtitle
+
+    def _write(self, subtitle: srt.Subtitle) -> None:
+        if subtitle.content.strip() == "" or subtitle.start < datetime.timedelta(0) or subtitle.start >= subtitle.end:
+            return
+        if self.reindex or not isinstance(subtitle.index, int) or subtitle.index <= self._last_index:
+            subtitle.index = self._last_index + 1
+        self._file.write(subtitle.to_srt(strict=True))
+        self._last_index = subtitle.index
+        self.cues += 1
+
+    # make the cues written so far visible to readers of the part file
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> str:
+        if self._pending is not None:
+            self._write(self._pending)
+            self._pending = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.part_file, self.output_file)
+        return self.output_file
+
+    # drop the part file of a failed job, a previous complete output is left untouched
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.part_file):
+            os.remove(self.part_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if self._file.closed:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# complete cues of a part file being written, a cue cut by a concurrent write is left out
+def read_partial(output_file: str) -> Optional[str]:
+    try:
+        with open(output_file + PART_SUFFIX, "r", encoding="utf-8") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    end = content.rfind("\n\n")
+    return content[:end + 2] if end >= 0 else ""
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from statistics import median
+from typing import Dict, Optional
+
+from .db import PENDING, RUNNING, DONE, FAILED
+
+TASK_STATES = {PENDING: "pending", RUNNING: "running", DONE: "done", FAILED: "failed"}
+
+class TaskMonitor:
+    # Task status as served by the api, read from the task table and the progress
+    # reported by the workers. Every progress update bumps a version so clients can
+    # wait on it instead of polling, the ETA comes from the measured task durations.
+    # With the scheduler's policy, queue positions follow its admission order.
+
+    def __init__(self, db, concurrency: Dict[str, int], policy=None) -> None:
+        self.db = db
+        self.concurrency = concurrency
+        self.policy = policy
+        self.version = 0
+        self._changed = threading.Condition()
+
+    # called by the workers and the scheduler whenever a task moved
+    def changed(self) -> None:
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    # block until the version moves past the given one or the timeout, returns the current version
+    def wait(self, version: int, timeout: float) -> int:
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def status(self, task_id: int) -> Optional[dict]:
+        task = self.db.find_task(task_id)
+        return self.describe(task) if task is not None else None
+
+    def list(self, states=(), limit: int = 100) -> list:
+        return [self.describe(task) for task in self.db.find_tasks(states, limit)]
+
+    # wait until the task finished or the timeout expired
+    def wait_finished(self, task_id: int, timeout: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        version = self.version
+        status = self.status(task_id)
+        while status is not None and status["status"] in ("pending", "running"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            version = self.wait(version, remaining)
+            status = self.status(task_id)
+        return status
+
+    def describe(self, task) -> dict:
+        state = TASK_STATES.get(task['process'], "pending")
+        status = {
+            "id": task['id'],
+            "operation": task['operation'],
+            "language": task['language'],
+            "title": task['title'],
+            "status": state,
+            "stage": "queued" if state == "pending" else task['stage'],
+            "detail": task['detail'],
+            "progress": 1.0 if state == "done" else (task['progress'] or 0.0),
+            "created_at": task['created_at'],
+            "started_at": task['started_at'],
+            "finished_at": task['finished_at'],
+            "attempts": task['attempts'],
+            "queue_position": None,
+            "eta_seconds": None,
+        }
+        if state == "pending":
+            ahead = self._ahead(task)
+            status["queue_position"] = (len(ahead) if ahead is not None else self.db.count_pending_before(task['operation'], task['id'])) + 1
+            status["eta_seconds"] = self._pending_eta(task, status["queue_position"], ahead)
+        elif state == "running":
+            status["eta_seconds"] = self._remaining(task)
+        elif state == "failed":
+            status["error"] = task['error']
+        if task['outputs']:
+            status["files"] = json.loads(task['outputs'])
+        return status
+
+    def _typical(self, operation: str) -> Optional[float]:
+        durations = self.db.recent_durations(operation)
+        return median(durations) if len(durations) > 0 else None
+
+    # a running task extrapolates its own throughput, until it reports progress the typical duration is used
+    def _remaining(self, task, typical: Optional[float] = None) -> Optional[float]:
+        elapsed = time.time() - (task['started_at'] or time.time())
+        progress = task['progress'] or 0.0
+        if progress >= 0.01:
+            return max(0.0, elapsed * (1 - progress) / progress)
+        typical = typical if typical is not None else self._typical(task['operation'])
+        return max(0.0, typical - elapsed) if typical is not None else None
+
+    # pending tasks the policy admits before this one, None without a policy
+    def _ahead(self, task) -> Optional[list]:
+        if self.policy is None:
+            return None
+        ahead = []
+        for other in self.policy.order(self.db.find_pending(task['operation'])):
+            if other['id'] == task['id']:
+                break
+            ahead.append(other)
+        return ahead
+
+    # tasks ahead share the operation's workers, then the task runs for a typical duration,
+    # with a policy each task for its expected duration
+    def _pending_eta(self, task, position: int, ahead: Optional[list] = None) -> Optional[float]:
+        typical = self._typical(task['operation'])
+        if typical is None and self.policy is None:
+            return None
+        running = [self._remaining(other, typical) for other in self.db.find_tasks((RUNNING,), limit=1000) if other['operation'] == task['operation']]
+        workers = max(1, self.concurrency.get(task['operation'], 1))
+        if self.policy is not None:
+            queued = sum(self.policy.expected_seconds(other) for other in ahead or [])
+            own = self.policy.expected_seconds(task)
+        else:
+            queued, own = (position - 1) * typical, typical
+        return (sum(seconds or 0.0 for seconds in running) + queued) / workers + own
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, NamedTuple
+
+class StagedUpload(NamedTuple):
+    content_hash: str
+    temp_path: str
+    path: str
+
+class ContentStore:
+    # Uploads are stored under the sha256 of their content, hashed while they are
+    # copied to disk, so identical uploads share a file and names never collide.
+    # An upload is staged first and published under its hash, or discarded, so the
+    # caller can publish it together with the task using it.
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    # the upload copied to a temporary file and hashed
+    def stage(self, stream: BinaryIO, filename: str) -> StagedUpload:
+        extension = os.path.splitext(filename)[1].lower()
+        temp_path = os.path.join(self.root, f".upload-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        content_hash = digest.hexdigest()
+        return StagedUpload(content_hash, temp_path, self.path(content_hash, extension))
+
+    # the stored file of a staged upload, an identical one already stored is kept
+    def publish(self, staged: StagedUpload) -> str:
+        if os.path.exists(staged.path):
+            os.remove(staged.temp_path)
+        else:
+            os.replace(staged.temp_path, staged.path)
+        return staged.path
+
+    def discard(self, staged: StagedUpload) -> None:
+        if os.path.exists(staged.temp_path):
+            os.remove(staged.temp_path)
+
+    def path(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.root, content_hash + extension)
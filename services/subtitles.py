@@ -0,0 +1,232 @@
+import datetime
+import functools
+import html
+import re
+import unicodedata
+from typing import Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+import srt
+
+# Subtitle text helpers used on every cue: lazy srt parsing, markup stripping and line wrapping.
+
+# same timestamps and arrows srt.parse accepts: "." and ":" as delimiters, optional milliseconds
+_TIMING = re.compile(r"\s*(\d+)[,.:，．。：](\d+)[,.:，．。：](\d+)[,.:，．。：]?(\d*) *-[ -] *> *(\d+)[,.:，．。：](\d+)[,.:，．。：](\d+)[,.:，．。：]?(\d*) ?([^\r\n]*)$")
+_INDEX = re.compile(r"\s*(-?\d+)(?:\.\d*)?\s*$")
+# html tags, comments and {\an8} style override tags, in one alternation
+_MARKUP = re.compile(r"<!--.*?-->|<(/?)([A-Za-z][A-Za-z0-9]*)(?:\s[^<>]*)?/?>|\{\\[^{}]*\}", re.S)
+
+class SubtitleParseError(ValueError):
+    pass
+
+class Span(NamedTuple):
+    # markup of a cue: its opening and closing tags, covering plain text [start, end)
+    open: str
+    close: str
+    start: int
+    end: int
+
+def _timedelta(hours: str, minutes: str, seconds: str, milliseconds: str) -> datetime.timedelta:
+    return datetime.timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds), milliseconds=int(milliseconds or 0))
+
+# srt cues yielded as they are read, so reading the first cues of a file doesn't parse the rest;
+# source is srt text or lines, like an open file. A blank line ends a cue's content, unless the
+# next line isn't the start of another cue, the same recovery srt.parse does.
+# Extra blank lines before the next cue are kept at the end of the content, as srt.parse keeps them.
+def parse_srt(source: Union[str, Iterable[str]]) -> Iterator[srt.Subtitle]:
+    lines = iter(source.splitlines() if isinstance(source, str) else source)
+    pending: List[str] = []
+
+    def next_line():
+        if pending:
+            return pending.pop()
+        line = next(lines, None)
+        return line.rstrip("\r\n") if line is not None else None
+
+    number = 0
+    line = next_line()
+    if line is not None:
+        line = line.lstrip("\ufeff")
+    while True:
+        while line is not None and line.strip() == "":
+            line = next_line()
+        if line is None:
+            return
+        number += 1
+        index = None
+        timing = _TIMING.match(line)
+        if timing is None:
+            index_match = _INDEX.match(line)
+            following = next_line()
+            timing = _TIMING.match(following) if index_match is not None and following is not None else None
+            if timing is None:
+                raise SubtitleParseError(f"cue {number}: expected an index or a timing line, got {line!r}")
+            index = int(index_match.group(1))
+        start = _timedelta(*timing.group(1, 2, 3, 4))
+        end = _timedelta(*timing.group(5, 6, 7, 8))
+        proprietary = timing.group(9)
+
+        content = []
+        line = next_line()
+        while line is not None:
+            if line.strip() == "":
+                # blank lines followed by text that doesn't start a cue are part of the content
+                blanks = [line]
+                line = next_line()
+                while line is not None and line.strip() == "":
+                    blanks.append(line)
+                    line = next_line()
+                if line is None or _starts_cue(line, next_line, pending):
+                    # like srt.parse, only the last empty line separates the cues, the others are content
+                    content.extend(blanks[:-1] if blanks[-1] == "" else blanks)
+                    break
+                content.extend(blanks)
+                continue
+            # a cue starting right after the content, without the blank line
+            if _INDEX.match(line) is not None and _starts_cue(line, next_line, pending, index_only=True):
+                break
+            content.append(line)
+            line = next_line()
+        yield srt.Subtitle(index=index, start=start, end=end, content="\n".join(content), proprietary=proprietary)
+
+# whether line starts a cue, the line after an index is looked at and pushed back
+def _starts_cue(line: str, next_line, pending: List[str], index_only: bool = False) -> bool:
+    if not index_only and _TIMING.match(line) is not None:
+        return True
+    if _INDEX.match(line) is None:
+        return False
+    following = next_line()
+    if following is None:
+        return False
+    pending.append(following)
+    return _TIMING.match(following) is not None
+
+# text without markup and the spans of its tags, entities decoded
+def strip_markup(text: str) -> Tuple[str, List[Span]]:
+    if "<" not in text and "{" not in text:
+        return (html.unescape(text) if "&" in text else text), []
+    pieces: List[str] = []
+    # spans with the number of their opening tag in the text
+    spans: List[Tuple[int, Span]] = []
+    # open tags by name, a closing tag closes the latest one
+    opened: List[Tuple[str, str, int, int]] = []
+    length = 0
+    position = 0
+    for number, match in enumerate(_MARKUP.finditer(text)):
+        if match.start() > position:
+            piece = text[position:match.start()]
+            if "&" in piece:
+                piece = html.unescape(piece)
+            pieces.append(piece)
+            length += len(piece)
+        position = match.end()
+        tag = match.group(0)
+        name = match.group(2)
+        if name is None:
+            # comments are dropped, override tags apply at their position
+            if tag.startswith("{"):
+                spans.append((number, Span(tag, "", length, length)))
+            continue
+        name = name.lower()
+        if match.group(1):
+            for i in range(len(opened) - 1, -1, -1):
+                if opened[i][0] == name:
+                    _, open_tag, start, opened_number = opened.pop(i)
+                    spans.append((opened_number, Span(open_tag, tag, start, length)))
+                    break
+        elif not tag.endswith("/>") and name != "br":
+            opened.append((name, tag, length, number))
+    if position < len(text):
+        piece = text[position:]
+        if "&" in piece:
+            piece = html.unescape(piece)
+        pieces.append(piece)
+        length += len(piece)
+    # tags left open cover the rest of the text
+    for name, open_tag, start, opened_number in opened:
+        spans.append((opened_number, Span(open_tag, f"</{name}>", start, length)))
+    # override tags go before the tags starting at the same offset, like {\an8}<i>, outer tags
+    # before inner ones, tags over the same text in the order they were opened
+    spans.sort(key=lambda numbered: (numbered[1].start, numbered[1].close != "", -numbered[1].end, numbered[0]))
+    return "".join(pieces), [span for _, span in spans]
+
+# text without markup, as BeautifulSoup(text, "html.parser").get_text() gave, {\an8} style tags removed as well
+def clean_text(text: str) -> str:
+    if "<" not in text and "{" not in text:
+        return html.unescape(text) if "&" in text else text
+    return strip_markup(text)[0]
+
+# markup of the original cue put back around its translation: tags enclosing the whole text,
+# like italics, and override tags at its start; spans over part of it can't be placed and are dropped
+def apply_markup(text: str, spans: List[Span], length: int) -> str:
+    prefix = []
+    suffix = []
+    for span in spans:
+        if span.start == 0 and (span.end == length or (span.end == 0 and span.close == "")):
+            prefix.append(span.open)
+            if span.close:
+                suffix.append(span.close)
+    if not prefix:
+        return text
+    return "".join(prefix) + text + "".join(reversed(suffix))
+
+# columns taken on screen: east asian wide and full width characters take two, combining marks none
+def display_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+# greedy word wrap in one pass, lines stay under max_length columns like Translator.split_lines did;
+# a word wider than a line is only broken when it has wide characters, which can break anywhere
+def wrap_text(text: str, max_length: int = 42) -> List[str]:
+    words = text.split()
+    if not text.isascii() or max_length < 3:
+        return _wrap_wide(words, max_length)
+    line = " ".join(words)
+    # most cues fit in one line
+    if len(line) < max_length:
+        return [line]
+    return _line_pattern(max_length).findall(line)
+
+# the longest run of words under max_length from a word's start, or a longer word alone;
+# the greedy repeat backtracks at most one line, so the whole text is matched in linear time
+@functools.lru_cache(maxsize=None)
+def _line_pattern(max_length: int) -> re.Pattern:
+    return re.compile(r"\S(?:[^\n]{0,%d}\S)?(?= |$)|\S+" % (max_length - 3))
+
+def _wrap_wide(words: List[str], max_length: int) -> List[str]:
+    lines = []
+    current: List[str] = []
+    width = 0
+    for word in words:
+        word_width = display_width(word)
+        if word_width >= max_length and not word.isascii():
+            for piece in _break_wide(word, max_length - 1):
+                if current:
+                    lines.append(" ".join(current))
+                current, width = [piece], display_width(piece)
+        elif not current:
+            current, width = [word], word_width
+        elif width + word_width + 2 <= max_length:
+            current.append(word)
+            width += word_width + 1
+        else:
+            lines.append(" ".join(current))
+            current, width = [word], word_width
+    lines.append(" ".join(current))
+    return lines
+
+def _break_wide(word: str, max_width: int) -> Iterator[str]:
+    start = 0
+    width = 0
+    for i, char in enumerate(word):
+        char_width = 0 if unicodedata.combining(char) else 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+        if width + char_width > max_width and i > start:
+            yield word[start:i]
+            start, width = i, 0
+        width += char_width
+    yield word[start:]
@@ -1,143 +1,288 @@
 import torch
-import whisper
-import srt
 import datetime
-import os
 import gc
+import time
+import numpy as np
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from .registry import ModelRegistry
+from .audio import StreamAudio, open_audio
+from .vad import StreamingVAD
+from .pipeline import Pipeline
+from .runtime import load_whisper
+from .srt_writer import SrtWriter
+from .metrics import Metrics
 
 class Transcriptor:
     
     # TODO: Remove all "isCli"
 
-    def __init__(self, logger, translator, device="cuda", is_cli=False):
-        self.basePath = "media/vad_chunks"
+    def __init__(self, logger, translator, device="cuda", is_cli=False, pipelined=True, queue_size=2, quantize=False, pool=None, buffer_seconds=1800.0):
         self.logger = logger
         self.is_cli = is_cli
-        if not os.path.exists(self.basePath):
-            os.mkdir(self.basePath)
+        # overlap whisper decoding with translation of the previous chunk
+        self.pipelined = pipelined
+        self.queue_size = queue_size
+        self.timings = {}
         self.translator = translator
         self.device = device
-        self.model = whisper.load_model("large", device=device)
+        self.model_name = "large"
+        # int8 dynamic quantization of whisper's linear layers, cpu only
+        self.quantize = quantize and device == "cpu"
+        self.dtype = "qint8" if self.quantize else "float32"
+        self.registry = ModelRegistry()
+        # with a WhisperPool chunks are decoded by its worker processes instead of a model loaded here
+        self.pool = pool
+        self.model = None
+        if pool is None:
+            self.model = self.registry.acquire(f"whisper-{self.model_name}", device, self.dtype, self._load_model)
         self.VAD_SR=16000
         self.VAD_THRESHOLD = 0.4 # calculate percentaje of VAD (Voice Activity Detection) if exceeds 40% will detect as voice activity
         self.CHUNK_THRESHOLD = 3.0 # calculate silence between files
+        # ring buffer of containers decoded by a streaming ffmpeg, whatever path opens the audio
+        self.buffer_seconds = buffer_seconds
 
+    def _load_model(self):
+        return load_whisper(self.model_name, self.device, self.quantize)
 
-    def vad_run(self, audio_file: str):
+    # release the shared whisper model, the translator is owned by the caller
+    def close(self) -> None:
+        if self.model is not None:
+            self.registry.release(f"whisper-{self.model_name}", self.device, self.dtype)
+            self.model = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    # returns a generator of speech groups, closed groups are yielded while VAD keeps reading the audio
+    # audio already opened by the caller, like for the language detection, is read instead of audio_file
+    def vad_run(self, audio_file: str, audio=None):
         self.logger.info(f"running VAD...")
-        model, utils = torch.hub.load(repo_or_dir="snakers4/silero-vad", model="silero_vad", onnx=False, trust_repo=True)
-        (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
-        wav = read_audio(audio_file, sampling_rate=self.VAD_SR)
-        t = get_speech_timestamps(wav, model, sampling_rate=self.VAD_SR, threshold=self.VAD_THRESHOLD)
-
-        # Add a bit of padding, and remove small gaps
-        for i in range(len(t)):
-            t[i]["start"] = max(0, t[i]["start"] - 3200)  # 0.2s head
-            t[i]["end"] = min(wav.shape[0] - 16, t[i]["end"] + 20800)  # 1.3s tail
-            if i > 0 and t[i]["start"] < t[i - 1]["end"]:
-                t[i]["start"] = t[i - 1]["end"]  # Remove overlap
-
-        # If breaks are longer than chunk_threshold seconds, split into a new audio file
-        # This'll effectively turn long transcriptions into many shorter ones
-        u = [[]]
-        for i in range(len(t)):
-            if i > 0 and t[i]["start"] > t[i - 1]["end"] + (self.CHUNK_THRESHOLD * self.VAD_SR):
-                u.append([])
-            u[-1].append(t[i])
-
-        # Merge speech chunks
-        for i in range(len(u)):
-            save_audio(
-                self.basePath + "/" + str(i) + ".wav",
-                collect_chunks(u[i], wav),
-                sampling_rate=self.VAD_SR,
-            )
-        # Convert timestamps to seconds
-        for i in range(len(u)):
-            time = 0.0
-            offset = 0.0
-            for j in range(len(u[i])):
-                u[i][j]["start"] /= self.VAD_SR
-                u[i][j]["end"] /= self.VAD_SR
-                u[i][j]["chunk_start"] = time
-                time += u[i][j]["end"] - u[i][j]["start"]
-                u[i][j]["chunk_end"] = time
-                if j == 0:
-                    offset += u[i][j]["start"]
-                else:
-                    offset += u[i][j]["start"] - u[i][j - 1]["end"]
-                u[i][j]["offset"] = offset
-
-        self.logger.info(f"VAD generated {len(u)} chunk files.")
-        # remove source file
-        os.remove(audio_file)
-        self.logger.info(f"VAD removed source file {audio_file}")
-        return u
+        if audio is None:
+            audio = open_audio(audio_file, sample_rate=self.VAD_SR, buffer_seconds=self.buffer_seconds)
+        vad = StreamingVAD(self.logger, sampling_rate=self.VAD_SR, threshold=self.VAD_THRESHOLD, chunk_threshold=self.CHUNK_THRESHOLD)
+        return vad.groups(audio), audio
+
+    # VAD of the whole audio ahead of its transcription, like on another thread while the previous
+    # file is transcribed; the result is passed to transcript_languages as prepared
+    # a stream only keeps its ring buffer, so its VAD runs with the transcription and only
+    # the decoding starts ahead
+    def prepare(self, audio_file: str) -> Tuple[Iterable, object]:
+        groups, audio = self.vad_run(audio_file=audio_file)
+        if isinstance(audio, StreamAudio):
+            return groups, audio
+        try:
+            return list(groups), audio
+        except BaseException:
+            audio.close()
+            raise
+
+    # merge speech segments of a group, only the group's samples are read
+    def chunk_audio(self, audio, group) -> np.ndarray:
+        if len(group) == 1:
+            return audio.read(group[0]["sample_start"], group[0]["sample_end"])
+        return np.concatenate([audio.read(s["sample_start"], s["sample_end"]) for s in group])
     
-    def transcript(self, language, audio_file: str, output_file: str):
-        u = self.vad_run(audio_file=audio_file)
-        if len(u) == 0:
-            self.logger.error("VAD generation failed!")
-            return 
-        subs = []
-        sub_index = 1
-        total_chunks = len(u)
-        for i in range(len(u)):
-            audio_chunk_file = self.basePath + "/" + str(i) + ".wav"
-            
-            if self.is_cli:
-                print(f"Processing : {i}/{total_chunks} file: {audio_chunk_file}")
-            self.logger.info(f"Processing: {i}/{total_chunks}")
-            
-            result = self.model.transcribe(audio_chunk_file, task="transcribe", language=language)
-            # if not segments skip
-            if len(result['segments']) == 0:
-                if self.is_cli:
-                    print(f"no segments were found in {audio_chunk_file}")
-                continue
-
-            for r in result["segments"]:
-                start = r["start"] + u[i][0]["offset"]
-                for j in range(len(u[i])):
-                    if (r["start"] >= u[i][j]["chunk_start"] and r["start"] <= u[i][j]["chunk_end"]):
-                        start = r["start"] + u[i][j]["offset"]
-                        break
-                
-                # Prevent overlapping subs
-                if len(subs) > 0:
-                    last_end = datetime.timedelta.total_seconds(subs[-1].end)
-                    if last_end > start:
-                        subs[-1].end = datetime.timedelta(seconds=start)
-
-                # Set end timestamp
-                end = u[i][-1]["end"] + 0.5
-                for j in range(len(u[i])):
-                    if r["end"] >= u[i][j]["chunk_start"] and r["end"] <= u[i][j]["chunk_end"]:
-                        end = r["end"] + u[i][j]["offset"]
-                        break
-                # Translate
-                clean_content = r['text'].strip()
-                text = self.translator.translate_text(clean_content)
-                # Add to SRT list
-                subs.append(
-                    srt.Subtitle(
-                        index=sub_index,
-                        start=datetime.timedelta(seconds=start),
-                        end=datetime.timedelta(seconds=end),
-                        content=text,
-                    )
-                )
-                sub_index += 1
-            # remove chunk audio file
-            os.remove(audio_chunk_file)
-            # clean up
-            torch.cuda.empty_cache()
-            gc.collect()
+    def transcript(self, language, audio_file: str, output_file: str, prepared=None):
+        return self.transcript_languages(language, audio_file, {"": (self.translator, output_file)}, prepared=prepared).get("")
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(srt.compose(subs))
+    # transcribe once and write one srt per target language, a None translator keeps the source text
+    # with a checkpoint, chunks finished by a previous run are restored instead of processed
+    # cues are appended to <output>.part as chunks finish, on_progress(stage, progress, detail) gets
+    # the transcribed fraction of the audio and the chunk composed
+    # prepared is (groups, audio) from prepare(), the audio is closed here
+    def transcript_languages(self, language, audio_file: str, targets: Dict[str, Tuple[Optional[object], str]], on_output: Optional[Callable[[str, str], None]] = None, checkpoint=None, on_progress: Optional[Callable[[str, float, Optional[str]], None]] = None, prepared=None) -> Dict[str, str]:
+        stored = checkpoint.groups() if checkpoint is not None else None
+        if stored is not None:
+            self.logger.info(f"VAD restored from checkpoint, {len(stored)} chunks.")
+            if prepared is not None:
+                prepared[1].close()
+            groups, audio = stored, open_audio(audio_file, sample_rate=self.VAD_SR, buffer_seconds=self.buffer_seconds)
+        elif prepared is not None:
+            groups, audio = prepared
+        else:
+            groups, audio = self.vad_run(audio_file=audio_file)
+        self._vad_chunks = len(groups) if isinstance(groups, list) else None
+        if on_progress is not None:
+            on_progress("vad", 0.0, None)
+        writers = {lang: SrtWriter(output_file) for lang, (_, output_file) in targets.items()}
+        started = time.perf_counter()
+        outputs = {}
+        try:
+            chunks = self._transcript_groups(language, groups, audio, targets, writers, checkpoint, on_progress)
+            if chunks > 0:
+                metrics = Metrics()
+                metrics.inc("llm_audio_seconds_total", self.total_duration)
+                metrics.inc("llm_transcript_seconds_total", time.perf_counter() - started)
+                if on_progress is not None:
+                    on_progress("compose", 1.0, None)
+                for lang, writer in writers.items():
+                    outputs[lang] = writer.close()
+                    if on_output is not None:
+                        on_output(lang, outputs[lang])
+        except BaseException:
+            # outputs already renamed into place are complete and kept
+            for lang, writer in writers.items():
+                if lang not in outputs:
+                    writer.abort()
+            raise
+        finally:
+            audio.close()
+        if chunks == 0:
+            for writer in writers.values():
+                writer.abort()
+            self.logger.error("VAD generation failed!")
+            return {}
         
         if self.is_cli:
             print(f"transcript completed")
         
         self.logger.info("transcript completed.")
+        return outputs
+
+    def _transcript_groups(self, language, groups, audio, targets, writers, checkpoint=None, on_progress=None):
+        self.total_duration = audio.duration
+        # VAD chunk -> whisper -> batched translation per language, written here in timeline order
+        self._restored = {}
+        source = self._chunks(groups, audio, targets, checkpoint)
+        if self.pool is not None:
+            source = self._submit_ahead(language, source)
+            stages = [("decode", lambda item: self._collect(*item))]
+        else:
+            stages = [("decode", lambda item: self._decode(language, *item))]
+        for lang, (translator, _) in targets.items():
+            stages.append((f"translate{':' + lang if lang else ''}", self._translate_stage(lang, translator)))
+        pipeline = Pipeline(source, stages, source_name="vad", queue_size=self.queue_size, threaded=self.pipelined)
+        # source language segments of the whole audio
+        self.segments = []
+        chunks = 0
+        for i, group, segments, texts in pipeline:
+            chunks += 1
+            started = time.perf_counter()
+            self.segments.extend(segments)
+            for lang, writer in writers.items():
+                self._compose(writer, segments, texts[lang])
+            if checkpoint is not None and i not in self._restored:
+                checkpoint.save_chunk(i, segments, texts)
+            if on_progress is not None and self.total_duration > 0:
+                # the number of chunks is known once VAD went through the whole audio
+                detail = f"chunk {chunks}/{self._vad_chunks}" if self._vad_chunks is not None else f"chunk {chunks}"
+                on_progress("transcript", min(1.0, group[-1]["end"] / self.total_duration), detail)
+            pipeline.timings["compose"] = pipeline.timings.get("compose", 0.0) + time.perf_counter() - started
+            Metrics().observe("compose", time.perf_counter() - started, started)
+        self.timings = pipeline.timings
+        self.logger.info("transcript stage timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()))
+        return chunks
+
+    # VAD groups with their audio, or without it when the checkpoint has the chunk's results
+    def _chunks(self, groups, audio, targets, checkpoint):
+        count = 0
+        for i, group in enumerate(groups):
+            count += 1
+            if checkpoint is not None:
+                checkpoint.save_group(i, group)
+                previous = checkpoint.restore(i, group, targets)
+                if previous is not None:
+                    self.logger.info(f"chunk {i} restored from checkpoint")
+                    self._restored[i] = previous
+                    audio.consume(group[-1]["sample_end"])
+                    yield i, group, None
+                    continue
+            samples = self.chunk_audio(audio, group)
+            audio.consume(group[-1]["sample_end"])
+            yield i, group, samples
+        self._vad_chunks = count
+        if checkpoint is not None:
+            checkpoint.vad_complete(count)
+
+    def _restore(self, i, group):
+        segments, texts = self._restored[i]
+        return i, group, segments, dict(texts)
+
+    def _processing(self, i, group) -> None:
+        if self.is_cli:
+            print(f"Processing : {i} at {group[0]['start']:.0f}/{self.total_duration:.0f}s")
+        self.logger.info(f"Processing: {i} at {group[0]['start']:.0f}/{self.total_duration:.0f}s")
+
+    # whisper stage, returns segments with timestamps mapped back to the source audio
+    def _decode(self, language, i, group, samples):
+        if samples is None:
+            return self._restore(i, group)
+        self._processing(i, group)
+        result = self.model.transcribe(samples, task="transcribe", language=language, fp16=self.device != "cpu")
+        segments = self._map_segments(i, group, result["segments"])
+        # clean up
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        gc.collect()
+        return i, group, segments, {}
+
+    # keep one chunk per pool worker in flight ahead of the one being collected
+    def _submit_ahead(self, language, source):
+        pending = deque()
+        try:
+            for i, group, samples in source:
+                if samples is None:
+                    pending.append((i, group, None))
+                else:
+                    self._processing(i, group)
+                    pending.append((i, group, self.pool.submit(samples, language)))
+                if len(pending) > self.pool.size:
+                    yield pending.popleft()
+            while len(pending) > 0:
+                yield pending.popleft()
+        finally:
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    # pool stage, chunks come back in timeline order whichever worker finished first
+    def _collect(self, i, group, future):
+        if future is None:
+            return self._restore(i, group)
+        return i, group, self._map_segments(i, group, future.result()), {}
+
+    def _map_segments(self, i, group, raw_segments):
+        # if not segments skip
+        if len(raw_segments) == 0 and self.is_cli:
+            print(f"no segments were found in chunk {i}")
+
+        segments = []
+        for r in raw_segments:
+            start = r["start"] + group[0]["offset"]
+            for j in range(len(group)):
+                if (r["start"] >= group[j]["chunk_start"] and r["start"] <= group[j]["chunk_end"]):
+                    start = r["start"] + group[j]["offset"]
+                    break
+
+            # Set end timestamp
+            end = group[-1]["end"] + 0.5
+            for j in range(len(group)):
+                if r["end"] >= group[j]["chunk_start"] and r["end"] <= group[j]["chunk_end"]:
+                    end = r["end"] + group[j]["offset"]
+                    break
+            segments.append({"start": start, "end": end, "text": r['text'].strip()})
+        return segments
+
+    # translation stage for one language, all segments of a chunk in one batch
+    def _translate_stage(self, lang, translator):
+        def translate(item):
+            i, group, segments, texts = item
+            if lang in texts:
+                # restored from a checkpoint
+                return item
+            if translator is None:
+                texts[lang] = [segment["text"] for segment in segments]
+            else:
+                texts[lang] = translator.translate_batch([segment["text"] for segment in segments])
+            return i, group, segments, texts
+        return translate
+
+    # append a chunk's cues, the writer keeps them from overlapping the next chunk
+    def _compose(self, writer, segments, texts) -> None:
+        for segment, text in zip(segments, texts):
+            writer.add(datetime.timedelta(seconds=segment["start"]), datetime.timedelta(seconds=segment["end"]), text)
+        writer.flush()
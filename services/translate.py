@@ -1,56 +1,159 @@
-from transformers import MarianMTModel, MarianTokenizer
 import srt
-from bs4 import BeautifulSoup
-from typing import List
+import time
+from typing import Callable, List, Optional
+from .registry import ModelRegistry
+from .memory import TranslationMemory
+from .backends import create_backend
+from .srt_writer import SrtWriter
+from .subtitles import apply_markup, clean_text, parse_srt, strip_markup, wrap_text
+from .metrics import Metrics
 
 
 class Translator:
 
-    def __init__(self, logger, model_name: str, device: str, is_cli: bool = False):
+    def __init__(self, logger, model_name: str, device: str, is_cli: bool = False, max_batch_tokens: int = 4096, memory: Optional[TranslationMemory] = None, quantize: bool = False, backend: str = "transformers", backend_options: Optional[dict] = None):
         self.logger = logger
         self.is_cli = is_cli
-        self.tokenizer = MarianTokenizer.from_pretrained(model_name)
-        self.model = MarianMTModel.from_pretrained(model_name)
+        # shared translation memory, translations are looked up before running the model
+        self.memory = memory
+        self.duplicates = 0
+        # padded token budget (batch size * longest input) for a single generate call
+        self.max_batch_tokens = max_batch_tokens
+        self.model_name = model_name
         self.device = device
-        self.model.to(device)
+        # int8 dynamic quantization is only available on cpu
+        self.quantize = quantize and device == "cpu"
+        if quantize and not self.quantize:
+            self.logger.warning(f"int8 quantization is cpu only, {model_name} runs in float32 on {device}.")
+        # generation engine, transformers or onnx, selected per deployment
+        engine = create_backend(backend, model_name, device, quantize=self.quantize, **(backend_options or {}))
+        self.dtype = engine.dtype
+        self.registry = ModelRegistry()
+        self.model = self.registry.acquire(model_name, device, self.dtype, engine.load)
+        self.tokenizer = self.model.tokenizer
 
-    # cut long lines until max_length
-    def split_lines(self, text:str, max_length:int = 80) -> List[str]:
-        words = text.split()
-        lines = []
-        current_line = ""
+    # release the shared model so the registry can evict it when idle
+    def close(self) -> None:
+        if self.model is not None:
+            self.registry.release(self.model_name, self.device, self.dtype)
+            self.model = None
+            self.tokenizer = None
+
+    def __enter__(self):
+        return self
 
-        for word in words:
-            if len(current_line) + len(word) + 1 <= max_length:
-                current_line += (word + " ")
-            else:
-                lines.append(current_line.strip())
-                current_line = word + " "
+    def __exit__(self, *args) -> None:
+        self.close()
 
-        lines.append(current_line.strip())
-        return lines
+    # cut long lines until max_length display columns
+    def split_lines(self, text:str, max_length:int = 80) -> List[str]:
+        return wrap_text(text, max_length)
 
     def clean_text(self, text:str) -> str:
-        return BeautifulSoup(text, "html.parser").get_text()
+        return clean_text(text)
+
+    # clean and capitalize text as sent to the model
+    def prepare_text(self, text: str) -> str:
+        return self.clean_text(text).capitalize()
 
     # translate text method
     def translate_text(self, text: str) -> str:
-        clean_content = self.clean_text(text)
+        clean_content = self.prepare_text(text)
+        # lines differing only in whitespace or unicode composition share a memory entry
+        key = TranslationMemory.normalize(clean_content)
+        if self.memory is not None:
+            cached = self.memory.get(self.model_name, key)
+            if cached is not None:
+                return cached
         # input text tokenizer
-        inputs = self.tokenizer(clean_content.capitalize(), return_tensors="pt", add_special_tokens=True, padding=False, truncation=False).to(self.device)
+        inputs = self.tokenizer(clean_content, return_tensors="pt", add_special_tokens=True, padding=False, truncation=False)
         # translate
-        translated_tokens = self.model.generate(**inputs)
+        translated_tokens = self.model.generate(inputs["input_ids"], inputs["attention_mask"])
         # decode output
         translated_text = self.tokenizer.batch_decode(translated_tokens, skip_special_tokens=True)
+        if self.memory is not None:
+            self.memory.put(self.model_name, key, translated_text[0])
         return translated_text[0]
 
+    # translate many texts at once, repeated lines and lines found in memory are translated only once
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        clean_contents = [self.prepare_text(text) for text in texts]
+        Metrics().inc("llm_translated_lines_total", len(clean_contents), model=self.model_name)
+        # normalized text -> the first line sent to the model for it
+        keys = [TranslationMemory.normalize(text) for text in clean_contents]
+        unique = {}
+        for key, text in zip(keys, clean_contents):
+            unique.setdefault(key, text)
+        self.duplicates += len(clean_contents) - len(unique)
+
+        known = {}
+        if self.memory is not None:
+            known = self.memory.get_many(self.model_name, list(unique))
+        pending = [key for key in unique if key not in known]
+        translated = dict(zip(pending, self._generate_batch([unique[key] for key in pending])))
+        if self.memory is not None:
+            self.memory.put_many(self.model_name, translated)
+        known.update(translated)
+        return [known[key] for key in keys]
+
+    # run the model grouping texts in length sorted buckets
+    def _generate_batch(self, clean_contents: List[str]) -> List[str]:
+        if len(clean_contents) == 0:
+            return []
+        encoded = self.tokenizer(clean_contents, add_special_tokens=True, padding=False, truncation=False)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        order = sorted(range(len(clean_contents)), key=lambda i: lengths[i])
+
+        translations = [""] * len(clean_contents)
+        for bucket in self._buckets(order, lengths):
+            inputs = self.tokenizer.pad(
+                {"input_ids": [encoded["input_ids"][i] for i in bucket],
+                 "attention_mask": [encoded["attention_mask"][i] for i in bucket]},
+                padding=True, return_tensors="pt")
+            started = time.perf_counter()
+            translated_tokens = self.model.generate(inputs["input_ids"], inputs["attention_mask"])
+            self._generated(translated_tokens, started)
+            decoded = self.tokenizer.batch_decode(translated_tokens, skip_special_tokens=True)
+            # restore original order
+            for i, text in zip(bucket, decoded):
+                translations[i] = text
+        return translations
+
+    # generation time and tokens generated, padding excluded
+    def _generated(self, translated_tokens, started: float) -> None:
+        metrics = Metrics()
+        if not metrics.enabled:
+            return
+        seconds = time.perf_counter() - started
+        metrics.observe("generate", seconds, started, model=self.model_name)
+        pad = self.tokenizer.pad_token_id
+        tokens = sum(1 for ids in translated_tokens for token in ids if token != pad)
+        metrics.inc("llm_generated_tokens_total", tokens, model=self.model_name)
+        if seconds > 0:
+            metrics.set_gauge("llm_translation_tokens_per_second", tokens / seconds, model=self.model_name)
+
+    # split sorted indexes in buckets whose padded size fits in max_batch_tokens
+    def _buckets(self, order: List[int], lengths: List[int]) -> List[List[int]]:
+        buckets = []
+        current = []
+        for i in order:
+            # order is sorted by length, so the current item is the longest of the bucket
+            if len(current) > 0 and (len(current) + 1) * lengths[i] > self.max_batch_tokens:
+                buckets.append(current)
+                current = []
+            current.append(i)
+        if len(current) > 0:
+            buckets.append(current)
+        return buckets
+
     # load str file
-    def load_srt(self, file_path:str) -> List[str]:
+    def load_srt(self, file_path:str) -> List[srt.Subtitle]:
         with open(file_path, 'r', encoding='utf-8') as f:
-            return list(srt.parse(f.read()))
+            return list(parse_srt(f))
 
     # translate function keeping time and str's structure
-    def translate_srt_file(self, srt_file: str, output_file: str):
+    # cues are appended to <output>.part every batch_cues cues, on_progress(stage, progress, detail) gets the translated fraction
+    def translate_srt_file(self, srt_file: str, output_file: str, batched: bool = True, batch_cues: int = 256, on_progress: Optional[Callable[[str, float, Optional[str]], None]] = None):
         if self.is_cli:
             print(f"translating file {srt_file} to output: {output_file}")
         
@@ -58,26 +161,33 @@ class Translator:
         # load srt file
         subtitles = self.load_srt(srt_file)
 
-        translated_subtitles = []
-
-        # translate each line 
-        for subtitle in subtitles:
-            content = subtitle.content
-            
-            translated_text = self.translate_text(content)
-            lines = self.split_lines(translated_text, max_length=42)
-            # creating new str file
-            translated_subtitle = srt.Subtitle(index=subtitle.index,
-                                            start=subtitle.start,
-                                            end=subtitle.end,
-                                            content="\n".join(lines)+"\n")
-            translated_subtitles.append(translated_subtitle)
-
-        # save generated str file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(srt.compose(translated_subtitles))
+        metrics = Metrics()
+        # original numbering is kept where it is valid, as is the timing of every cue; empty cues are dropped
+        with SrtWriter(output_file, reindex=False, fix_overlaps=False) as writer:
+            for first in range(0, len(subtitles), batch_cues):
+                batch = subtitles[first:first + batch_cues]
+                with metrics.timer("translate"):
+                    if batched:
+                        translations = self.translate_batch([subtitle.content for subtitle in batch])
+                    else:
+                        # translate each line
+                        translations = [self.translate_text(subtitle.content) for subtitle in batch]
+
+                with metrics.timer("compose"):
+                    for subtitle, translated_text in zip(batch, translations):
+                        lines = self.split_lines(translated_text, max_length=42)
+                        # italics and the like enclosing the whole cue are put back on its translation
+                        plain, spans = strip_markup(subtitle.content)
+                        writer.add(subtitle.start, subtitle.end, apply_markup("\n".join(lines), spans, len(plain))+"\n", index=subtitle.index)
+                    writer.flush()
+                if on_progress is not None:
+                    on_progress("translate", (first + len(batch)) / len(subtitles), f"cues {first + len(batch)}/{len(subtitles)}")
+            if on_progress is not None:
+                on_progress("compose", 1.0, None)
         
         if self.is_cli:
             print("translation completed")
         self.logger.info("translation completed")
+        if self.memory is not None:
+            self.logger.info(f"translation memory stats: {self.memory.stats()}, duplicated lines: {self.duplicates}")
 
@@ -1,8 +1,13 @@
 from langdetect import detect
+import torch
 import whisper
-import srt
+import itertools
 import random
 from collections import defaultdict
+from .registry import ModelRegistry
+from .audio import open_audio
+from .subtitles import parse_srt
+from .metrics import Metrics
 
 class Utils:
     @staticmethod
@@ -13,67 +18,79 @@ class Utils:
         except:
             return ""
     
+    # solo se leen del archivo los primeros 50 subtítulos
     @staticmethod
     def read_file(file_path: str) -> str:
-        lines = ''
         with open(file_path, "r") as f:
-            content = f.read()
-        subs = list(srt.parse(content))
-        for i, sub in enumerate(subs):
-            if i >= 50:
-                break
-            lines += sub.content
-        return lines
+            return "".join(sub.content for sub in itertools.islice(parse_srt(f), 50))
+
+    @staticmethod
+    def detect_language(audio_file_path: str, samples_number=5, device: str = None, confidence: float = 0.8, batch_size: int = None, seed: int = None, audio=None):
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Cargar el modelo de Whisper "base" desde el registro compartido (porque sólo queremos detectar el idioma del audio)
+        with Utils.detection_model(device) as model, Metrics().timer("detect_language"):
+            # audio ya abierto por quien llama no se cierra aquí
+            opened = audio is None
+            audio = open_audio(audio_file_path) if opened else audio
+            try:
+                return Utils._detect_language(model, audio, samples_number, device, confidence, batch_size, seed)
+            finally:
+                if opened:
+                    audio.close()
 
+    # registry key of the language detection model
     @staticmethod
-    def detect_language(audio_file_path: str, samples_number=5):
-        # Cargar el audio
-        audio = whisper.load_audio(f"{audio_file_path}")
+    def detection_model_key(device: str):
+        return ("whisper-base", device, "float32")
 
-        # Cargar el modelo de Whisper "base" (porque sólo queremos detectar el idioma del audio)
-        model = whisper.load_model("base", download_root="media/models", device="cuda")
+    # whisper "base" held in the shared registry while the context is open
+    @staticmethod
+    def detection_model(device: str):
+        return ModelRegistry().use(*Utils.detection_model_key(device), lambda: whisper.load_model("base", download_root="media/models", device=device))
 
+    @staticmethod
+    def _detect_language(model, audio, samples_number: int, device: str, confidence: float, batch_size: int, seed: int):
+        window = whisper.audio.CHUNK_LENGTH * whisper.audio.SAMPLE_RATE
+        # En un stream solo se lee en cualquier orden lo que cabe en su buffer, sin perder el inicio para el VAD
+        num_samples = min(audio.num_samples, getattr(audio, "capacity", audio.num_samples))
         # Optimización: si la longitud del audio es <= que el tamaño de chunk de Whisper, solo tomaremos 1 muestra
-        if len(audio) <= whisper.audio.CHUNK_LENGTH * whisper.audio.SAMPLE_RATE:
+        if num_samples <= window:
             samples_number = 1
 
-        probabilities_map = defaultdict(list)
-
+        # Seleccionar los fragmentos de audio al azar, seed los hace reproducibles
+        rng = random.Random(seed)
+        windows = []
         for i in range(samples_number):
-            # Seleccionar un fragmento de audio al azar
-            random_center = random.randint(0, len(audio) - 1)
-            start = random_center - (whisper.audio.CHUNK_LENGTH // 2) * whisper.audio.SAMPLE_RATE
-            end = random_center + (whisper.audio.CHUNK_LENGTH // 2) * whisper.audio.SAMPLE_RATE
-
+            random_center = rng.randint(0, num_samples - 1)
             # Asegurarse de que el rango de audio esté dentro de los límites
-            start = max(0, start)
-            start = min(start, len(audio) - 1)
-            end = max(0, end)
-            end = min(end, len(audio) - 1)
+            start = min(max(0, random_center - window // 2), num_samples - 1)
+            end = min(max(0, random_center + window // 2), num_samples - 1)
+            windows.append((start, end))
 
-            # Extraer el fragmento de audio
-            audio_fragment = audio[start:end]
+        # Primero un fragmento, si no alcanza la confianza el resto en un solo lote
+        if batch_size is None:
+            batches = [windows[:1], windows[1:]]
+        else:
+            batches = [windows[i:i + batch_size] for i in range(0, len(windows), batch_size)]
 
-            # Asegurarse de que el fragmento tenga el tamaño adecuado para Whisper
-            audio_fragment = whisper.pad_or_trim(audio_fragment)
-
-            # Extraer el espectrograma Mel
-            mel = whisper.log_mel_spectrogram(audio_fragment)
-
-            # Mover el espectrograma Mel a la GPU
-            mel = mel.to("cuda")
-
-            # Detectar el idioma del fragmento
-            _, _probs = model.detect_language(mel)
-
-            # Almacenar las probabilidades de cada idioma
-            for lang_key in _probs:
-                probabilities_map[lang_key].append(_probs[lang_key])
-
-        # Calcular la probabilidad promedio para cada idioma
-        for lang_key in probabilities_map:
-            probabilities_map[lang_key] = sum(probabilities_map[lang_key]) / len(probabilities_map[lang_key])
+        probabilities_map = defaultdict(float)
+        samples = 0
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            # Solo se leen del archivo los fragmentos seleccionados
+            mels = [whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio.read(start, end))), n_mels=model.dims.n_mels, device=device) for start, end in batch]
+            # Detectar el idioma de todos los fragmentos en una sola pasada
+            with torch.no_grad():
+                _, probs = model.detect_language(torch.stack(mels))
+            for _probs in probs:
+                for lang_key in _probs:
+                    probabilities_map[lang_key] += _probs[lang_key]
+            samples += len(batch)
+            detected_lang = max(probabilities_map, key=probabilities_map.get)
+            if probabilities_map[detected_lang] / samples >= confidence:
+                break
 
-        # Devolver el idioma con la probabilidad más alta
-        detected_lang = max(probabilities_map, key=probabilities_map.get)
-        return detected_lang
+        # Devolver el idioma con la probabilidad promedio más alta
+        return max(probabilities_map, key=probabilities_map.get)
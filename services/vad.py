@@ -0,0 +1,101 @@
+import copy
+import torch
+from typing import Iterator, List
+
+from .registry import ModelRegistry
+
+class StreamingVAD:
+    # Runs Silero VAD incrementally over fixed windows of an audio source and
+    # yields speech groups as soon as they are closed by a long enough silence.
+
+    FRAME = 512 # silero frame size at 16 kHz
+    HEAD_PADDING = 3200 # 0.2s
+    TAIL_PADDING = 20800 # 1.3s
+    MIN_SPEECH = 4000 # 0.25s, same as get_speech_timestamps
+
+    def __init__(self, logger, sampling_rate: int = 16000, threshold: float = 0.4, chunk_threshold: float = 3.0, window_seconds: int = 30) -> None:
+        self.logger = logger
+        self.sampling_rate = sampling_rate
+        self.threshold = threshold
+        self.chunk_threshold = chunk_threshold
+        self.window = window_seconds * sampling_rate // self.FRAME * self.FRAME
+
+    @staticmethod
+    def load_model():
+        return torch.hub.load(repo_or_dir="snakers4/silero-vad", model="silero_vad", onnx=False, trust_repo=True)
+
+    # silero keeps its recurrent state inside the model, so every run works on its own copy
+    def _iterator(self):
+        with ModelRegistry().use("silero-vad", "cpu", "float32", self.load_model) as (model, utils):
+            (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
+            return VADIterator(copy.deepcopy(model), threshold=self.threshold, sampling_rate=self.sampling_rate)
+
+    # raw speech segments in samples
+    def speech(self, audio) -> Iterator[dict]:
+        iterator = self._iterator()
+        start = None
+        # streamed audio only knows its length once decoded, so windows are read until one comes back empty
+        window_start = 0
+        while True:
+            window_end = window_start + self.window
+            wav = torch.from_numpy(audio.read(window_start, window_end))
+            if len(wav) == 0:
+                break
+            for i in range(0, len(wav), self.FRAME):
+                frame = wav[i:i + self.FRAME]
+                if len(frame) < self.FRAME:
+                    frame = torch.nn.functional.pad(frame, (0, self.FRAME - len(frame)))
+                event = iterator(frame)
+                if event is None:
+                    continue
+                if "start" in event:
+                    start = event["start"]
+                elif start is not None:
+                    if event["end"] - start >= self.MIN_SPEECH:
+                        yield {"start": start, "end": event["end"]}
+                    start = None
+            audio.release(window_start, window_end)
+            window_start = window_end
+        if start is not None and audio.num_samples - start >= self.MIN_SPEECH:
+            yield {"start": start, "end": audio.num_samples}
+        iterator.reset_states()
+
+    # speech segments grouped into chunks, split where silence is longer than chunk_threshold
+    def groups(self, audio) -> Iterator[List[dict]]:
+        group = []
+        previous = None
+        for segment in self.speech(audio):
+            # Add a bit of padding, and remove small gaps
+            current = {
+                "start": max(0, segment["start"] - self.HEAD_PADDING),
+                "end": min(audio.num_samples - 16, segment["end"] + self.TAIL_PADDING),
+            }
+            if previous is not None and current["start"] < previous["end"]:
+                current["start"] = previous["end"]  # Remove overlap
+            # If breaks are longer than chunk_threshold seconds, close the group
+            if previous is not None and current["start"] > previous["end"] + (self.chunk_threshold * self.sampling_rate):
+                yield self.to_seconds(group)
+                group = []
+            group.append(current)
+            previous = current
+        if len(group) > 0:
+            yield self.to_seconds(group)
+
+    # Convert timestamps to seconds, keeping sample positions to slice the audio
+    def to_seconds(self, group: List[dict]) -> List[dict]:
+        time = 0.0
+        offset = 0.0
+        for j in range(len(group)):
+            group[j]["sample_start"] = group[j]["start"]
+            group[j]["sample_end"] = group[j]["end"]
+            group[j]["start"] /= self.sampling_rate
+            group[j]["end"] /= self.sampling_rate
+            group[j]["chunk_start"] = time
+            time += group[j]["end"] - group[j]["start"]
+            group[j]["chunk_end"] = time
+            if j == 0:
+                offset += group[j]["start"]
+            else:
+                offset += group[j]["start"] - group[j - 1]["end"]
+            group[j]["offset"] = offset
+        return group
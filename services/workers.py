@@ -0,0 +1,300 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .runtime import configure_threads, load_whisper
+
+class WorkerSpec(NamedTuple):
+    device: str
+    # cpus the worker process is pinned to, None keeps the parent's affinity
+    cpus: Optional[List[int]] = None
+
+# "0-3,8" -> [0, 1, 2, 3, 8]
+def parse_cpus(value: str) -> List[int]:
+    cpus = []
+    for part in value.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.append(int(part))
+    return cpus
+
+# worker layout from an explicit list like "cuda:0;cuda:1" or "cpu:0-7;cpu:8-15",
+# otherwise count workers round robin over the gpus or splitting the available cpus
+def plan_workers(count: int, device: str, layout: str = "") -> List[WorkerSpec]:
+    if layout:
+        specs = []
+        for entry in layout.split(";"):
+            entry = entry.strip()
+            if entry.startswith("cpu"):
+                specs.append(WorkerSpec("cpu", parse_cpus(entry[4:]) if entry.startswith("cpu:") else None))
+            elif entry:
+                specs.append(WorkerSpec(entry))
+        return specs
+    if count <= 0:
+        return []
+    if device.startswith("cuda"):
+        import torch
+        gpus = max(1, torch.cuda.device_count())
+        return [WorkerSpec(f"cuda:{i % gpus}") for i in range(count)]
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < count:
+        return [WorkerSpec("cpu") for _ in range(count)]
+    size = len(cpus) // count
+    return [WorkerSpec("cpu", cpus[i * size:(i + 1) * size]) for i in range(count)]
+
+def _limit_memory(spec: WorkerSpec, memory_mb: int) -> None:
+    if memory_mb <= 0:
+        return
+    if spec.device.startswith("cuda"):
+        import torch
+        total = torch.cuda.get_device_properties(torch.device(spec.device)).total_memory
+        torch.cuda.set_per_process_memory_fraction(min(1.0, memory_mb * 1024 * 1024 / total), torch.device(spec.device))
+    else:
+        import resource
+        # heap and anonymous mappings, a job going over fails with MemoryError instead of taking the host down
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+# worker process: pins itself, loads whisper once and transcribes chunks until told to stop
+def _work(index: int, spec: WorkerSpec, model_name: str, quantize: bool, memory_mb: int, loader: Callable, conn) -> None:
+    try:
+        if spec.cpus:
+            os.sched_setaffinity(0, spec.cpus)
+        configure_threads(intra_op=len(spec.cpus) if spec.cpus else 0)
+        if spec.device.startswith("cuda"):
+            import torch
+            torch.cuda.set_device(torch.device(spec.device))
+        _limit_memory(spec, memory_mb)
+        model = loader(model_name, spec.device, quantize)
+    except BaseException as e:
+        conn.send(("failed", None, f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None, None))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        job_id, samples, language = job
+        try:
+            result = model.transcribe(samples, task="transcribe", language=language, fp16=spec.device != "cpu")
+            segments = [{"start": r["start"], "end": r["end"], "text": r["text"]} for r in result["segments"]]
+            conn.send(("done", job_id, segments))
+        except BaseException as e:
+            conn.send(("error", job_id, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, process, conn) -> None:
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.job_id = None
+
+
+class WhisperPool:
+    # Worker processes each holding a resident whisper model, pinned to a device or a
+    # cpu set. Every worker has its own pipe and the pool hands the next chunk to
+    # whichever worker is idle, submit returns a future with the chunk's whisper segments.
+
+    def __init__(self, logger, specs: List[WorkerSpec], model_name: str = "large", quantize: bool = False, memory_mb: int = 0, loader: Callable = load_whisper) -> None:
+        if len(specs) == 0:
+            raise ValueError("whisper pool needs at least one worker.")
+        self.logger = logger
+        self.specs = specs
+        self.model_name = model_name
+        self.quantize = quantize
+        self.memory_mb = memory_mb
+        self.loader = loader
+        # cuda can't be used in forked processes
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: Dict[int, _Worker] = {}
+        self._pending = deque()
+        self._futures: Dict[int, Future] = {}
+        self._failed = set()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._stopped = threading.Event()
+        self._started = threading.Event()
+        self._dispatcher = None
+
+    @property
+    def size(self) -> int:
+        return len(self.specs)
+
+    def start(self) -> "WhisperPool":
+        for index in range(len(self.specs)):
+            self._spawn(index)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="whisper-pool", daemon=True)
+        self._dispatcher.start()
+        self.logger.info(f"whisper pool started with {self.size} workers: {', '.join(self._describe(spec) for spec in self.specs)}")
+        return self
+
+    # wait until every worker loaded its model or failed to
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._started.wait(timeout)
+
+    @staticmethod
+    def _describe(spec: WorkerSpec) -> str:
+        if spec.cpus:
+            return f"{spec.device}[{len(spec.cpus)} cpus]"
+        return spec.device
+
+    def _spawn(self, index: int) -> None:
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_work, name=f"whisper-{index}", daemon=True,
+                                        args=(index, self.specs[index], self.model_name, self.quantize, self.memory_mb, self.loader, child_conn))
+        process.start()
+        # only the worker keeps its end open, so the pool sees EOF when it dies
+        child_conn.close()
+        self._workers[index] = _Worker(process, conn)
+
+    def submit(self, samples: np.ndarray, language: str) -> Future:
+        future = Future()
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError("whisper pool is stopped.")
+            if len(self._failed) == self.size:
+                raise RuntimeError("no whisper worker could be started.")
+            job_id = next(self._ids)
+            self._futures[job_id] = future
+            self._pending.append((job_id, samples, language))
+            self._wakeup_writer.send(None)
+        return future
+
+    def _resolve(self, job_id: int, result=None, error: Optional[str] = None) -> None:
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        # chunks of a cancelled transcription still finish in the worker, their result is dropped
+        if future is None or not future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _fail_pending(self, error: str) -> None:
+        with self._lock:
+            futures, self._futures = self._futures, {}
+            self._pending.clear()
+        for future in futures.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError(error))
+
+    # hand pending chunks to idle workers, skipping the ones cancelled while queued
+    def _assign(self) -> None:
+        for index, worker in self._workers.items():
+            if not worker.ready or worker.job_id is not None:
+                continue
+            with self._lock:
+                job = None
+                while len(self._pending) > 0 and job is None:
+                    job = self._pending.popleft()
+                    if self._futures[job[0]].cancelled():
+                        self._futures.pop(job[0])
+                        job = None
+            if job is None:
+                return
+            worker.job_id = job[0]
+            try:
+                worker.conn.send(job)
+            except OSError:
+                # died meanwhile, picked up by _dispatch
+                pass
+
+    def _dispatch(self) -> None:
+        while not self._stopped.is_set():
+            self._assign()
+            connections = {worker.conn: index for index, worker in self._workers.items()}
+            for conn in wait(list(connections) + [self._wakeup_reader], timeout=1):
+                if conn is self._wakeup_reader:
+                    while self._wakeup_reader.poll():
+                        self._wakeup_reader.recv()
+                    continue
+                index = connections[conn]
+                try:
+                    status, job_id, payload = conn.recv()
+                except (EOFError, OSError):
+                    self._lost(index)
+                    continue
+                self._handle(index, status, job_id, payload)
+
+    def _handle(self, index: int, status: str, job_id: Optional[int], payload) -> None:
+        worker = self._workers[index]
+        if status == "done":
+            worker.job_id = None
+            self._resolve(job_id, result=payload)
+        elif status == "error":
+            worker.job_id = None
+            self._resolve(job_id, error=payload)
+        elif status == "ready":
+            worker.ready = True
+            self.logger.info(f"whisper worker {index} ready on {self._describe(self.specs[index])}")
+        elif status == "failed":
+            self._fail_worker(index, f"failed to start: {payload}")
+        self._check_started()
+
+    # a worker that couldn't load its model is not started again, the pool runs on the others
+    def _fail_worker(self, index: int, reason: str) -> None:
+        self._failed.add(index)
+        self.logger.error(f"whisper worker {index} {reason}")
+        if len(self._failed) == self.size:
+            self._fail_pending("no whisper worker could be started.")
+
+    def _check_started(self) -> None:
+        if sum(w.ready for w in self._workers.values()) + len(self._failed) == self.size:
+            self._started.set()
+
+    # a worker that died takes its current chunk with it, the chunk fails and the worker is replaced;
+    # one that died before it was ready counts as failed, so a crash on load doesn't restart it forever
+    def _lost(self, index: int) -> None:
+        worker = self._workers.pop(index)
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        if index in self._failed or self._stopped.is_set():
+            return
+        if not worker.ready:
+            self._fail_worker(index, f"exited with code {worker.process.exitcode} before loading whisper")
+            self._check_started()
+            return
+        if worker.job_id is not None:
+            self._resolve(worker.job_id, error=f"whisper worker {index} exited with code {worker.process.exitcode}")
+        self.logger.error(f"whisper worker {index} exited with code {worker.process.exitcode}, restarting it.")
+        self._spawn(index)
+
+    def stop(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        for worker in self._workers.values():
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers.values():
+            worker.process.join(timeout=30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self._fail_pending("whisper pool stopped.")
+        self.logger.info("whisper pool stopped.")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
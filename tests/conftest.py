@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# tiny local opus-mt like models by beam size, built once per session
+@pytest.fixture(scope="session")
+def tiny_marian(tmp_path_factory):
+    import tiny_marian as builder
+    models = {}
+    def build(num_beams: int = 1) -> str:
+        if num_beams not in models:
+            models[num_beams] = builder.build(str(tmp_path_factory.mktemp(f"tiny-marian-beam{num_beams}")), num_beams=num_beams)
+        return models[num_beams]
+    return build
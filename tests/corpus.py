@@ -0,0 +1,58 @@
+import datetime
+import random
+import srt
+
+WORDS = ("the we you they house night road water light time friend never always "
+         "again where what when tomorrow please help run stop look here there "
+         "every little thing gonna be alright come back home now later").split()
+
+# generate a deterministic synthetic srt corpus with repeated lines like real episodes
+def make_srt(path: str, cues: int, seed: int = 0, repeat_ratio: float = 0.2) -> str:
+    rng = random.Random(seed)
+    subs = []
+    seen = []
+    start = 1.0
+    for i in range(cues):
+        if seen and rng.random() < repeat_ratio:
+            text = rng.choice(seen)
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14))).capitalize() + "."
+            if rng.random() < 0.1:
+                text = f"<i>{text}</i>"
+            seen.append(text)
+        duration = rng.uniform(1.0, 4.0)
+        subs.append(srt.Subtitle(index=i + 1,
+                                 start=datetime.timedelta(seconds=start),
+                                 end=datetime.timedelta(seconds=start + duration),
+                                 content=text))
+        start += duration + rng.uniform(0.1, 2.0)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(srt.compose(subs))
+    return path
+
+# write a synthetic 16 kHz mono pcm_s16le wav alternating noisy "speech" bursts and silence,
+# written in blocks so hours long files don't need to fit in memory
+def make_wav(path: str, seconds: float, seed: int = 0, sample_rate: int = 16000) -> str:
+    import wave
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        written = 0
+        while written < total:
+            n = min(total - written, int(rng.uniform(1.0, 8.0) * sample_rate))
+            t = np.arange(n) / sample_rate
+            if rng.random() < 0.6:
+                # harmonic tone with syllable like amplitude modulation
+                f0 = rng.uniform(90, 250)
+                block = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+                block *= 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) * 0.2
+                block += rng.normal(0, 0.01, n)
+            else:
+                block = rng.normal(0, 0.002, n)
+            f.writeframes((np.clip(block, -1, 1) * 32767).astype("<i2").tobytes())
+            written += n
+    return path
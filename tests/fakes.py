@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+# Stand ins seeded into the model registry under the keys the services look up, so the
+# api, cli and services run without downloads: whisper large, the language detection
+# model, silero VAD and opus-mt models (tiny local ones from tiny_marian), and a local
+# notification service. Shared by the tests and the benchmarks.
+
+class FakeWhisper:
+    # spends cpu proportional to the audio length and returns one segment per 2 seconds
+    def __init__(self, work: int) -> None:
+        self.work = work
+
+    def transcribe(self, samples, task="transcribe", language=None, fp16=False):
+        seconds = len(samples) / 16000
+        matrix = np.random.default_rng(len(samples)).standard_normal((self.work, self.work)).astype(np.float32)
+        for _ in range(max(1, int(seconds))):
+            matrix = np.tanh(matrix @ matrix)
+        segments = [{"start": start, "end": min(seconds, start + 2.5), "text": f"segment {len(samples)}:{start:.0f}"}
+                    for start in np.arange(0, seconds, 2.0)]
+        return {"segments": segments}
+
+class FakeDetector:
+    # whisper "base" detection answering a fixed language after latency seconds per batch
+    def __init__(self, language: str = "en", latency: float = 0.0) -> None:
+        self.language = language
+        self.latency = latency
+        self.dims = SimpleNamespace(n_mels=80)
+
+    def detect_language(self, mels):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return None, [{self.language: 1.0} for _ in range(len(mels))]
+
+class EnergyIterator:
+    # VADIterator look alike: speech where a frame's rms is over the threshold, ended after
+    # 100ms of quiet frames, deterministic and a lot faster than silero
+    def __init__(self, model=None, threshold: float = 0.4, sampling_rate: int = 16000, min_silence_ms: int = 100) -> None:
+        self.threshold = threshold
+        self.min_silence = sampling_rate * min_silence_ms // 1000
+        self.reset_states()
+
+    def reset_states(self) -> None:
+        self.position = 0
+        self.speech_start = None
+        self.silence_start = None
+
+    def __call__(self, frame):
+        samples = frame.numpy() if hasattr(frame, "numpy") else np.asarray(frame)
+        start = self.position
+        self.position += len(samples)
+        # rms of 0.05 and above counts as certain speech
+        probability = min(1.0, float(np.sqrt(np.mean(samples ** 2))) * 20)
+        if probability >= self.threshold:
+            self.silence_start = None
+            if self.speech_start is None:
+                self.speech_start = start
+                return {"start": start}
+            return None
+        if self.speech_start is None:
+            return None
+        if self.silence_start is None:
+            self.silence_start = start
+        if self.position - self.silence_start >= self.min_silence:
+            end = self.silence_start
+            self.speech_start = self.silence_start = None
+            return {"end": end}
+        return None
+
+def seed_vad_model():
+    # torch.hub needs github, use the silero-vad package when it's installed
+    try:
+        import silero_vad
+    except ImportError:
+        return
+    from services import ModelRegistry
+    utils = (silero_vad.get_speech_timestamps, silero_vad.save_audio, silero_vad.read_audio, silero_vad.VADIterator, silero_vad.collect_chunks)
+    ModelRegistry().acquire("silero-vad", "cpu", "float32", lambda: (silero_vad.load_silero_vad(), utils))
+
+def seed_vad(kind: str = "energy") -> None:
+    from services import ModelRegistry
+    if kind == "silero":
+        seed_vad_model()
+        return
+    utils = (None, None, None, EnergyIterator, None)
+    ModelRegistry().acquire("silero-vad", "cpu", "float32", lambda: (None, utils))
+
+# translators maps opus-mt pairs ("en-es") to local model paths
+def seed_registry(device: str = "cpu", translators: dict = None, vad: str = "energy", whisper_work: int = 256,
+                  detect_language: str = "en", detect_latency: float = 0.0) -> None:
+    from services import ModelRegistry, Utils
+    from services.backends import create_backend
+    registry = ModelRegistry()
+    seed_vad(vad)
+    registry.acquire("whisper-large", device, "float32", lambda: FakeWhisper(whisper_work))
+    registry.acquire(*Utils.detection_model_key(device), lambda: FakeDetector(detect_language, detect_latency))
+    for pair, path in (translators or {}).items():
+        engine = create_backend("transformers", path, device)
+        registry.acquire(f"Helsinki-NLP/opus-mt-{pair}", device, engine.dtype, engine.load)
+
+class Stub:
+    # notification service counting events, posts and tcp connections, failing with 503 while failing is set
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.failing = False
+        self.events = []
+        self.posts = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.latency)
+                with stub.lock:
+                    stub.connections.add(self.client_address)
+                    if not stub.failing:
+                        stub.posts += 1
+                        stub.events.extend(body["events"] if "events" in body else [body])
+                status = 503 if stub.failing else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.events, self.posts, self.connections = [], 0, set()
+
+    def wait_for(self, count: int, timeout: float) -> float:
+        started = time.perf_counter()
+        while len(self.events) < count and time.perf_counter() - started < timeout:
+            time.sleep(0.01)
+        return time.perf_counter() - started
+
+def payload(i: int) -> dict:
+    return {"status": "task completed", "title": f"title {i}", "file": f"media/{i}.es.srt", "destinationPath": "/library"}
+
+# events sent from concurrent workers, returns the slowest single send in ms
+def send_all(send, events: int, senders: int) -> float:
+    slowest = [0.0]
+    def worker(offset):
+        for i in range(offset, events, senders):
+            started = time.perf_counter()
+            send(payload(i))
+            slowest[0] = max(slowest[0], time.perf_counter() - started)
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return slowest[0] * 1000
@@ -0,0 +1,49 @@
+import pytest
+
+from corpus import make_wav
+from fakes import FakeWhisper, seed_registry
+from services import DBManager, Logger, TaskCheckpoint, Transcriptor, Translator
+
+class Interrupted(Exception):
+    pass
+
+def transcribe(wav: str, outputs: str, checkpoint: TaskCheckpoint, on_progress=None) -> dict:
+    logger = Logger()
+    with Translator(logger, "Helsinki-NLP/opus-mt-en-es", "cpu") as translator, Transcriptor(logger, None, device="cpu") as transcriptor:
+        targets = {"en": (None, f"{outputs}.en.srt"), "es": (translator, f"{outputs}.es.srt")}
+        result = transcriptor.transcript_languages("en", wav, targets, checkpoint=checkpoint, on_progress=on_progress)
+    return {lang: open(path, encoding="utf-8").read() for lang, path in result.items()}
+
+def test_resumed_task_writes_the_same_outputs(tiny_marian, tmp_path, monkeypatch):
+    seed_registry(translators={"en-es": tiny_marian()}, whisper_work=16)
+    wav = make_wav(str(tmp_path / "source.wav"), seconds=60)
+    db = DBManager(logger=Logger(), db_file=str(tmp_path / "tasks.db"))
+    expected = transcribe(wav, str(tmp_path / "full"), TaskCheckpoint(db, db.insert_task(("transcript", "en,es", "full", wav, "/library"))))
+    assert set(expected) == {"en", "es"} and all(expected.values())
+
+    task_id = db.insert_task(("transcript", "en,es", "resumed", wav, "/library"))
+    chunks = []
+    def interrupt(stage, progress, detail):
+        if stage == "transcript":
+            chunks.append(detail)
+            if len(chunks) == 3:
+                raise Interrupted()
+    with pytest.raises(Interrupted):
+        transcribe(wav, str(tmp_path / "resumed"), TaskCheckpoint(db, task_id), on_progress=interrupt)
+    assert not (tmp_path / "resumed.en.srt").exists()
+
+    # restarted like the scheduler does, from what the task row and its checkpoints hold
+    decoded = []
+    original = FakeWhisper.transcribe
+    def counting(self, samples, **kwargs):
+        decoded.append(len(samples))
+        return original(self, samples, **kwargs)
+    monkeypatch.setattr(FakeWhisper, "transcribe", counting)
+    task = db.find_task(task_id)
+    checkpoint = TaskCheckpoint(db, task_id, vad_chunks=task['vad_chunks'], language=task['source_language'])
+    assert len(checkpoint.chunks) == 3
+    resumed = transcribe(wav, str(tmp_path / "resumed"), checkpoint)
+    assert resumed == expected
+    # restored chunks don't go through whisper again
+    total = len(checkpoint.stored)
+    assert len(decoded) == total - 3
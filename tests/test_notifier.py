@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from fakes import Stub, payload, send_all
+from services import DBManager, Logger, Notifier
+
+@pytest.fixture
+def stub():
+    stub = Stub(latency=0.0)
+    yield stub
+    stub.server.shutdown()
+
+@pytest.fixture
+def db(tmp_path):
+    return DBManager(logger=Logger(), db_file=str(tmp_path / "tasks.db"))
+
+def queued(db) -> int:
+    return len(db.due_notifications(time.time() + 3600, 1000))
+
+def test_every_event_is_posted_once_with_its_body(stub, db):
+    notifier = Notifier(Logger(), db, stub.url).start()
+    send_all(notifier.send, 40, 4)
+    stub.wait_for(40, timeout=30)
+    notifier.stop()
+    assert sorted(event["title"] for event in stub.events) == sorted(payload(i)["title"] for i in range(40))
+    # batching is opt-in, one post per notification
+    assert stub.posts == 40
+    assert queued(db) == 0
+
+def test_batched_events_are_all_delivered(stub, db):
+    notifier = Notifier(Logger(), db, stub.url, batch_size=20).start()
+    send_all(notifier.send, 60, 4)
+    stub.wait_for(60, timeout=30)
+    notifier.stop()
+    assert sorted(event["title"] for event in stub.events) == sorted(payload(i)["title"] for i in range(60))
+    assert stub.posts < 60
+
+def test_events_are_retried_until_the_service_is_back(stub, db):
+    stub.failing = True
+    notifier = Notifier(Logger(), db, stub.url, backoff=0.1, max_backoff=0.2).start()
+    send_all(notifier.send, 10, 2)
+    time.sleep(0.5)
+    assert stub.events == []
+    stub.failing = False
+    stub.wait_for(10, timeout=30)
+    notifier.stop()
+    assert len(stub.events) == 10
+    assert notifier.stats()["retried"] > 0
+    assert queued(db) == 0
+
+def test_events_queued_before_a_restart_are_delivered(stub, db):
+    stub.failing = True
+    notifier = Notifier(Logger(), db, stub.url, backoff=60).start()
+    send_all(notifier.send, 10, 2)
+    time.sleep(0.5)
+    notifier.stop()
+    assert queued(db) == 10
+    stub.failing = False
+    notifier = Notifier(Logger(), db, stub.url).start()
+    # queued events keep the backoff of their failed attempt
+    db.execute_query("update notifications set next_attempt_at = 0")
+    notifier.send(payload(-1))
+    stub.wait_for(11, timeout=30)
+    notifier.stop()
+    assert len(stub.events) == 11
+    assert queued(db) == 0
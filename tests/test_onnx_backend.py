@@ -0,0 +1,18 @@
+import pytest
+import srt
+
+from corpus import make_srt
+from services import Logger, Translator
+
+@pytest.mark.parametrize("num_beams", [1, 4])
+def test_onnx_translations_match_transformers(tiny_marian, tmp_path, num_beams):
+    model = tiny_marian(num_beams)
+    with open(make_srt(str(tmp_path / "source.srt"), cues=200), encoding="utf-8") as f:
+        texts = [subtitle.content for subtitle in srt.parse(f.read())]
+    results = {}
+    for backend in ("transformers", "onnx"):
+        options = {"cache_dir": str(tmp_path / "onnx")} if backend == "onnx" else {}
+        with Translator(logger=Logger(), model_name=model, device="cpu", backend=backend, backend_options=options) as translator:
+            results[backend] = translator.translate_batch(texts)
+    assert len(results["onnx"]) == len(texts)
+    assert results["onnx"] == results["transformers"]
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from services import DBManager, Logger, Scheduler, TASK_STATES
+
+@pytest.fixture
+def db(tmp_path):
+    return DBManager(logger=Logger(), db_file=str(tmp_path / "tasks.db"))
+
+def run(db, handler, max_attempts: int, on_failed=None) -> dict:
+    finished = threading.Event()
+    def changed():
+        task = db.find_task(1)
+        if task is not None and TASK_STATES[task['process']] in ("done", "failed"):
+            finished.set()
+    scheduler = Scheduler(Logger(), db, handlers={'transcript': handler}, concurrency={'transcript': 1}, poll_interval=0.05,
+                          on_change=changed, max_attempts=max_attempts, on_failed=on_failed)
+    scheduler.start()
+    try:
+        assert finished.wait(timeout=30)
+    finally:
+        scheduler.stop()
+    return db.find_task(1)
+
+def test_failed_task_is_run_again_from_its_checkpoints(db):
+    db.insert_task(("transcript", "es", "title", "source.wav", "/library"))
+    db.save_checkpoint_group(1, 0, "[]")
+    checkpoints = []
+    def handler(task):
+        checkpoints.append(len(db.find_checkpoints(task['id'])))
+        if len(checkpoints) < 3:
+            raise RuntimeError(f"attempt {len(checkpoints)}")
+        return {"es": "source.es.srt"}
+    task = run(db, handler, max_attempts=3)
+    assert TASK_STATES[task['process']] == "done"
+    assert task['attempts'] == 2
+    assert checkpoints == [1, 1, 1]
+    assert db.find_checkpoints(1) == []
+
+def test_task_is_given_up_after_its_last_attempt(db):
+    db.insert_task(("transcript", "es", "title", "source.wav", "/library"))
+    db.save_checkpoint_group(1, 0, "[]")
+    runs, failed = [], []
+    def handler(task):
+        runs.append(task['id'])
+        raise RuntimeError("no output")
+    task = run(db, handler, max_attempts=2, on_failed=lambda task: failed.append(TASK_STATES[db.find_task(task['id'])['process']]))
+    assert TASK_STATES[task['process']] == "failed"
+    assert task['error'] == "no output"
+    assert len(runs) == 2
+    # called once, while the task still counts as running for the source cleanup
+    assert failed == ["running"]
+    assert db.find_checkpoints(1) == []
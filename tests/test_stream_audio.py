@@ -0,0 +1,57 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from corpus import make_wav
+from fakes import seed_registry
+from services import Logger, Transcriptor
+from services.audio import StreamAudio, WavReader, open_audio
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="needs ffmpeg and ffprobe")
+
+# a wav and the same audio in a flac container, which decodes to the same samples
+@pytest.fixture(scope="module")
+def fixture(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("stream")
+    wav = make_wav(str(workdir / "source.wav"), seconds=120)
+    container = str(workdir / "source.flac")
+    subprocess.run(["ffmpeg", "-y", "-nostdin", "-v", "error", "-i", wav, "-c:a", "flac", container], check=True)
+    return wav, container
+
+def transcribe(path: str, output: str, buffer_seconds: float):
+    seed_registry(whisper_work=16)
+    audio = open_audio(path, buffer_seconds=buffer_seconds)
+    with Transcriptor(Logger(), None, device="cpu", buffer_seconds=buffer_seconds) as transcriptor:
+        transcriptor.transcript_languages("en", path, {"en": (None, output)}, prepared=transcriptor.vad_run(path, audio=audio))
+    with open(output, encoding="utf-8") as f:
+        return f.read(), audio
+
+def test_stream_decodes_the_same_samples(fixture):
+    wav, container = fixture
+    reader = WavReader(wav)
+    audio = StreamAudio(container, capacity_seconds=30)
+    try:
+        for start in range(0, reader.num_samples, 16000 * 10):
+            assert np.array_equal(audio.read(start, start + 16000 * 10), reader.read(start, start + 16000 * 10))
+            audio.consume(start)
+        assert audio.num_samples == reader.num_samples
+    finally:
+        audio.close()
+        reader.close()
+
+def test_stream_transcript_matches_the_wav(fixture, tmp_path):
+    wav, container = fixture
+    expected, _ = transcribe(wav, str(tmp_path / "wav.srt"), 1800)
+    result, audio = transcribe(container, str(tmp_path / "stream.srt"), 1800)
+    assert isinstance(audio, StreamAudio)
+    assert expected != "" and result == expected
+
+# VAD reads ahead of the group being transcribed further than a buffer this small holds
+def test_small_buffer_spills_instead_of_failing(fixture, tmp_path):
+    wav, container = fixture
+    expected, _ = transcribe(wav, str(tmp_path / "wav.srt"), 1800)
+    result, audio = transcribe(container, str(tmp_path / "stream.srt"), 5)
+    assert audio.spilled > 0
+    assert result == expected
@@ -0,0 +1,36 @@
+import pytest
+import srt
+
+from services.subtitles import apply_markup, parse_srt, strip_markup
+
+CUE_1 = "1\n00:00:01,000 --> 00:00:02,000\n"
+CUE_2 = "2\n00:00:03,000 --> 00:00:04,000\n"
+
+@pytest.mark.parametrize("text, expected", [
+    ("{\\an8}<i>Hello there</i>", "{\\an8}<i>Hola</i>"),
+    # override tags are put first
+    ("<i>{\\an8}Hello there</i>", "{\\an8}<i>Hola</i>"),
+    ("{\\an8}{\\pos(10,20)}<b><i>Hello there</i></b>", "{\\an8}{\\pos(10,20)}<b><i>Hola</i></b>"),
+    ("<font color=\"#ffff00\"><i>Hello</i> there</font>", "<font color=\"#ffff00\">Hola</font>"),
+])
+def test_markup_enclosing_the_cue_is_put_back_in_order(text, expected):
+    plain, spans = strip_markup(text)
+    assert plain == "Hello there"
+    assert apply_markup("Hola", spans, len(plain)) == expected
+
+@pytest.mark.parametrize("source", [
+    CUE_1 + "hello\n\n" + CUE_2 + "world\n",
+    CUE_1 + "hello\n\n\n" + CUE_2 + "world\n",
+    CUE_1 + "hello\n\n\n\n" + CUE_2 + "world\n\n\n\n",
+    CUE_1 + "hello\n\nmore\n\n" + CUE_2 + "world",
+    CUE_1 + "hello\n \n\t\n" + CUE_2 + "world",
+    CUE_1 + "hello\n\n \n" + CUE_2 + "world\n \n",
+    CUE_1 + "\n\n\n" + CUE_2 + "world",
+    CUE_1 + "hello\n" + CUE_2 + "world",
+    (CUE_1 + "hello\n\n\n" + CUE_2 + "world\n").replace("\n", "\r\n"),
+])
+def test_cues_are_parsed_like_srt_parse(source):
+    expected = [(cue.index, cue.start, cue.end, cue.content) for cue in srt.parse(source)]
+    assert [(cue.index, cue.start, cue.end, cue.content) for cue in parse_srt(source)] == expected
+    # read line by line from a file as well
+    assert [(cue.index, cue.start, cue.end, cue.content) for cue in parse_srt(source.splitlines(keepends=True))] == expected
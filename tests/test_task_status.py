@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    # the app keeps its uploads and task database under ./media
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("LLM_NOTIFICATION_SERVICE_URL", "http://127.0.0.1:9/")
+        monkeypatch.setenv("LLM_TASK_WAIT_SECONDS", "10")
+        import main
+        yield main
+    os.chdir(cwd)
+
+@pytest.fixture
+def client(main):
+    return main.app.test_client()
+
+def queue(main, language: str = "es") -> int:
+    task_id = main.db.insert_task(("transcript", language, "title", "media/source.wav", "/library"))
+    main.monitor.changed()
+    return task_id
+
+def claim(main, task_id: int) -> None:
+    main.db.update_task_status(task_id)
+    main.db.set_task_progress(task_id, "transcript", 0.5, "chunk 2/4")
+    main.monitor.changed()
+
+def finish(main, task_id: int, error: str = None) -> None:
+    main.db.finish_task(task_id, error=error, outputs=None if error else {"es": "media/source.es.srt"})
+    main.monitor.changed()
+
+def test_status_follows_the_task(main, client):
+    task_id = queue(main)
+    status = client.get(f"/tasks/{task_id}").json
+    assert (status["status"], status["stage"], status["progress"]) == ("pending", "queued", 0.0)
+    assert status["queue_position"] >= 1
+
+    claim(main, task_id)
+    status = client.get(f"/tasks/{task_id}").json
+    assert (status["status"], status["stage"], status["detail"], status["progress"]) == ("running", "transcript", "chunk 2/4", 0.5)
+
+    finish(main, task_id)
+    status = client.get(f"/tasks/{task_id}").json
+    assert (status["status"], status["progress"], status["files"]) == ("done", 1.0, {"es": "media/source.es.srt"})
+
+    failed = queue(main)
+    finish(main, failed, error="no output")
+    status = client.get(f"/tasks/{failed}").json
+    assert (status["status"], status["error"]) == ("failed", "no output")
+
+def test_unknown_task_and_bad_wait(client):
+    assert client.get("/tasks/999999").status_code == 404
+    assert client.get("/tasks/999999/events").status_code == 404
+    assert client.get("/tasks/1?wait=soon").status_code == 400
+
+def test_wait_returns_once_the_task_finished(main, client):
+    task_id = queue(main)
+    claim(main, task_id)
+    timer = threading.Timer(0.3, finish, args=(main, task_id))
+    timer.start()
+    started = time.monotonic()
+    status = client.get(f"/tasks/{task_id}?wait=8").json
+    timer.join()
+    assert status["status"] == "done"
+    assert 0.2 < time.monotonic() - started < 8
+
+    # a wait that expires answers with the current status
+    pending = queue(main)
+    started = time.monotonic()
+    assert client.get(f"/tasks/{pending}?wait=0.3").json["status"] == "pending"
+    assert time.monotonic() - started >= 0.3
+
+def test_events_stream_every_change_until_the_task_finished(main, client):
+    task_id = queue(main)
+    response = client.get(f"/tasks/{task_id}/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+
+    def next_status() -> dict:
+        for chunk in chunks:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith("event: status"):
+                return json.loads(chunk.split("data: ", 1)[1])
+        return None
+
+    assert next_status()["status"] == "pending"
+    claim(main, task_id)
+    running = next_status()
+    assert (running["status"], running["detail"]) == ("running", "chunk 2/4")
+    finish(main, task_id)
+    assert next_status()["status"] == "done"
+    # the stream ends with the task
+    assert next_status() is None
+    response.close()
@@ -0,0 +1,17 @@
+from corpus import make_wav
+from fakes import seed_registry
+from services import Logger, Transcriptor, Translator
+
+def transcribe(wav: str, outputs: str, pipelined: bool) -> dict:
+    logger = Logger()
+    with Translator(logger, "Helsinki-NLP/opus-mt-en-es", "cpu") as translator, Transcriptor(logger, None, device="cpu", pipelined=pipelined) as transcriptor:
+        targets = {"en": (None, f"{outputs}.en.srt"), "es": (translator, f"{outputs}.es.srt")}
+        result = transcriptor.transcript_languages("en", wav, targets)
+    return {lang: open(path, encoding="utf-8").read() for lang, path in result.items()}
+
+def test_pipelined_and_serial_write_the_same_outputs(tiny_marian, tmp_path):
+    seed_registry(translators={"en-es": tiny_marian()}, whisper_work=16)
+    wav = make_wav(str(tmp_path / "source.wav"), seconds=90)
+    serial = transcribe(wav, str(tmp_path / "serial"), pipelined=False)
+    assert set(serial) == {"en", "es"} and all(serial.values())
+    assert transcribe(wav, str(tmp_path / "pipelined"), pipelined=True) == serial
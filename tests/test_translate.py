@@ -0,0 +1,26 @@
+import datetime
+
+import pytest
+import srt
+
+from corpus import make_srt
+from fakes import seed_registry
+from services import Logger, Translator
+
+@pytest.mark.parametrize("batched", [True, False])
+def test_translation_keeps_cue_numbers_and_timings(tiny_marian, tmp_path, batched):
+    seed_registry(translators={"en-es": tiny_marian()})
+    with open(make_srt(str(tmp_path / "generated.srt"), cues=40), encoding="utf-8") as f:
+        generated = list(srt.parse(f.read()))
+    # numbers with gaps and not starting at 1, like a cut file, and overlapping cues
+    cues = [srt.Subtitle(index=100 + i * 3, start=cue.start, end=cue.end, content=cue.content) for i, cue in enumerate(generated)]
+    cues[5].end = cues[6].start + datetime.timedelta(milliseconds=500)
+    source = tmp_path / "source.srt"
+    source.write_text(srt.compose(cues, reindex=False), encoding="utf-8")
+
+    output = tmp_path / "source.es.srt"
+    with Translator(Logger(), "Helsinki-NLP/opus-mt-en-es", "cpu") as translator:
+        translator.translate_srt_file(srt_file=str(source), output_file=str(output), batched=batched)
+    translated = list(srt.parse(output.read_text(encoding="utf-8")))
+    assert [(cue.index, cue.start, cue.end) for cue in translated] == [(cue.index, cue.start, cue.end) for cue in cues]
+    assert all(cue.content.strip() for cue in translated)
@@ -0,0 +1,42 @@
+import json
+import os
+import sentencepiece as spm
+from transformers import GenerationConfig, MarianConfig, MarianMTModel, MarianTokenizer
+
+from corpus import WORDS
+
+# build a tiny randomly initialized opus-mt like model, so benchmarks run offline
+def build(path: str, d_model: int = 64, layers: int = 2, seed: int = 0, num_beams: int = 1) -> str:
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    os.makedirs(path, exist_ok=True)
+    corpus_file = os.path.join(path, "corpus.txt")
+    with open(corpus_file, "w", encoding="utf-8") as f:
+        for i in range(2000):
+            f.write(" ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(i % 12 + 1)).capitalize() + ".\n")
+    spm.SentencePieceTrainer.train(input=corpus_file, model_prefix=os.path.join(path, "spm"), vocab_size=120,
+                                   character_coverage=1.0, model_type="unigram", minloglevel=2, bos_id=-1, eos_id=-1, unk_id=0, pad_id=-1)
+    processor = spm.SentencePieceProcessor(model_file=os.path.join(path, "spm.model"))
+    vocab = {"</s>": 0, "<unk>": 1, "<pad>": 2}
+    for i in range(processor.get_piece_size()):
+        vocab.setdefault(processor.id_to_piece(i), len(vocab))
+    vocab_file = os.path.join(path, "vocab.json")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    spm_file = os.path.join(path, "spm.model")
+    tokenizer = MarianTokenizer(source_spm=spm_file, target_spm=spm_file, vocab=vocab_file)
+    tokenizer.save_pretrained(path)
+
+    import torch
+    torch.manual_seed(seed)
+    config = MarianConfig(vocab_size=len(vocab), d_model=d_model, encoder_layers=layers, decoder_layers=layers,
+                          encoder_attention_heads=4, decoder_attention_heads=4, encoder_ffn_dim=d_model * 2,
+                          decoder_ffn_dim=d_model * 2, max_position_embeddings=256, pad_token_id=2,
+                          eos_token_id=0, decoder_start_token_id=2, forced_eos_token_id=0, max_length=64,
+                          num_beams=1, bad_words_ids=[[2]])
+    model = MarianMTModel(config)
+    # decoding settings live in generation_config.json like in the published opus-mt models
+    model.generation_config = GenerationConfig(max_length=64, num_beams=num_beams, bad_words_ids=[[2]], pad_token_id=2,
+                                               eos_token_id=0, decoder_start_token_id=2, forced_eos_token_id=0)
+    model.save_pretrained(path)
+    return path